@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Compares the time taken to evaluate a query against an in-memory table through vectorized NumPy operations
+(ColumnarTable) with that of evaluating it row by row against a list of dictionaries, either walking the query's
+fragment tree for each row or through a compiled predicate (filter_iterable()).
+
+Usage:
+    python -m benchmarks.bench_columnar [row count]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import random
+import sys
+import time
+
+import numpy as np
+
+from mlalchemy import *
+from mlalchemy.utils import like_to_regex
+
+QUERY = {
+    "from": "Document",
+    "where": {
+        "$or": [
+            {"$in": {"category": [1, 3, 5]}},
+            {"$like": {"title": "Document 1%"}, "$gt": {"score": 0.5}}
+        ]
+    },
+    "orderBy": ["-score", "id"],
+    "limit": 100
+}
+
+
+# $like pattern -> compiled regular expression
+LIKE_REGEXES = {}
+
+
+def evaluate_row(node, row):
+    if isinstance(node, MLClause):
+        value = row[node.field]
+        if value is None:
+            return False
+        if node.comp == COMP_EQ:
+            return value == node.value
+        elif node.comp == COMP_GT:
+            return value > node.value
+        elif node.comp == COMP_IN:
+            return value in node.value
+        elif node.comp == COMP_LIKE:
+            regex = LIKE_REGEXES.get(node.value)
+            if regex is None:
+                regex = LIKE_REGEXES[node.value] = like_to_regex(node.value)
+            return regex.match(value) is not None
+        raise ValueError("Comparator not supported by the row-by-row evaluator: %s" % node.comp)
+
+    results = [evaluate_row(child, row) for child in node.clauses + node.sub_fragments]
+    if node.op == OP_OR:
+        return any(results)
+    elif node.op == OP_NOT:
+        return not results[0]
+    return all(results)
+
+
+def select_rows(query, rows):
+    results = [row for row in rows if evaluate_row(query.query_fragment, row)]
+    results.sort(key=lambda row: (-row["score"], row["id"]))
+    return results[:query.limit]
+
+
+def run(rows=200000, repeat=3):
+    rng = random.Random(0)
+    data = [
+        {"id": i, "title": "Document %d" % i, "category": rng.randint(0, 9), "score": rng.random()}
+        for i in range(rows)
+    ]
+    table = ColumnarTable({
+        "id": np.array([row["id"] for row in data]),
+        "title": np.array([row["title"] for row in data]),
+        "category": np.array([row["category"] for row in data]),
+        "score": np.array([row["score"] for row in data])
+    })
+    query = parse_query(QUERY)
+
+    expected = [row["id"] for row in select_rows(query, data)]
+    if expected != list(table.query(query, fields=["id"])["id"]) or \
+            expected != [row["id"] for row in filter_iterable(query, data)]:
+        raise AssertionError("Columnar and row-by-row evaluation results differ")
+
+    modes = [
+        ("row-by-row", lambda: select_rows(query, data)),
+        ("predicate", lambda: list(filter_iterable(query, data))),
+        ("columnar", lambda: table.select(query))
+    ]
+    print("%-12s %10s %12s %14s" % ("mode", "rows", "best (s)", "rows/s"))
+    for name, fn in modes:
+        best = None
+        for _ in range(repeat):
+            started = time.time()
+            fn()
+            elapsed = time.time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        print("%-12s %10d %12.3f %14.0f" % (name, rows, best, rows / best))
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Compares the throughput of loading a large result set from an in-memory SQLite database through the ORM
+(MLQuery.to_sqlalchemy().all()) with that of loading it as Core row mappings through execute_core(), against both
+the mapped class and its underlying Table.
+
+Usage:
+    python -m benchmarks.bench_core_select [row count]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import sys
+import time
+
+from sqlalchemy import create_engine, Column, Integer, String, Text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from mlalchemy import *
+
+Base = declarative_base()
+
+
+class Document(Base):
+    __tablename__ = "documents"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String)
+    category = Column(Integer)
+    body = Column(Text)
+
+
+QUERY = """{"from": "Document", "where": {"$gte": {"category": 0}}, "orderBy": "id"}"""
+
+
+def create_session(rows):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for start in range(0, rows, 10000):
+            conn.execute(Document.__table__.insert(), [
+                {"title": "Document %d" % i, "category": i % 10, "body": "x" * 200}
+                for i in range(start, min(start + 10000, rows))
+            ])
+    return sessionmaker(bind=engine)()
+
+
+def run(rows=200000, repeat=3):
+    session = create_session(rows)
+    query = parse_json_query(QUERY)
+    modes = [
+        ("orm", lambda: query.to_sqlalchemy(session, {"Document": Document}).all()),
+        ("core (mapped)", lambda: execute_core(query, session, {"Document": Document})),
+        ("core (table)", lambda: execute_core(query, session, {"Document": Document.__table__}))
+    ]
+
+    print("%-14s %10s %12s %14s" % ("mode", "rows", "best (s)", "rows/s"))
+    for name, fn in modes:
+        best = None
+        for _ in range(repeat):
+            # start each run with an empty identity map
+            session.expunge_all()
+            started = time.time()
+            count = len(fn())
+            elapsed = time.time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        print("%-14s %10d %12.3f %14.0f" % (name, count, best, count / best))
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
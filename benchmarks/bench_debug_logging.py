@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Compares the per-call cost of debug logging in parse_query() and MLQuery.to_sqlalchemy() between the previous,
+eager approach (serializing every query to JSON regardless of whether DEBUG logging is enabled) and the current lazy
+approach.
+
+Usage:
+    python -m benchmarks.bench_debug_logging
+"""
+
+from __future__ import unicode_literals, print_function
+
+import logging
+import timeit
+
+from mlalchemy import *
+from mlalchemy.utils import json_dumps, set_debug_log_format
+
+logger = logging.getLogger("mlalchemy")
+
+
+class DiscardingHandler(logging.Handler):
+    """Formats every log record (as a real handler would), but discards the output."""
+
+    def emit(self, record):
+        self.format(record)
+
+
+def build_query(width, depth):
+    """Builds a query dictionary with a "where" tree of the given width and depth."""
+    def build_level(level):
+        if level == depth:
+            return [{"field%d" % i: "value%d" % i} for i in range(width)]
+        return [{"$or": build_level(level + 1)}, {"$gt": {"level%d" % level: level}}]
+    return {"from": "SomeTable", "where": build_level(0), "orderBy": ["-field1", "field2"]}
+
+
+def eager_parse(qd):
+    # the behaviour prior to lazy debug logging: always serialize the query
+    logging.getLogger("mlalchemy.parser").debug("Attempting to parse query dictionary:\n%s" % json_dumps(qd, indent=2))
+    query = parse_query(qd)
+    logging.getLogger("mlalchemy.structures").debug("Query:\n%s" % json_dumps(query.as_dict(), indent=2))
+    return query
+
+
+def run(number=2000):
+    qd = build_query(width=10, depth=6)
+    logger.addHandler(DiscardingHandler())
+    logger.propagate = False
+
+    results = []
+    logger.setLevel(logging.INFO)
+    results.append(("eager, DEBUG disabled", timeit.timeit(lambda: eager_parse(qd), number=number)))
+    results.append(("lazy, DEBUG disabled", timeit.timeit(lambda: parse_query(qd), number=number)))
+
+    logger.setLevel(logging.DEBUG)
+    set_debug_log_format(DEBUG_LOG_FULL)
+    results.append(("lazy, DEBUG enabled (full)", timeit.timeit(lambda: parse_query(qd), number=number)))
+    set_debug_log_format(DEBUG_LOG_SUMMARY)
+    results.append(("lazy, DEBUG enabled (summary)", timeit.timeit(lambda: parse_query(qd), number=number)))
+    set_debug_log_format(DEBUG_LOG_FULL)
+
+    for name, elapsed in results:
+        print("%-32s %8.2f us/query" % (name, (elapsed / number) * 1e6))
+
+
+if __name__ == "__main__":
+    run()
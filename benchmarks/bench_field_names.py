@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Compares the cost of normalizing typical field names through the cached normalize_field_name() with that of the
+uncached, regex-based conversion.
+
+Usage:
+    python -m benchmarks.bench_field_names
+"""
+
+from __future__ import unicode_literals, print_function
+
+import timeit
+
+from mlalchemy.utils import normalize_field_name, convert_field_name, field_name_cache
+
+FIELD_NAMES = ["id", "firstName", "last-name", "date_of_birth", "createdAt", "updated-at", "emailAddress", "status"]
+
+
+def run(number=200000):
+    for name in FIELD_NAMES:
+        normalize_field_name(name)
+    field_name_cache.reset_stats()
+
+    for label, func in [("regex", convert_field_name), ("cached", normalize_field_name)]:
+        elapsed = timeit.timeit(lambda: [func(name) for name in FIELD_NAMES], number=number)
+        print("%-8s %8.1f ns/name" % (label, (elapsed / (number * len(FIELD_NAMES))) * 1e9))
+    print("cache stats: %s" % field_name_cache.stats())
+
+
+if __name__ == "__main__":
+    run()
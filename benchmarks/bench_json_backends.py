@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Compares the installed JSON backends when parsing realistic query payloads (supplied as bytes, as received by a
+web server) and when serializing the parsed queries through their __repr__.
+
+Usage:
+    python -m benchmarks.bench_json_backends
+"""
+
+from __future__ import unicode_literals, print_function
+
+import json
+import timeit
+
+from mlalchemy import *
+from mlalchemy.utils import json_loads, available_json_backends, set_json_backend, get_json_backend
+
+PAYLOADS = {
+    "simple": {"from": "User", "where": {"lastName": "Michaels"}, "limit": 20},
+    "saved search": {
+        "from": "Document",
+        "where": [
+            {"$or": [{"status": "published"}, {"$and": [{"status": "draft"}, {"ownerId": 42}]}]},
+            {"$in": {"categoryId": list(range(50))}},
+            {"$gte": {"createdAt": "2017-01-01T00:00:00"}},
+            {"$not": {"$like": {"title": "%archived%"}}}
+        ],
+        "orderBy": ["-createdAt", "id"],
+        "select": ["id", "title", "createdAt", "ownerId"],
+        "limit": 50
+    },
+    "bulk lookup": {"from": "User", "where": {"$in": {"id": list(range(2000))}}}
+}
+
+
+def run(number=2000):
+    original_backend = get_json_backend()
+    print("%-14s %-8s %12s %12s %12s" % ("payload", "backend", "loads (us)", "parse (us)", "repr (us)"))
+    for name, qd in PAYLOADS.items():
+        content = json.dumps(qd).encode("utf-8")
+        for backend in available_json_backends():
+            set_json_backend(backend)
+            query = parse_json_query(content)
+            loads = timeit.timeit(lambda: json_loads(content), number=number)
+            parse = timeit.timeit(lambda: parse_json_query(content), number=number)
+            dumps = timeit.timeit(lambda: repr(query), number=number)
+            print("%-14s %-8s %12.2f %12.2f %12.2f" % (
+                name, backend, (loads / number) * 1e6, (parse / number) * 1e6, (dumps / number) * 1e6
+            ))
+    set_json_backend(original_backend)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Compares the size and speed of the binary MLQuery encoding (dumps_query()/loads_query()) with the JSON-based
+alternative: serializing the original query dictionary, and re-parsing it through parse_json_query().
+
+Usage:
+    python -m benchmarks.bench_serialization
+"""
+
+from __future__ import unicode_literals, print_function
+
+import timeit
+
+from mlalchemy import *
+from mlalchemy.utils import json_dumps
+
+QUERY = {
+    "from": "Document",
+    "where": [
+        {"$or": [{"status": "published"}, {"$and": [{"status": "draft"}, {"ownerId": 42}]}]},
+        {"$in": {"categoryId": list(range(50))}},
+        {"$gte": {"createdAt": "2017-01-01T00:00:00"}},
+        {"$not": {"$like": {"title": "%archived%"}}},
+        {"$or": [{"tag%d" % i: "value%d" % i} for i in range(20)]}
+    ],
+    "orderBy": ["-createdAt", "id"],
+    "select": ["id", "title", "createdAt", "ownerId"],
+    "limit": 50
+}
+
+
+def run(number=5000):
+    query = parse_query(QUERY)
+    json_data = json_dumps(QUERY).encode("utf-8")
+    binary_data = dumps_query(query)
+
+    print("%-8s %8s %14s %14s" % ("format", "bytes", "encode (us)", "decode (us)"))
+    for name, size, encode, decode in [
+        ("json", len(json_data), lambda: json_dumps(QUERY).encode("utf-8"), lambda: parse_json_query(json_data)),
+        ("binary", len(binary_data), lambda: dumps_query(query), lambda: loads_query(binary_data))
+    ]:
+        encode_time = timeit.timeit(encode, number=number)
+        decode_time = timeit.timeit(decode, number=number)
+        print("%-8s %8d %14.2f %14.2f" % (name, size, (encode_time / number) * 1e6, (decode_time / number) * 1e6))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Compares the peak memory usage (RSS) of loading a large SQLite table through MLQuery.to_sqlalchemy().all() with
+that of streaming it through stream_query() in each of its row formats. Each mode runs in its own process, so that
+peak RSS figures are independent of each other.
+
+Usage:
+    python -m benchmarks.bench_streaming [row count]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, Column, Integer, String, Text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from mlalchemy import *
+
+Base = declarative_base()
+
+
+class Document(Base):
+    __tablename__ = "documents"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String)
+    category = Column(Integer)
+    body = Column(Text)
+
+
+MODES = ["all", ROW_FORMAT_ENTITY, ROW_FORMAT_TUPLE, ROW_FORMAT_DICT]
+QUERY = """{"from": "Document", "where": {"$gte": {"category": 0}}}"""
+
+
+def create_database(path, rows):
+    engine = create_engine("sqlite:///%s" % path)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for start in range(0, rows, 10000):
+            conn.execute(Document.__table__.insert(), [
+                {"title": "Document %d" % i, "category": i % 10, "body": "x" * 200}
+                for i in range(start, min(start + 10000, rows))
+            ])
+
+
+def run_mode(path, mode):
+    session = sessionmaker(bind=create_engine("sqlite:///%s" % path))()
+    query = parse_json_query(QUERY)
+    tables = {"Document": Document}
+
+    started = time.time()
+    if mode == "all":
+        count = len(query.to_sqlalchemy(session, tables).all())
+    else:
+        fields = None if mode == ROW_FORMAT_ENTITY else ["id", "title"]
+        count = sum(1 for _ in stream_query(query, session, tables, chunk_size=1000, row_format=mode, fields=fields))
+    elapsed = time.time() - started
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    print("%-8s %8d rows %8.2fs  peak RSS %8.1f MB" % (mode, count, elapsed, peak_rss / 1024.0))
+
+
+def run(rows=200000):
+    fd, path = tempfile.mkstemp(suffix=".sqlite")
+    os.close(fd)
+    try:
+        create_database(path, rows)
+        for mode in MODES:
+            subprocess.check_call([sys.executable, "-m", "benchmarks.bench_streaming", "--mode", mode, path])
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--mode":
+        run_mode(sys.argv[3], sys.argv[2])
+    else:
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Compares the available safe YAML loaders when parsing a large saved-query document with parse_yaml_query().
+
+Usage:
+    python -m benchmarks.bench_yaml_loaders
+"""
+
+from __future__ import unicode_literals, print_function
+
+import timeit
+
+from mlalchemy import *
+
+
+def build_document(clauses=200):
+    lines = ["from: Document", "where:", "  - $or:"]
+    for i in range(clauses):
+        lines.append("      - title-%d: Document %d" % (i, i))
+        lines.append("      - $gte:")
+        lines.append("          created-at-%d: 2017-01-%02d" % (i, (i % 28) + 1))
+    lines.append("  - $in:")
+    lines.append("      category-id: [%s]" % ", ".join([str(i) for i in range(500)]))
+    lines.extend(["order-by:", "  - -created-at", "  - id", "limit: 50"])
+    return "\n".join(lines)
+
+
+def run(number=20):
+    document = build_document()
+    baseline = None
+    for loader in available_yaml_loaders():
+        elapsed = timeit.timeit(lambda: parse_yaml_query(document, loader=loader), number=number)
+        baseline = baseline or elapsed
+        print("%-22s %8.2f ms/document (%.1fx)" % (loader.__name__, (elapsed / number) * 1e3, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    run()
@@ -4,6 +4,20 @@ from mlalchemy.constants import *
 from mlalchemy.errors import *
 from mlalchemy.structures import *
 from mlalchemy.parser import *
+from mlalchemy.cache import *
+from mlalchemy.batch import *
+from mlalchemy.streaming import *
+from mlalchemy.pagination import *
+from mlalchemy.fields import *
+from mlalchemy.yaml_loaders import *
+from mlalchemy.bulk import *
+from mlalchemy.serialization import *
+from mlalchemy.results import *
+from mlalchemy.optimizer import *
+from mlalchemy.policy import *
+from mlalchemy.core import *
+from mlalchemy.columnar import *
+from mlalchemy.predicates import *
 
 
 __version__ = "0.2.2"
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Helpers for executing MLQuery objects through SQLAlchemy's AsyncSession (SQLAlchemy 1.4+).
+
+This module isn't imported by the mlalchemy package itself, as its helpers are only of use along with SQLAlchemy's
+asyncio extension and an async database driver; import them from mlalchemy.aio directly.
+"""
+
+from __future__ import unicode_literals
+
+from mlalchemy.constants import *
+from mlalchemy.errors import *
+from mlalchemy.structures import *
+from mlalchemy.fields import get_field_index
+from mlalchemy.streaming import get_column_fields
+
+__all__ = [
+    "execute_async",
+    "stream_async"
+]
+
+
+async def execute_async(query, session, tables, plan_cache=None, policy=None):
+    """Executes the given query through the given AsyncSession, loading all of its results at once.
+
+    Args:
+        query: The MLQuery to execute.
+        session: The SQLAlchemy AsyncSession through which to query the database.
+        tables: A dictionary mapping table names to their SQLAlchemy mapped classes.
+        plan_cache: An optional QueryPlanCache to use when converting the query to an SQLAlchemy statement.
+        policy: An optional QueryPolicy to enforce on the query.
+
+    Returns:
+        A list of the mapped objects matching the query. As for execute_aggregate(), counting queries return the
+        number of matching entries instead, and aggregate queries a list of read-only row mappings, mapping the names
+        of the grouped fields and aggregates to their values for each group.
+    """
+    if not isinstance(query, MLQuery):
+        raise TypeError("Only MLQuery objects can be executed")
+    statement = query.to_select(tables, plan_cache=plan_cache, policy=policy)
+    if query.count or query.is_aggregate():
+        # aggregates over all entries still produce a row if nothing matches
+        if query.matches_nothing() and (query.count or query.group_by is not None):
+            return 0 if query.count else []
+        result = await session.execute(statement)
+        return result.scalar_one() if query.count else result.mappings().all()
+    if query.matches_nothing():
+        return []
+    return (await session.scalars(statement)).all()
+
+
+async def stream_async(query, session, tables, chunk_size=1000, row_format=ROW_FORMAT_ENTITY, fields=None,
+                       chunks=False, plan_cache=None, policy=None):
+    """Executes the given query through the given AsyncSession, streaming its results from the database in chunks
+    through a server-side cursor rather than loading them all into memory at once. The asynchronous counterpart of
+    stream_query().
+
+    Args:
+        query: The MLQuery to execute.
+        session: The SQLAlchemy AsyncSession through which to query the database.
+        tables: A dictionary mapping table names to their SQLAlchemy mapped classes.
+        chunk_size: The number of rows to fetch from the database at a time.
+        row_format: The format in which to return each row: ROW_FORMAT_ENTITY (mapped objects), ROW_FORMAT_TUPLE
+            (plain tuples of column values) or ROW_FORMAT_DICT (dictionaries mapping field names to column values).
+        fields: For the tuple and dictionary row formats, an optional list of the names of the fields to return.
+            Defaults to the query's selected fields, or all of the table's mapped columns if it has none.
+        chunks: If True, lists of up to chunk_size rows are yielded instead of individual rows.
+        plan_cache: An optional QueryPlanCache to use when converting the query to an SQLAlchemy statement.
+        policy: An optional QueryPolicy to enforce on the query.
+
+    Returns:
+        An asynchronous generator yielding the query's results.
+    """
+    if not isinstance(query, MLQuery):
+        raise TypeError("Only MLQuery objects can be streamed")
+    if not isinstance(chunk_size, int) or chunk_size < 1:
+        raise ValueError("Chunk size for streaming query results must be a positive integer")
+    if row_format not in ROW_FORMATS:
+        raise ValueError("Invalid row format: %s" % row_format)
+    if query.count or query.is_aggregate():
+        raise QuerySyntaxError("Counting and aggregate queries cannot be streamed")
+
+    statement = query.to_select(tables, plan_cache=plan_cache, policy=policy)
+    if query.matches_nothing():
+        return
+    statement = statement.execution_options(yield_per=chunk_size)
+
+    if row_format == ROW_FORMAT_ENTITY:
+        result = await session.stream_scalars(statement)
+    else:
+        fields = get_column_fields(tables[query.table], fields if fields is not None else query.select)
+        index = get_field_index(tables[query.table])
+        result = await session.stream(statement.with_only_columns(*[index.resolve(field) for field in fields]))
+
+    async for partition in result.partitions(chunk_size):
+        if row_format == ROW_FORMAT_TUPLE:
+            partition = [tuple(row) for row in partition]
+        elif row_format == ROW_FORMAT_DICT:
+            partition = [dict(zip(fields, row)) for row in partition]
+
+        if chunks:
+            yield partition
+        else:
+            for row in partition:
+                yield row
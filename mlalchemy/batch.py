@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+from sqlalchemy import Integer
+from sqlalchemy.sql.expression import literal_column
+from sqlalchemy.orm import load_only
+
+from mlalchemy.constants import *
+from mlalchemy.errors import *
+from mlalchemy.structures import *
+from mlalchemy.fields import get_field_index
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "execute_batch"
+]
+
+BATCH_INDEX_LABEL = "mlalchemy_batch_index"
+# the maximum number of queries to combine into a single UNION ALL query (SQLite rejects compound SELECT statements of
+# more than 500 SELECT statements by default)
+MAX_UNION_SIZE = 500
+
+
+def execute_batch(session, tables, queries, plan_cache=None):
+    """Executes the given list of MLQuery objects against a single session, combining them into as few SQL statements
+    as possible.
+
+    Queries without any ordering, offset or limit that select the same fields from the same table are combined: pure
+    equality lookups on the same integer or (non-string) primary key field are executed as a single IN query, and the
+    remaining queries are executed as UNION ALL queries of up to MAX_UNION_SIZE queries each, with a discriminator
+    column to tell their results apart. All other queries, including those eagerly loading related entries, are
+    executed individually.
+
+    Args:
+        session: The SQLAlchemy session through which to query the database.
+        tables: A dictionary mapping table names to their SQLAlchemy mapped classes.
+        queries: A list of MLQuery objects.
+        plan_cache: An optional QueryPlanCache to use when converting individually executed queries to SQLAlchemy
+            queries.
+
+    Returns:
+        A list containing, for each query (in the same order as the supplied queries), the list of its results.
+    """
+    if not isinstance(tables, dict):
+        raise TypeError("Supplied tables structure for batch query execution must be a dictionary")
+
+    results = [None] * len(queries)
+    # (table name, selected fields) -> field name -> list of query indices
+    lookups = OrderedDict()
+    # (table name, selected fields) -> list of query indices
+    unions = OrderedDict()
+
+    for i, query in enumerate(queries):
+        if not isinstance(query, MLQuery):
+            raise TypeError("All queries in a batch must be of type MLQuery")
+        if query.table not in tables:
+            raise InvalidTableError("Table does not exist in tables dictionary: %s" % query.table)
+
+        if query.matches_nothing():
+            results[i] = []
+            continue
+
+        # related entries can't be eagerly loaded for the entries returned by a combined query
+        if len(query.order_by) > 0 or query.offset is not None or query.limit is not None or query.count or \
+                query.is_aggregate() or query.include is not None:
+            results[i] = query.to_sqlalchemy(session, tables, plan_cache=plan_cache).all()
+            continue
+
+        # only queries loading the same fields can be combined, as a combined query can only have one set of loader
+        # options
+        key = (query.table, tuple(query.select) if query.select is not None else None)
+        field = get_lookup_field(query, tables[query.table])
+        if field is not None:
+            lookups.setdefault(key, OrderedDict()).setdefault(field, []).append(i)
+        else:
+            unions.setdefault(key, []).append(i)
+
+    for key, fields in lookups.items():
+        for field, indices in fields.items():
+            if len(indices) == 1:
+                unions.setdefault(key, []).append(indices[0])
+            else:
+                execute_lookup_group(session, tables[key[0]], field, queries, indices, results)
+
+    for key, indices in unions.items():
+        for start in range(0, len(indices), MAX_UNION_SIZE):
+            execute_union_group(session, tables, queries, indices[start:start + MAX_UNION_SIZE], results)
+
+    return results
+
+
+def get_lookup_field(query, table):
+    """Checks whether the given query is a pure equality lookup on a single field, whose results can be told apart
+    from those of other lookups on the same field by comparing values in Python. Only lookups on integer fields, or
+    on primary key fields of non-string types, qualify: string comparisons performed by the database may ignore case
+    or trailing spaces depending on the column's collation, whereas Python's comparisons don't.
+
+    Returns:
+        The name of the field being looked up, or None if the query is not a pure equality lookup.
+    """
+    qf = query.query_fragment
+    if qf is None or qf.op != OP_AND or len(qf.clauses) != 1 or len(qf.sub_fragments) > 0:
+        return None
+
+    clause = qf.clauses[0]
+    if clause.comp != COMP_EQ or clause.value is None:
+        return None
+
+    index = get_field_index(table)
+    try:
+        python_type = index.python_type(clause.field)
+        is_primary_key = index.field_name(clause.field) in index.primary_key_fields
+        hash(clause.value)
+    except (InvalidFieldError, TypeError):
+        return None
+
+    # the value must be of the column's Python type, otherwise matching results to queries in Python could differ
+    # from the comparison performed by the database
+    if python_type is None or not isinstance(clause.value, python_type):
+        return None
+    if issubclass(python_type, int) or (is_primary_key and not issubclass(python_type, str)):
+        return clause.field
+    return None
+
+
+def execute_lookup_group(session, table, field, queries, indices, results):
+    fields = get_field_index(table)
+    col = fields.resolve(field)
+    indices_by_value = OrderedDict()
+    for i in indices:
+        indices_by_value.setdefault(queries[i].query_fragment.clauses[0].value, []).append(i)
+        results[i] = []
+
+    logger.debug("Executing %d lookups on %s.%s as a single query", len(indices), table, field)
+    q = session.query(table)
+    select = queries[indices[0]].select
+    if select is not None and fields.mapped:
+        # the looked up field is needed to match the results to their queries
+        q = q.options(load_only(*[fields.resolve(f) for f in select + [field]]))
+    for row in q.filter(col.in_(list(indices_by_value.keys()))):
+        for i in indices_by_value.get(getattr(row, field), []):
+            results[i].append(row)
+
+
+def execute_union_group(session, tables, queries, indices, results):
+    if len(indices) == 1:
+        results[indices[0]] = queries[indices[0]].to_sqlalchemy(session, tables).all()
+        return
+
+    # queries are deliberately not built from the plan cache here, as the names of their bind parameters would clash;
+    # sharing the list of bind parameter values between them gives each of their values a distinct name instead
+    table = queries[indices[0]].resolve_table(tables)
+    params = []
+    sub_queries = [
+        queries[i].apply_criteria(session.query(table), table, params=params).add_columns(
+            literal_column("%d" % i, Integer).label(BATCH_INDEX_LABEL)
+        )
+        for i in indices
+    ]
+    for i in indices:
+        results[i] = []
+
+    logger.debug("Executing %d queries as a single UNION ALL query", len(indices))
+    for row, i in sub_queries[0].union_all(*sub_queries[1:]):
+        results[i].append(row)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from collections import deque
+from multiprocessing import Pool
+import re
+
+import yaml
+
+from mlalchemy.errors import *
+from mlalchemy.parser import *
+from mlalchemy.utils import json_loads
+from mlalchemy.yaml_loaders import DEFAULT_YAML_LOADER
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "iter_ndjson_queries",
+    "iter_yaml_queries"
+]
+
+YAML_DOCUMENT_START_RE = re.compile(r"^---(\s|$)")
+YAML_DOCUMENT_END_RE = re.compile(r"^\.\.\.\s*$")
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_YAML = "yaml"
+
+# the errors raised by each format's loader for malformed items, which (like MLAlchemy's own errors) are reported per
+# item rather than aborting the stream; all of the JSON backends raise subclasses of ValueError
+LOADER_ERRORS = {
+    FORMAT_NDJSON: ValueError,
+    FORMAT_YAML: yaml.YAMLError
+}
+
+# the maximum number of chunks per worker process that are parsed, or waiting to be consumed, at any one time
+MAX_PENDING_CHUNKS = 2
+
+
+def iter_ndjson_queries(source, raise_errors=False, processes=None, chunk_size=100):
+    """Lazily parses queries from a newline-delimited JSON (NDJSON) stream, with one JSON query per line. Blank lines
+    are ignored.
+
+    Args:
+        source: The path to a file, or a file object (opened in text or binary mode) from which to read queries.
+        raise_errors: If False (the default), a QueryParseError is yielded in place of each query that fails to
+            parse, without aborting the stream. If True, the first QueryParseError is raised instead.
+        processes: If greater than 1, queries are parsed in chunks by a pool of this many worker processes. The
+            stream is only read up to MAX_PENDING_CHUNKS chunks per process ahead of the consumer.
+        chunk_size: The number of queries per chunk sent to each worker process.
+
+    Returns:
+        A generator yielding MLQuery objects (and QueryParseError objects, if raise_errors is False) in the order in
+        which they appear in the stream.
+    """
+    return iter_queries(iter_ndjson_items(source), FORMAT_NDJSON, None, raise_errors, processes, chunk_size)
+
+
+def iter_yaml_queries(source, loader=None, raise_errors=False, processes=None, chunk_size=100):
+    """Lazily parses queries from a multi-document YAML stream, with one query per document. Documents are separated
+    by "---" lines (and may optionally be terminated by "..." lines).
+
+    Args:
+        source: The path to a file, or a file object (opened in text or binary mode) from which to read queries.
+        loader: The YAML loader class to use (see parse_yaml_query()).
+        raise_errors: If False (the default), a QueryParseError is yielded in place of each query that fails to
+            parse, without aborting the stream. If True, the first QueryParseError is raised instead.
+        processes: If greater than 1, queries are parsed in chunks by a pool of this many worker processes. The
+            stream is only read up to MAX_PENDING_CHUNKS chunks per process ahead of the consumer.
+        chunk_size: The number of queries per chunk sent to each worker process.
+
+    Returns:
+        A generator yielding MLQuery objects (and QueryParseError objects, if raise_errors is False) in the order in
+        which they appear in the stream.
+    """
+    return iter_queries(iter_yaml_items(source), FORMAT_YAML, loader, raise_errors, processes, chunk_size)
+
+
+def iter_queries(items, fmt, loader, raise_errors, processes, chunk_size):
+    if processes is not None and processes > 1:
+        results = iter_parallel_results(items, fmt, loader, processes, chunk_size)
+    else:
+        results = (parse_item(item, fmt, loader) for item in items)
+
+    for result in results:
+        if raise_errors and isinstance(result, QueryParseError):
+            raise result
+        yield result
+
+
+def iter_parallel_results(items, fmt, loader, processes, chunk_size):
+    pool = Pool(processes)
+    try:
+        # chunks are submitted to the pool as earlier ones are consumed, rather than reading the whole stream ahead
+        pending = deque()
+        for chunk in iter_chunks(items, chunk_size):
+            if len(pending) >= MAX_PENDING_CHUNKS * processes:
+                for result in pending.popleft().get():
+                    yield result
+            pending.append(pool.apply_async(parse_chunk, ((chunk, fmt, loader),)))
+        while len(pending) > 0:
+            for result in pending.popleft().get():
+                yield result
+    finally:
+        pool.terminate()
+
+
+def iter_chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def parse_chunk(args):
+    chunk, fmt, loader = args
+    return [parse_item(item, fmt, loader) for item in chunk]
+
+
+def parse_item(item, fmt, loader):
+    index, line, content = item
+    try:
+        if fmt == FORMAT_NDJSON:
+            qd = json_loads(content)
+        else:
+            qd = yaml.load(content, Loader=loader or DEFAULT_YAML_LOADER)
+    except LOADER_ERRORS[fmt] as e:
+        return item_error(index, line, e)
+
+    try:
+        if not isinstance(qd, dict):
+            raise QuerySyntaxError("Query must be a dictionary")
+        return parse_query(qd)
+    except MLAlchemyError as e:
+        return item_error(index, line, e)
+
+
+def item_error(index, line, e):
+    logger.debug("Failed to parse query %d (line %d): %s", index, line, e)
+    return QueryParseError("Failed to parse query %d (line %d): %s" % (index, line, e), index, line)
+
+
+def open_source(source):
+    if isinstance(source, str):
+        return open(source, "rb"), True
+    return source, False
+
+
+def iter_ndjson_items(source):
+    f, close = open_source(source)
+    try:
+        index = 0
+        for line_number, line in enumerate(f, 1):
+            if len(line.strip()) > 0:
+                yield index, line_number, line
+                index += 1
+    finally:
+        if close:
+            f.close()
+
+
+def iter_yaml_items(source):
+    f, close = open_source(source)
+    try:
+        index = 0
+        lines, start, has_content = [], 1, False
+        for line_number, line in enumerate(f, 1):
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            is_start = YAML_DOCUMENT_START_RE.match(line) is not None
+            if is_start or YAML_DOCUMENT_END_RE.match(line):
+                if has_content:
+                    yield index, start, "".join(lines)
+                    index += 1
+                # content may follow the document start marker on the same line, so we keep the marker
+                lines, start = ([line], line_number) if is_start else ([], line_number + 1)
+                has_content = is_start and is_yaml_content(line[3:])
+            else:
+                lines.append(line)
+                has_content = has_content or is_yaml_content(line)
+        if has_content:
+            yield index, start, "".join(lines)
+    finally:
+        if close:
+            f.close()
+
+
+def is_yaml_content(line):
+    """Checks whether the given line of YAML is neither blank nor a comment."""
+    line = line.strip()
+    return len(line) > 0 and not line.startswith("#")
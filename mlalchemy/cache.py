@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from threading import RLock
+
+__all__ = [
+    "LRUCache",
+    "QueryPlanCache"
+]
+
+
+class LRUCache(object):
+    """A thread-safe, size-bounded, least-recently-used cache that keeps track of its hit, miss and eviction
+    counts."""
+
+    def __init__(self, max_size=128):
+        """Constructor.
+
+        Args:
+            max_size: The maximum number of entries to keep in the cache before evicting the least recently used
+                entry. Must be a positive integer.
+        """
+        if not isinstance(max_size, int) or max_size < 1:
+            raise ValueError("Maximum cache size must be a positive integer")
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Looks up the given key, marking it as the most recently used entry on success."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Adds or replaces the entry for the given key, evicting the least recently used entries if the cache is
+        full."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            self._evict()
+
+    def resize(self, max_size):
+        """Changes the maximum size of the cache, evicting the least recently used entries if necessary."""
+        if not isinstance(max_size, int) or max_size < 1:
+            raise ValueError("Maximum cache size must be a positive integer")
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def clear(self):
+        """Removes all entries from the cache, without resetting its statistics."""
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Returns a dictionary containing the current size of the cache and its hit/miss/eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (float(self.hits) / lookups) if lookups > 0 else 0.0
+            }
+
+
+class QueryPlanCache(LRUCache):
+    """Caches compiled SQLAlchemy filter and ordering criteria, keyed on the structure of an MLQuery (table, operators,
+    fields, comparators and ordering) rather than on its values. Pass an instance of this class to
+    MLQuery.to_sqlalchemy() to reuse the compiled criteria for all queries sharing the same shape, only filling in
+    the values as bind parameters."""
+    pass
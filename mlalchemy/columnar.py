@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from datetime import date, datetime
+
+from mlalchemy.constants import *
+from mlalchemy.errors import *
+from mlalchemy.structures import *
+from mlalchemy.utils import normalize_field_name, like_to_regex
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "ColumnarTable",
+    "query_columns"
+]
+
+
+class ColumnarTable(object):
+    """An in-memory snapshot of a table stored as one array per column, against which MLQuery objects can be
+    evaluated through vectorized operations instead of a database. Requires NumPy.
+
+    Queries are evaluated with SQL's three-valued logic, so that they match the same entries as they would in the
+    database: None (in object arrays), NaN and NaT values are treated as NULLs, comparisons against which are
+    neither true nor false. NULLs are sorted before all other values, as in SQLite and MySQL. Clauses comparing
+    against None are evaluated as IS NULL/IS NOT NULL checks, and empty $in lists as always false criteria (even for
+    NULLs), as SQLAlchemy renders them. Comparisons between incompatible types raise InvalidComparatorError.
+    """
+
+    __slots__ = ("columns", "length", "_null_masks")
+
+    def __init__(self, columns):
+        """Constructor.
+
+        Args:
+            columns: A dictionary mapping field names (in snake_case, camelCase or kebab-case) to equally long
+                one-dimensional arrays (or sequences) of column values, or a pandas DataFrame.
+        """
+        if np is None:
+            raise ImportError("NumPy is required for evaluating queries against columnar data")
+        if hasattr(columns, "to_numpy") and hasattr(columns, "columns"):
+            # pandas DataFrame
+            columns = dict([(name, columns[name].to_numpy()) for name in columns.columns])
+        if not isinstance(columns, dict):
+            raise TypeError("Columns must be supplied as a dictionary of arrays or a DataFrame")
+
+        self.columns = {}
+        self.length = None
+        for name, values in columns.items():
+            values = np.asarray(values)
+            if values.ndim != 1:
+                raise ValueError("Columns must be one-dimensional arrays: %s" % name)
+            if self.length is not None and len(values) != self.length:
+                raise ValueError("All columns must have the same length")
+            self.length = len(values)
+            self.columns[normalize_field_name(name)] = values
+        self.length = self.length or 0
+        # field name -> mask of the entries whose value for the field is NULL
+        self._null_masks = {}
+
+    def __len__(self):
+        return self.length
+
+    def column(self, field):
+        try:
+            return self.columns[normalize_field_name(field)]
+        except KeyError:
+            raise InvalidFieldError("Invalid field for specified columns: %s" % field)
+
+    def null_mask(self, field):
+        """Returns the (cached) mask of the entries whose value for the given field is NULL."""
+        mask = self._null_masks.get(field)
+        if mask is None:
+            col = self.column(field)
+            if col.dtype.kind == "O":
+                mask = np.equal(col, None)
+                # NaN values in object arrays are the only values that aren't equal to themselves
+                mask |= np.not_equal(col, col)
+            elif col.dtype.kind in "fc":
+                mask = np.isnan(col)
+            elif col.dtype.kind in "mM":
+                mask = np.isnat(col)
+            else:
+                mask = np.zeros(self.length, dtype=bool)
+            self._null_masks[field] = mask
+        return mask
+
+    def mask(self, fragment):
+        """Computes the boolean mask of the entries matched by the given MLQueryFragment (or MLClause)."""
+        return self.evaluate(fragment)[0]
+
+    def evaluate(self, node):
+        """Evaluates the given fragment or clause, returning a tuple containing the masks of the entries for which it
+        is true and of those for which it is false (the remaining entries evaluate to NULL)."""
+        if isinstance(node, MLClause):
+            return self.evaluate_clause(node)
+
+        results = [self.evaluate_clause(clause) for clause in node.clauses]
+        results.extend([self.evaluate(sub_frag) for sub_frag in node.sub_fragments])
+        if node.op == OP_NOT:
+            # NOT applies to the conjunction of its children
+            is_true, is_false = combine(OP_AND, results, self.length)
+            return is_false, is_true
+        return combine(node.op, results, self.length)
+
+    def evaluate_clause(self, clause):
+        col = self.column(clause.field)
+        nulls = self.null_mask(clause.field)
+        comp, value = clause.comp, clause.value
+
+        if clause.uses_is_operator():
+            if value is None:
+                is_true = nulls.copy()
+            else:
+                is_true = compare(col, nulls, COMP_EQ, value)
+            return (~is_true, is_true) if comp == COMP_NEQ else (is_true, ~is_true)
+
+        if comp in {COMP_IN, COMP_NIN}:
+            values = list(value) if isinstance(value, (list, tuple, set, frozenset)) else [value]
+            is_true = isin(col, nulls, [v for v in values if v is not None])
+            if len(values) == 0:
+                # SQLAlchemy renders empty IN lists as an always false criterion, even for NULLs
+                is_false = np.ones(self.length, dtype=bool)
+            elif None not in values:
+                is_false = ~nulls & ~is_true
+            else:
+                # x IN (..., NULL) is NULL rather than false if x doesn't match any of the other values
+                is_false = np.zeros(self.length, dtype=bool)
+            return (is_false, is_true) if comp == COMP_NIN else (is_true, is_false)
+
+        is_true = compare(col, nulls, comp, value)
+        return is_true, ~nulls & ~is_true
+
+    def select(self, query):
+        """Returns the array of the indices of the entries returned by the given query, in the query's order and
+        taking its offset and limit into account."""
+        if not isinstance(query, MLQuery):
+            raise TypeError("Only MLQuery objects can be evaluated against columnar data")
+        if query.count or query.is_aggregate() or query.after is not None:
+            raise QuerySyntaxError("Only ordered, offset and limited queries can be evaluated against columnar data")
+
+        if query.query_fragment is None:
+            indices = np.arange(self.length)
+        else:
+            indices = np.flatnonzero(self.mask(query.query_fragment))
+
+        if len(query.order_by) > 0 and len(indices) > 1:
+            # np.lexsort sorts by its last key first, and is stable, so that ties keep their original order
+            keys = [self.sort_key(list(ob.keys())[0], list(ob.values())[0], indices) for ob in query.order_by]
+            indices = indices[np.lexsort(keys[::-1])]
+
+        start = query.offset or 0
+        end = start + query.limit if query.limit is not None else None
+        return indices[start:end]
+
+    def sort_key(self, field, direction, indices):
+        """Computes an integer sort key for the given field's values at the given indices, in which NULLs come
+        first."""
+        col = self.column(field)[indices]
+        nulls = self.null_mask(field)[indices]
+        ranks = np.full(len(indices), -1, dtype=np.int64)
+        if not nulls.all():
+            ranks[~nulls] = np.unique(col[~nulls], return_inverse=True)[1].reshape(-1)
+        return -ranks if direction == ORDER_DESC else ranks
+
+    def query(self, query, fields=None):
+        """Evaluates the given query, returning a dictionary mapping field names to the arrays of the returned
+        entries' values.
+
+        Args:
+            query: The MLQuery to evaluate.
+            fields: An optional list of the names of the fields to return. Defaults to the query's selected fields,
+                or all of the columns if it has none.
+        """
+        indices = self.select(query)
+        if fields is None:
+            fields = query.select if query.select is not None else list(self.columns.keys())
+        return dict([(normalize_field_name(field), self.column(field)[indices]) for field in fields])
+
+
+def query_columns(query, columns, fields=None):
+    """Evaluates the given query against the given columns, without a database.
+
+    Args:
+        query: The MLQuery to evaluate.
+        columns: A ColumnarTable, a dictionary mapping field names to arrays of column values, or a pandas
+            DataFrame. To evaluate several queries against the same columns, wrap them in a ColumnarTable once, so
+            that they needn't be converted and that their NULL masks are computed only once.
+        fields: An optional list of the names of the fields to return, as for ColumnarTable.query().
+
+    Returns:
+        A dictionary mapping field names to NumPy arrays of the returned entries' values.
+    """
+    if not isinstance(columns, ColumnarTable):
+        columns = ColumnarTable(columns)
+    return columns.query(query, fields=fields)
+
+
+def combine(op, results, length):
+    if len(results) == 0:
+        # empty AND/OR fragments are always true/false respectively
+        all_true, all_false = np.ones(length, dtype=bool), np.zeros(length, dtype=bool)
+        return (all_false, all_true) if op == OP_OR else (all_true, all_false)
+
+    is_true, is_false = results[0]
+    for other_true, other_false in results[1:]:
+        if op == OP_OR:
+            is_true, is_false = is_true | other_true, is_false & other_false
+        else:
+            is_true, is_false = is_true & other_true, is_false | other_false
+    return is_true, is_false
+
+
+def coerce_value(col, value):
+    if col.dtype.kind == "M" and isinstance(value, (date, datetime, str)):
+        return np.datetime64(value)
+    return value
+
+
+def compare(col, nulls, comp, value):
+    """Compares the non-NULL values of the given column against the given value, returning the mask of the entries
+    for which the comparison is true."""
+    result = np.zeros(len(col), dtype=bool)
+    has_nulls = nulls.any()
+    values = col[~nulls] if has_nulls else col
+    try:
+        if comp == COMP_LIKE:
+            matches = like_matches(values, value)
+        else:
+            value = coerce_value(col, value)
+            if comp == COMP_EQ or comp == COMP_IS:
+                matches = values == value
+            elif comp == COMP_NEQ:
+                matches = values != value
+            elif comp == COMP_GT:
+                matches = values > value
+            elif comp == COMP_GTE:
+                matches = values >= value
+            elif comp == COMP_LT:
+                matches = values < value
+            elif comp == COMP_LTE:
+                matches = values <= value
+            else:
+                raise InvalidComparatorError("Unsupported comparator for columnar data: %s" % comp)
+    except (TypeError, ValueError):
+        # e.g. ordering comparisons between strings and numbers
+        raise InvalidComparatorError("Cannot compare values of type %s using %s: %r" % (col.dtype, comp, value))
+    matches = np.asarray(matches, dtype=bool)
+    if has_nulls:
+        result[~nulls] = matches
+    else:
+        result |= matches
+    return result
+
+
+def like_matches(values, pattern):
+    if not isinstance(pattern, str):
+        raise TypeError("$like patterns must be strings")
+    wildcards = [i for i, c in enumerate(pattern) if c in "%_"]
+    if values.dtype.kind == "U":
+        # patterns with a single trailing or leading "%" can be matched through NumPy's string functions
+        if wildcards == [len(pattern) - 1] and pattern.endswith("%"):
+            return np.char.startswith(values, pattern[:-1])
+        elif wildcards == [0] and pattern.startswith("%"):
+            return np.char.endswith(values, pattern[1:])
+        elif len(wildcards) == 0:
+            return values == pattern
+    regex = like_to_regex(pattern)
+    match = np.frompyfunc(lambda v: isinstance(v, str) and regex.match(v) is not None, 1, 1)
+    return match(values).astype(bool)
+
+
+def isin(col, nulls, values):
+    result = np.zeros(len(col), dtype=bool)
+    if len(values) == 0:
+        return result
+    values = [coerce_value(col, value) for value in values]
+    if col.dtype.kind == "O":
+        # object arrays can't be sorted if they mix types, so look each value up in a set instead
+        lookup = set(values)
+        contains = np.frompyfunc(lambda v: v in lookup, 1, 1)
+        result[~nulls] = contains(col[~nulls]).astype(bool)
+    else:
+        result[~nulls] = np.isin(col[~nulls], values)
+    return result
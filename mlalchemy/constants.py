@@ -20,7 +20,32 @@ __all__ = [
     "COMPARATORS",
     "ORDER_ASC",
     "ORDER_DESC",
-    "QUERY_ORDERS"
+    "QUERY_ORDERS",
+    "DEBUG_LOG_FULL",
+    "DEBUG_LOG_SUMMARY",
+    "DEBUG_LOG_FORMATS",
+    "ROW_FORMAT_ENTITY",
+    "ROW_FORMAT_TUPLE",
+    "ROW_FORMAT_DICT",
+    "ROW_FORMATS",
+    "JSON_BACKEND_STDLIB",
+    "JSON_BACKEND_UJSON",
+    "JSON_BACKEND_ORJSON",
+    "JSON_BACKENDS",
+    "POLICY_ALLOW",
+    "POLICY_WARN",
+    "POLICY_REJECT",
+    "POLICY_ACTIONS",
+    "LOAD_SELECTIN",
+    "LOAD_JOINED",
+    "LOAD_STRATEGIES",
+    "AGG_COUNT",
+    "AGG_SUM",
+    "AGG_AVG",
+    "AGG_MIN",
+    "AGG_MAX",
+    "AGGREGATES",
+    "COUNT_ALL"
 ]
 
 
@@ -47,3 +72,41 @@ COMPARATORS = {COMP_EQ, COMP_GT, COMP_GTE, COMP_LT, COMP_LTE, COMP_NEQ, COMP_LIK
 ORDER_ASC = "asc"
 ORDER_DESC = "desc"
 QUERY_ORDERS = {ORDER_ASC, ORDER_DESC}
+
+# How queries are rendered in debug log messages
+DEBUG_LOG_FULL = "full"
+DEBUG_LOG_SUMMARY = "summary"
+DEBUG_LOG_FORMATS = {DEBUG_LOG_FULL, DEBUG_LOG_SUMMARY}
+
+# Formats in which streamed query results can be returned
+ROW_FORMAT_ENTITY = "entity"
+ROW_FORMAT_TUPLE = "tuple"
+ROW_FORMAT_DICT = "dict"
+ROW_FORMATS = {ROW_FORMAT_ENTITY, ROW_FORMAT_TUPLE, ROW_FORMAT_DICT}
+
+# Supported JSON encoding/decoding backends, in order of preference
+JSON_BACKEND_ORJSON = "orjson"
+JSON_BACKEND_UJSON = "ujson"
+JSON_BACKEND_STDLIB = "json"
+JSON_BACKENDS = [JSON_BACKEND_ORJSON, JSON_BACKEND_UJSON, JSON_BACKEND_STDLIB]
+
+# How query policies treat queries that would filter or sort on unindexed columns
+POLICY_ALLOW = "allow"
+POLICY_WARN = "warn"
+POLICY_REJECT = "reject"
+POLICY_ACTIONS = {POLICY_ALLOW, POLICY_WARN, POLICY_REJECT}
+
+# Eager loading strategies for related entries requested through a query's "include" key
+LOAD_SELECTIN = "selectin"
+LOAD_JOINED = "joined"
+LOAD_STRATEGIES = {LOAD_SELECTIN, LOAD_JOINED}
+
+# Aggregate functions
+AGG_COUNT = "$count"
+AGG_SUM = "$sum"
+AGG_AVG = "$avg"
+AGG_MIN = "$min"
+AGG_MAX = "$max"
+AGGREGATES = {AGG_COUNT, AGG_SUM, AGG_AVG, AGG_MIN, AGG_MAX}
+# The "field" to count to count all entries (COUNT(*)), rather than the entries for which a field is not NULL
+COUNT_ALL = "*"
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from mlalchemy.errors import *
+from mlalchemy.structures import *
+
+__all__ = [
+    "execute_core",
+    "execute_aggregate",
+    "count_results"
+]
+
+
+def execute_core(query, connection, tables, fields=None, plan_cache=None, policy=None):
+    """Executes the given query as a Core select() statement, bypassing the ORM's identity map and object
+    construction, which makes it considerably cheaper for read-only access to large result sets.
+
+    Args:
+        query: The MLQuery to execute.
+        connection: The SQLAlchemy Connection or Session through which to execute the statement.
+        tables: A dictionary mapping table names to their SQLAlchemy mapped classes or Table objects.
+        fields: An optional list of the names of the fields to return. Defaults to the query's selected fields, or
+            all of the table's columns if it has none.
+        plan_cache: An optional QueryPlanCache to use when converting the query to an SQLAlchemy statement.
+        policy: An optional QueryPolicy to enforce on the query.
+
+    Returns:
+        A list of read-only row mappings, mapping field names to column values.
+    """
+    if not isinstance(query, MLQuery):
+        raise TypeError("Only MLQuery objects can be executed")
+    statement = query.to_core_select(tables, fields=fields, plan_cache=plan_cache, policy=policy)
+    if query.matches_nothing():
+        return []
+    return connection.execute(statement).mappings().all()
+
+
+def execute_aggregate(query, connection, tables, plan_cache=None, policy=None):
+    """Executes the given counting or aggregate query in the database, so that only the aggregated results need to be
+    transferred.
+
+    Args:
+        query: The MLQuery to execute, which must either be a counting query or group or aggregate entries.
+        connection: The SQLAlchemy Connection or Session through which to execute the statement.
+        tables: A dictionary mapping table names to their SQLAlchemy mapped classes or Table objects.
+        plan_cache: An optional QueryPlanCache to use when converting the query to an SQLAlchemy statement.
+        policy: An optional QueryPolicy to enforce on the query.
+
+    Returns:
+        For counting queries, the number of entries matching the query. Otherwise a list of read-only row mappings,
+        mapping the names of the grouped fields and aggregates to their values for each group.
+    """
+    if not isinstance(query, MLQuery):
+        raise TypeError("Only MLQuery objects can be executed")
+    if not query.count and not query.is_aggregate():
+        raise QuerySyntaxError("Query neither counts, groups nor aggregates entries")
+    statement = query.to_core_select(tables, plan_cache=plan_cache, policy=policy)
+    # aggregates over all entries still produce a row if nothing matches
+    if query.matches_nothing() and (query.count or query.group_by is not None):
+        return 0 if query.count else []
+    if query.count:
+        return connection.execute(statement).scalar()
+    return connection.execute(statement).mappings().all()
+
+
+def count_results(query, connection, tables, plan_cache=None, policy=None):
+    """Counts the entries matching the given query's "where" clause in the database, ignoring its ordering, offset,
+    limit and pagination cursor (e.g. to compute the total number of pages of a paginated query).
+
+    Args:
+        query: The MLQuery whose matching entries to count.
+        connection: The SQLAlchemy Connection or Session through which to execute the statement.
+        tables: A dictionary mapping table names to their SQLAlchemy mapped classes or Table objects.
+        plan_cache: An optional QueryPlanCache to use when converting the query to an SQLAlchemy statement.
+        policy: An optional QueryPolicy to enforce on the query.
+
+    Returns:
+        The number of matching entries.
+    """
+    if not isinstance(query, MLQuery):
+        raise TypeError("Only MLQuery objects can be executed")
+    return execute_aggregate(query.counting(), connection, tables, plan_cache=plan_cache, policy=policy)
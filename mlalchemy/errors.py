@@ -8,7 +8,11 @@ __all__ = [
     "InvalidComparatorError",
     "QuerySyntaxError",
     "InvalidTableError",
-    "InvalidFieldError"
+    "InvalidFieldError",
+    "InvalidCursorError",
+    "QueryParseError",
+    "SerializationError",
+    "QueryPolicyError"
 ]
 
 
@@ -34,3 +38,28 @@ class InvalidTableError(MLAlchemyError):
 
 class InvalidFieldError(MLAlchemyError):
     pass
+
+
+class InvalidCursorError(MLAlchemyError):
+    pass
+
+
+class SerializationError(MLAlchemyError):
+    pass
+
+
+class QueryPolicyError(MLAlchemyError):
+    pass
+
+
+class QueryParseError(MLAlchemyError):
+    """Raised (or yielded) when one of the queries in a bulk query stream fails to parse."""
+
+    def __init__(self, message, index=None, line=None):
+        super(QueryParseError, self).__init__(message, index, line)
+        self.message = message
+        self.index = index
+        self.line = line
+
+    def __str__(self):
+        return self.message
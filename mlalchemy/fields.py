@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+from threading import Lock
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event, inspect, Table, UniqueConstraint
+from sqlalchemy.exc import NoInspectionAvailable
+from sqlalchemy.orm import Mapper
+from sqlalchemy.ext.hybrid import hybrid_method
+
+from mlalchemy.errors import *
+from mlalchemy.utils import field_name_cache, convert_field_name
+
+__all__ = [
+    "FieldIndex",
+    "RelationshipInfo",
+    "get_field_index",
+    "resolve_field_path",
+    "resolve_relationship_path",
+    "clear_field_indices",
+    "prime_field_name_cache"
+]
+
+
+# key: the name of the relationship attribute; attr: the attribute itself; target: the related mapped class;
+# uselist: whether the relationship refers to a collection of related entries
+RelationshipInfo = namedtuple("RelationshipInfo", ["key", "attr", "target", "uselist"])
+
+
+def field_aliases(key):
+    """Returns the camelCase and kebab-case aliases of the given snake_case name."""
+    parts = key.split("_")
+    return [
+        alias for alias in [parts[0] + "".join([part.capitalize() for part in parts[1:]]), "-".join(parts)]
+        if alias != key
+    ]
+
+
+class FieldIndex(object):
+    """Precomputed index of the columns of a mapped class or Core table, allowing for constant-time resolution of field
+    names (in snake_case, or their camelCase or kebab-case aliases) to column attributes and their Python types, and
+    of which of these columns are indexed. For mapped classes, the relationships to other mapped classes are indexed
+    as well, as are the names of their other attributes usable in queries (e.g. synonyms and hybrid properties), which
+    are only resolved when they're first used."""
+
+    __slots__ = ("table", "mapped", "core_table", "field_names", "columns", "aliases", "python_types", "index_keys",
+                 "indexed_fields", "primary_key_fields", "relationships", "relationship_aliases", "descriptor_names")
+
+    def __init__(self, table):
+        """Constructor.
+
+        Args:
+            table: The SQLAlchemy mapped class or Table to index.
+        """
+        if isinstance(table, Table):
+            # (field name, column attribute, underlying columns) for each of the table's columns
+            attrs = [(col.key, col, [col]) for col in table.columns]
+            tables = [table]
+            primary_key = list(table.primary_key.columns)
+            core_table = table
+            relationships = []
+            descriptor_names = []
+        else:
+            try:
+                mapper = inspect(table)
+            except NoInspectionAvailable:
+                mapper = None
+            if not isinstance(mapper, Mapper):
+                raise InvalidTableError("Not a mapped class or table: %s" % table)
+            attrs = [(prop.key, getattr(table, prop.key), prop.columns) for prop in mapper.column_attrs]
+            tables = mapper.tables
+            primary_key = list(mapper.primary_key)
+            relationships = [
+                RelationshipInfo(prop.key, getattr(table, prop.key), prop.mapper.class_, prop.uselist)
+                for prop in mapper.relationships
+            ]
+            # synonyms, hybrid properties and the like, which aren't column attributes themselves (hybrid methods need
+            # arguments, so they can't be compared against values)
+            descriptor_names = [
+                key for key, desc in mapper.all_orm_descriptors.items()
+                if key not in mapper.column_attrs and key not in mapper.relationships and
+                not isinstance(desc, hybrid_method)
+            ]
+            core_table = mapper.persist_selectable
+            # the mapped class can only be substituted by its table in Core statements if each of its attributes maps
+            # to the table's column of the same name
+            if not isinstance(core_table, Table) or \
+                    any([len(cols) != 1 or cols[0].table is not core_table or cols[0].key != key
+                         for key, attr, cols in attrs]):
+                core_table = None
+
+        self.table = table
+        self.mapped = not isinstance(table, Table)
+        # the Table equivalent to the mapped class in Core statements, if any
+        self.core_table = core_table
+        self.field_names = tuple([key for key, attr, cols in attrs])
+        self.columns = {}
+        self.aliases = {}
+        self.python_types = {}
+
+        column_keys = {}
+        for key, attr, cols in attrs:
+            for col in cols:
+                column_keys.setdefault(col, key)
+
+        keys = []
+        for t in tables:
+            keys.append(list(t.primary_key.columns))
+            keys.extend([list(idx.columns) for idx in t.indexes])
+            keys.extend([list(c.columns) for c in t.constraints if isinstance(c, UniqueConstraint)])
+        # the (ordered) field names of the columns of each index, unique constraint and the primary key
+        self.index_keys = tuple(set([
+            tuple([column_keys[col] for col in key]) for key in keys
+            if len(key) > 0 and all([col in column_keys for col in key])
+        ]))
+        # only the leading column of a composite index can be used to look up entries by that column alone
+        self.indexed_fields = frozenset([key[0] for key in self.index_keys])
+        # the field names of the primary key columns, which uniquely identify each entry
+        self.primary_key_fields = tuple([column_keys[col] for col in primary_key if col in column_keys])
+
+        for key, attr, cols in attrs:
+            self.columns[key] = attr
+            try:
+                self.python_types[key] = cols[0].type.python_type
+            except (AttributeError, NotImplementedError):
+                self.python_types[key] = None
+
+            for alias in field_aliases(key):
+                self.aliases[alias] = key
+
+        self.descriptor_names = frozenset(descriptor_names)
+        for key in self.descriptor_names:
+            for alias in field_aliases(key):
+                self.aliases.setdefault(alias, key)
+
+        self.relationships = {}
+        self.relationship_aliases = {}
+        for rel in relationships:
+            self.relationships[rel.key] = rel
+            for alias in field_aliases(rel.key):
+                self.relationship_aliases[alias] = rel.key
+
+    def __contains__(self, field):
+        return field in self.columns or field in self.aliases or field in self.descriptor_names
+
+    def field_name(self, field):
+        """Resolves the given field name or alias to the name of the corresponding column attribute (or other
+        attribute of the mapped class)."""
+        if field in self.columns or field in self.descriptor_names:
+            return field
+        try:
+            return self.aliases[field]
+        except KeyError:
+            raise InvalidFieldError("Invalid field for specified table: %s" % field)
+
+    def resolve(self, field):
+        """Resolves the given field name or alias to the corresponding column attribute of the mapped class (or
+        column of the table)."""
+        try:
+            return self.columns[field]
+        except KeyError:
+            pass
+        name = self.field_name(field)
+        if name in self.columns:
+            return self.columns[name]
+        return getattr(self.table, name)
+
+    def relationship(self, name):
+        """Resolves the given relationship name or alias to the RelationshipInfo describing the relationship."""
+        try:
+            return self.relationships[name]
+        except KeyError:
+            pass
+        try:
+            return self.relationships[self.relationship_aliases[name]]
+        except KeyError:
+            raise InvalidFieldError("Invalid relationship for specified table: %s" % name)
+
+    def python_type(self, field):
+        """Returns the Python type of the values of the given field, or None if it cannot be determined."""
+        return self.python_types.get(self.field_name(field))
+
+    def is_indexed(self, field):
+        """Whether the given field's column is the primary key, or the leading column of an index or unique
+        constraint, of the mapped table."""
+        return self.field_name(field) in self.indexed_fields
+
+    def indexed_subset(self, fields):
+        """Returns the subset of the given fields whose columns can be used for index lookups when filtering on all
+        of the given fields at once, i.e. those covered by a prefix of an index's columns that are all filtered on.
+        """
+        fields = set([self.field_name(field) for field in fields])
+        covered = set()
+        for key in self.index_keys:
+            for field in key:
+                if field not in fields:
+                    break
+                covered.add(field)
+        return covered
+
+
+_field_indices = WeakKeyDictionary()
+_field_indices_lock = Lock()
+
+
+def get_field_index(table):
+    """Returns the FieldIndex for the given mapped class or table, building it on first use."""
+    try:
+        return _field_indices[table]
+    except KeyError:
+        pass
+
+    index = FieldIndex(table)
+    with _field_indices_lock:
+        _field_indices[table] = index
+    return index
+
+
+def resolve_field_path(table, field):
+    """Resolves the given field name, which may be a dotted path traversing relationships (e.g. "author.last_name"),
+    against the given mapped class or table.
+
+    Returns:
+        A tuple containing the list of RelationshipInfo objects for the relationships traversed, the FieldIndex of
+        the table on which the field itself resides, and the (normalized) name of the field.
+    """
+    index = get_field_index(table)
+    if "." not in field:
+        return [], index, index.field_name(field)
+
+    relationships = []
+    parts = field.split(".")
+    for part in parts[:-1]:
+        rel = index.relationship(part)
+        relationships.append(rel)
+        index = get_field_index(rel.target)
+    return relationships, index, index.field_name(parts[-1])
+
+
+def resolve_relationship_path(table, path):
+    """Resolves the given dotted path of relationship names against the given mapped class, returning the list of
+    RelationshipInfo objects for the relationships traversed."""
+    index = get_field_index(table)
+    relationships = []
+    for part in path.split("."):
+        rel = index.relationship(part)
+        relationships.append(rel)
+        index = get_field_index(rel.target)
+    return relationships
+
+
+@event.listens_for(Mapper, "after_configured")
+def clear_field_indices():
+    """Discards all cached field indices, so that they are rebuilt from the current mapper configuration. Called
+    automatically whenever new mappers are configured."""
+    with _field_indices_lock:
+        _field_indices.clear()
+
+
+def prime_field_name_cache(tables):
+    """Pre-populates the field name normalization cache with the names and camelCase/kebab-case aliases of all of the
+    columns of the given tables, so that normalizing these field names is a dictionary lookup from the outset.
+
+    Args:
+        tables: A dictionary mapping table names to their SQLAlchemy mapped classes.
+    """
+    for table in tables.values():
+        index = get_field_index(table)
+        for field, name in list(index.aliases.items()) + [(name, name) for name in index.columns]:
+            # only cache aliases that would be normalized to the same name anyway
+            if convert_field_name(field) == name:
+                field_name_cache.put(field, name)
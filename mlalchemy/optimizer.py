@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from datetime import date, datetime
+from numbers import Real
+
+from mlalchemy.constants import *
+from mlalchemy.errors import *
+from mlalchemy.structures import *
+from mlalchemy.structures import canonical_value
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "optimize_query",
+    "optimize_fragment"
+]
+
+# results of optimizing fragments whose outcome is known without consulting the database
+ALWAYS_TRUE = "always_true"
+ALWAYS_FALSE = "always_false"
+
+# the comparators equivalent to the negation of each comparator (taking SQL's handling of NULLs into account)
+INVERTED_COMPARATORS = {
+    COMP_EQ: COMP_NEQ,
+    COMP_NEQ: COMP_EQ,
+    COMP_GT: COMP_LTE,
+    COMP_GTE: COMP_LT,
+    COMP_LT: COMP_GTE,
+    COMP_LTE: COMP_GT,
+    COMP_IN: COMP_NIN,
+    COMP_NIN: COMP_IN
+}
+
+RANGE_COMPARATORS = {COMP_GT, COMP_GTE, COMP_LT, COMP_LTE}
+
+
+def optimize_query(query):
+    """Rewrites the given query's criteria into a smaller, equivalent form, by applying the rules described in
+    optimize_fragment(). Contradictory criteria are replaced by an empty OR fragment, for which
+    MLQuery.matches_nothing() returns True, so that the query need not be executed at all.
+
+    Args:
+        query: The MLQuery to optimize.
+
+    Returns:
+        The optimized MLQuery. If nothing could be optimized, the query itself is returned.
+    """
+    if not isinstance(query, MLQuery):
+        raise TypeError("Only MLQuery objects can be optimized")
+    if query.query_fragment is None:
+        return query
+
+    qf = optimize_fragment(query.query_fragment)
+    if qf is query.query_fragment:
+        return query
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Optimized query on \"%s\" from %d to %d nodes", query.table, query.query_fragment.tree_size()[0],
+            qf.tree_size()[0] if qf is not None else 0
+        )
+    return query.with_fragment(qf)
+
+
+def optimize_fragment(fragment):
+    """Rewrites the given query fragment into a smaller, equivalent form by:
+
+    * flattening nested AND/OR fragments with the same operator, and removing duplicate clauses and sub-fragments;
+    * removing double negations, and negating single clauses through their comparator (e.g. NOT x > 1 => x <= 1);
+    * combining OR-ed equality and IN clauses on the same field into a single IN clause;
+    * merging AND-ed range, equality and IN clauses on the same numeric or date/time field into the tightest
+      equivalent bounds or set of values;
+    * folding contradictions (e.g. x = 1 AND x = 2, or x > 5 AND x < 3) into an empty OR fragment, which matches
+      nothing, and tautologies into None.
+
+    Contradictions are only folded outside of NOT fragments: they're NULL rather than false for entries whose fields
+    are NULL, so their negation isn't true for those entries either.
+
+    Comparisons between string values aren't reasoned about, as their outcome depends on the database's collation.
+    Clauses on the fields of related entries (dotted paths) are only deduplicated and combined into IN clauses, as
+    AND-ed clauses on them may be matched by different related entries.
+
+    Args:
+        fragment: The MLQueryFragment to optimize.
+
+    Returns:
+        The optimized MLQueryFragment (the fragment itself if nothing could be optimized), or None if the fragment
+        matches all entries.
+    """
+    if not isinstance(fragment, MLQueryFragment):
+        raise TypeError("Only MLQueryFragment objects can be optimized")
+
+    result = optimize_node(fragment)
+    if result == ALWAYS_TRUE:
+        return None
+    elif result == ALWAYS_FALSE:
+        return MLQueryFragment._from_parts(OP_OR, [], [])
+    elif isinstance(result, MLClause):
+        if fragment.op == OP_AND and fragment.clauses == [result] and result is fragment.clauses[0]:
+            return fragment
+        return MLQueryFragment._from_parts(OP_AND, [result], [])
+    return result
+
+
+def optimize_node(node, negated=False):
+    """Optimizes the given clause or fragment, returning an MLClause, an MLQueryFragment, ALWAYS_TRUE or
+    ALWAYS_FALSE. If negated is True, the node is within a NOT fragment, so that contradictions mustn't be folded."""
+    if isinstance(node, MLClause):
+        return optimize_clause(node)
+    if node.op == OP_NOT:
+        return optimize_not(node)
+    return optimize_junction(node, negated=negated)
+
+
+def optimize_clause(clause):
+    if clause.comp in {COMP_IN, COMP_NIN} and isinstance(clause.value, list):
+        values = unique_values(clause.value)
+        if len(values) == 0:
+            # nothing is IN an empty list, and everything is NOT IN it
+            return ALWAYS_FALSE if clause.comp == COMP_IN else ALWAYS_TRUE
+        if len(values) == 1 and is_scalar(values[0]):
+            return MLClause._from_parts(clause.field, COMP_EQ if clause.comp == COMP_IN else COMP_NEQ, values[0])
+        if len(values) < len(clause.value):
+            return MLClause._from_parts(clause.field, clause.comp, values)
+    return clause
+
+
+def optimize_not(fragment):
+    children = fragment.clauses + fragment.sub_fragments
+    if len(children) != 1:
+        return fragment
+
+    child = optimize_node(children[0], negated=True)
+    if child == ALWAYS_TRUE:
+        return ALWAYS_FALSE
+    elif child == ALWAYS_FALSE:
+        return ALWAYS_TRUE
+    elif isinstance(child, MLClause):
+        # clauses on the fields of related entries are EXISTS subqueries, which can't be negated by inverting the
+        # comparison (it would no longer match entries without any related entries)
+        if child.comp in INVERTED_COMPARATORS and child.value is not None and "." not in child.field:
+            return MLClause._from_parts(child.field, INVERTED_COMPARATORS[child.comp], child.value)
+        return MLQueryFragment._from_parts(OP_NOT, [child], [])
+    elif child.op == OP_NOT:
+        # NOT NOT x => x
+        return (child.clauses + child.sub_fragments)[0]
+
+    if child is children[0]:
+        return fragment
+    return MLQueryFragment._from_parts(OP_NOT, [], [child])
+
+
+def optimize_junction(fragment, negated=False):
+    op = fragment.op
+    # the constant that short-circuits this fragment, and the constant that can be dropped from it
+    dominant, neutral = (ALWAYS_FALSE, ALWAYS_TRUE) if op == OP_AND else (ALWAYS_TRUE, ALWAYS_FALSE)
+
+    changed = False
+    children = []
+    for child in fragment.clauses + fragment.sub_fragments:
+        optimized = optimize_node(child, negated=negated)
+        changed = changed or (optimized is not child)
+        if optimized == dominant:
+            return dominant
+        elif optimized == neutral:
+            continue
+        elif isinstance(optimized, MLQueryFragment) and optimized.op == op:
+            # flatten nested fragments with the same operator
+            children.extend(optimized.clauses + optimized.sub_fragments)
+            changed = True
+        else:
+            children.append(optimized)
+
+    clauses = [child for child in children if isinstance(child, MLClause)]
+    sub_fragments = unique_nodes([child for child in children if isinstance(child, MLQueryFragment)])
+    merged = unique_nodes(clauses)
+    merged = merge_and_clauses(merged, fold_contradictions=not negated) if op == OP_AND else \
+        merge_or_clauses(merged)
+    if merged == ALWAYS_FALSE:
+        return ALWAYS_FALSE
+    changed = changed or len(merged) != len(clauses) or \
+        len(sub_fragments) != len(children) - len(clauses) or \
+        any([a is not b for a, b in zip(merged, clauses)])
+
+    if len(merged) + len(sub_fragments) == 0:
+        return neutral
+    if len(merged) + len(sub_fragments) == 1:
+        return (merged + sub_fragments)[0]
+    if not changed:
+        return fragment
+    return MLQueryFragment._from_parts(op, merged, sub_fragments)
+
+
+def merge_or_clauses(clauses):
+    """Combines the equality and IN clauses on each field into a single IN clause."""
+    values_by_field = OrderedDict()
+    for clause in clauses:
+        values = mergeable_values(clause)
+        if values is not None:
+            values_by_field.setdefault(clause.field, []).append(values)
+
+    merged_fields = set([field for field, values in values_by_field.items() if len(values) > 1])
+    if len(merged_fields) == 0:
+        return clauses
+
+    result = []
+    for clause in clauses:
+        if clause.field not in merged_fields:
+            result.append(clause)
+        elif mergeable_values(clause) is not None:
+            values = values_by_field.pop(clause.field, None)
+            if values is not None:
+                # emit the merged clause in place of the first of the clauses it replaces
+                result.append(values_clause(clause.field, unique_values([v for vals in values for v in vals])))
+        else:
+            result.append(clause)
+    return result
+
+
+def merge_and_clauses(clauses, fold_contradictions=True):
+    """Merges the range, equality, inequality and IN clauses on each numeric or date/time field into the tightest
+    equivalent set of clauses, returning ALWAYS_FALSE if they contradict each other. If fold_contradictions is False,
+    contradicting clauses on a field are kept as they are instead."""
+    clauses_by_field = OrderedDict()
+    for clause in clauses:
+        if clause_value_kind(clause) is not None:
+            clauses_by_field.setdefault(clause.field, []).append(clause)
+
+    replacements = {}
+    for field, field_clauses in clauses_by_field.items():
+        if len(field_clauses) < 2 or len(set([clause_value_kind(clause) for clause in field_clauses])) > 1 or \
+                all([clause.comp == COMP_NEQ for clause in field_clauses]):
+            continue
+        replacement = merge_field_clauses(field, field_clauses)
+        if replacement == ALWAYS_FALSE:
+            if fold_contradictions:
+                return ALWAYS_FALSE
+            continue
+        replacements[field] = replacement
+
+    if len(replacements) == 0:
+        return clauses
+
+    result = []
+    for clause in clauses:
+        if clause.field not in replacements or clause_value_kind(clause) is None:
+            result.append(clause)
+        elif clause is clauses_by_field[clause.field][0]:
+            result.extend(replacements[clause.field])
+    return result
+
+
+def merge_field_clauses(field, clauses):
+    lower, upper = None, None
+    allowed, excluded = None, []
+    for clause in clauses:
+        if clause.comp in {COMP_GT, COMP_GTE}:
+            bound = (clause.value, clause.comp == COMP_GTE)
+            if lower is None or bound[0] > lower[0] or (bound[0] == lower[0] and not bound[1]):
+                lower = bound
+        elif clause.comp in {COMP_LT, COMP_LTE}:
+            bound = (clause.value, clause.comp == COMP_LTE)
+            if upper is None or bound[0] < upper[0] or (bound[0] == upper[0] and not bound[1]):
+                upper = bound
+        elif clause.comp == COMP_NEQ:
+            excluded.append(clause.value)
+        else:
+            values = [clause.value] if clause.comp == COMP_EQ else clause.value
+            allowed = values if allowed is None else [value for value in allowed if value in values]
+
+    if allowed is not None:
+        allowed = [value for value in unique_values(allowed) if value not in excluded and within(value, lower, upper)]
+        if len(allowed) == 0:
+            return ALWAYS_FALSE
+        return [values_clause(field, allowed)]
+
+    result = []
+    if lower is not None and upper is not None:
+        if lower[0] > upper[0] or (lower[0] == upper[0] and not (lower[1] and upper[1])):
+            return ALWAYS_FALSE
+        if lower[0] == upper[0]:
+            if lower[0] in excluded:
+                return ALWAYS_FALSE
+            return [MLClause._from_parts(field, COMP_EQ, lower[0])]
+    if lower is not None:
+        result.append(MLClause._from_parts(field, COMP_GTE if lower[1] else COMP_GT, lower[0]))
+    if upper is not None:
+        result.append(MLClause._from_parts(field, COMP_LTE if upper[1] else COMP_LT, upper[0]))
+    # inequalities outside of the range are redundant
+    result.extend([
+        MLClause._from_parts(field, COMP_NEQ, value) for value in unique_values(excluded) if within(value, lower, upper)
+    ])
+    return result
+
+
+def within(value, lower, upper):
+    if lower is not None and (value < lower[0] or (value == lower[0] and not lower[1])):
+        return False
+    if upper is not None and (value > upper[0] or (value == upper[0] and not upper[1])):
+        return False
+    return True
+
+
+def values_clause(field, values):
+    if len(values) == 1:
+        return MLClause._from_parts(field, COMP_EQ, values[0])
+    return MLClause._from_parts(field, COMP_IN, values)
+
+
+def mergeable_values(clause):
+    """Returns the list of values matched by the given equality or IN clause, or None if it can't be merged with
+    other such clauses."""
+    if clause.comp == COMP_EQ and is_scalar(clause.value):
+        return [clause.value]
+    if clause.comp == COMP_IN and isinstance(clause.value, list) and all([is_scalar(v) for v in clause.value]):
+        return clause.value
+    return None
+
+
+def clause_value_kind(clause):
+    """Returns the kind of values (numbers, dates or datetimes) that the given clause compares against, if it's a
+    clause that can be reasoned about when merging AND-ed clauses, otherwise None."""
+    if "." in clause.field:
+        # AND-ed clauses on the fields of related entries may be matched by different related entries
+        return None
+    if clause.comp in RANGE_COMPARATORS or clause.comp in {COMP_EQ, COMP_NEQ}:
+        return value_kind(clause.value)
+    if clause.comp == COMP_IN and isinstance(clause.value, list) and len(clause.value) > 0:
+        kinds = set([value_kind(value) for value in clause.value])
+        return kinds.pop() if len(kinds) == 1 else None
+    return None
+
+
+def value_kind(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, Real):
+        return Real
+    if isinstance(value, datetime):
+        # naive and timezone-aware datetimes can't be compared with each other
+        return datetime, value.tzinfo is None
+    if isinstance(value, date):
+        return date
+    return None
+
+
+def is_scalar(value):
+    return value is not None and isinstance(value, (str, bool, Real, date))
+
+
+def unique_values(values):
+    """Removes duplicates from the given list of values, preserving their order."""
+    seen = set()
+    result = []
+    for value in values:
+        try:
+            key = canonical_value(value)
+            if key in seen:
+                continue
+            seen.add(key)
+        except TypeError:
+            pass
+        result.append(value)
+    return result
+
+
+def unique_nodes(nodes):
+    """Removes structurally equal duplicates from the given list of clauses or fragments, preserving their order."""
+    seen = set()
+    result = []
+    for node in nodes:
+        if node not in seen:
+            seen.add(node)
+            result.append(node)
+    return result
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+import binascii
+import json
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import and_, or_, tuple_, literal, false, ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+from mlalchemy.constants import *
+from mlalchemy.errors import *
+
+__all__ = [
+    "encode_cursor",
+    "decode_cursor",
+    "seek_criterion",
+    "fetch_page"
+]
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def encode_value(value):
+    # dates, datetimes (including their UTC offset) and decimals are tagged so that they can be restored to the
+    # correct type when decoding
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    elif isinstance(value, date):
+        return {"$date": value.strftime(DATE_FORMAT)}
+    elif isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict):
+        try:
+            if "$datetime" in value:
+                return datetime.fromisoformat(value["$datetime"])
+            elif "$date" in value:
+                return datetime.strptime(value["$date"], DATE_FORMAT).date()
+            elif "$decimal" in value:
+                return Decimal(value["$decimal"])
+        except (TypeError, ValueError, InvalidOperation):
+            raise InvalidCursorError("Malformed value in pagination cursor: %r" % (value,))
+        raise InvalidCursorError("Unrecognised value in pagination cursor")
+    return value
+
+
+def encode_cursor(values):
+    """Encodes the given list of ordering field values into an opaque, URL-safe pagination cursor string."""
+    content = json.dumps([encode_value(value) for value in values], separators=(",", ":"))
+    return urlsafe_b64encode(content.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Decodes the given pagination cursor string, as produced by encode_cursor(), back into a list of ordering field
+    values."""
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise InvalidCursorError("Malformed pagination cursor: %s" % cursor)
+    if not isinstance(values, list):
+        raise InvalidCursorError("Malformed pagination cursor: %s" % cursor)
+    return [decode_value(value) for value in values]
+
+
+def is_nullable(col):
+    """Whether the given column (or column attribute) may contain NULLs. Columns of unknown nullability, e.g.
+    labelled expressions, are assumed to be nullable."""
+    return getattr(getattr(col, "expression", col), "nullable", True)
+
+
+class NullsLowOrdering(ColumnElement):
+    """Orders entries by a nullable column such that NULLs come first in ascending order (and last in descending
+    order) on all databases, as pagination cursors depend upon. This is rendered through NULLS FIRST/NULLS LAST, except
+    on the databases that order NULLs in this way by default (some of which don't support NULLS FIRST/NULLS LAST), so
+    that the ordering can still make use of an index there."""
+
+    __visit_name__ = "nulls_low_ordering"
+    _traverse_internals = [
+        ("element", InternalTraversal.dp_clauseelement),
+        ("descending", InternalTraversal.dp_boolean)
+    ]
+    inherit_cache = True
+
+    def __init__(self, element, descending=False):
+        self.element = element
+        self.descending = descending
+        self.type = element.type
+
+
+@compiles(NullsLowOrdering)
+def compile_nulls_low_ordering(element, compiler, **kwargs):
+    return "%s %s" % (compiler.process(element.element, **kwargs), "DESC NULLS LAST" if element.descending else
+                      "ASC NULLS FIRST")
+
+
+@compiles(NullsLowOrdering, "sqlite")
+@compiles(NullsLowOrdering, "mysql")
+@compiles(NullsLowOrdering, "mariadb")
+@compiles(NullsLowOrdering, "mssql")
+def compile_native_nulls_low_ordering(element, compiler, **kwargs):
+    return "%s %s" % (compiler.process(element.element, **kwargs), "DESC" if element.descending else "ASC")
+
+
+def order_criterion(col, direction, nullable=False):
+    """Builds the ordering criterion for the given column and direction. For nullable columns, NULLs come first in
+    ascending order and last in descending order, as in seek_criterion()."""
+    if nullable:
+        return NullsLowOrdering(col, descending=direction == ORDER_DESC)
+    return col.desc() if direction == ORDER_DESC else col.asc()
+
+
+def seek_criterion(columns, directions, values):
+    """Builds the criterion selecting the entries that come after the given values in the ordering defined by the
+    given columns and directions, in which NULLs come first in ascending order and last in descending order.
+
+    Where all of the columns are ordered in the same direction and no NULL handling is necessary, this produces a
+    row value comparison, e.g. (a, b) > (:a, :b). Otherwise it produces the equivalent expanded form, e.g.
+    a > :a OR (a = :a AND b < :b), with IS NULL/IS NOT NULL checks for NULL values and nullable columns.
+
+    Args:
+        columns: The list of column attributes by which the results are ordered.
+        directions: The list of ordering directions (ORDER_ASC or ORDER_DESC) for each column.
+        values: The list of values (or bind parameters) for each column, from the last entry of the previous page.
+            NULL values must be given as None rather than through bind parameters.
+    """
+    # bind plain values using their column's type, so that they're processed in the same way as the column's values
+    values = [
+        value if value is None or hasattr(value, "type") else literal(value, type_=col.type)
+        for col, value in zip(columns, values)
+    ]
+    nullable = [is_nullable(col) for col in columns]
+
+    # row value comparisons don't account for NULLs, which are only excluded correctly from ascending orderings
+    if len(set(directions)) == 1 and all([value is not None for value in values]) and \
+            (directions[0] == ORDER_ASC or not any(nullable)):
+        if len(columns) == 1:
+            lhs, rhs = columns[0], values[0]
+        else:
+            lhs, rhs = tuple_(*columns), tuple_(*values)
+        return lhs > rhs if directions[0] == ORDER_ASC else lhs < rhs
+
+    criteria = []
+    equalities = []
+    for col, direction, value, col_nullable in zip(columns, directions, values, nullable):
+        if value is None:
+            # only non-NULL values come after NULLs in ascending order, and nothing comes after them in descending
+            # order
+            if direction == ORDER_ASC:
+                criteria.append(and_(*(equalities + [col.isnot(None)])))
+            equalities.append(col.is_(None))
+            continue
+
+        if direction == ORDER_ASC:
+            comparison = col > value
+        else:
+            comparison = or_(col < value, col.is_(None)) if col_nullable else col < value
+        criteria.append(and_(*(equalities + [comparison])))
+        equalities.append(col == value)
+    return or_(*criteria) if len(criteria) > 0 else false()
+
+
+def fetch_page(query, session, tables, plan_cache=None):
+    """Fetches a single page of results for the given query, using keyset pagination.
+
+    Args:
+        query: The MLQuery for which to fetch results. It must be ordered, and should have a limit. Its "after"
+            cursor, if any, determines the page of results to fetch.
+        session: The SQLAlchemy session through which to query the database.
+        tables: A dictionary mapping table names to their SQLAlchemy mapped classes.
+        plan_cache: An optional QueryPlanCache to use when converting the query to an SQLAlchemy query.
+
+    Returns:
+        A tuple containing the list of results for the page, and the cursor with which to fetch the next page (or
+        None if there are no further results).
+    """
+    if len(query.order_by) == 0:
+        raise QuerySyntaxError("Keyset pagination requires the query to be ordered")
+    if query.count or query.is_aggregate():
+        raise QuerySyntaxError("Counting and aggregate queries cannot be paginated")
+    if query.matches_nothing():
+        return [], None
+
+    # the ordering of paginated queries breaks ties through the primary key, and orders NULLs consistently
+    query = query.paginated()
+    q = query.to_sqlalchemy(session, tables, plan_cache=plan_cache)
+    if query.limit is None:
+        return q.all(), None
+
+    # fetch one more entry than necessary to find out whether there's another page
+    results = q.limit(query.limit + 1).all()
+    if len(results) <= query.limit:
+        return results, None
+
+    results = results[:query.limit]
+    return results, query.cursor_for(results[-1], tables=tables)
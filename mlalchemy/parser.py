@@ -5,12 +5,13 @@ from __future__ import unicode_literals
 from future.utils import iteritems
 
 import yaml
-import json
 
 from mlalchemy.errors import *
 from mlalchemy.structures import *
 from mlalchemy.constants import *
 from mlalchemy.utils import *
+from mlalchemy.yaml_loaders import DEFAULT_YAML_LOADER
+from mlalchemy.optimizer import optimize_query
 
 import logging
 logger = logging.getLogger(__name__)
@@ -19,41 +20,57 @@ __all__ = [
     "parse_yaml_query",
     "parse_json_query",
     "parse_query",
-    "parse_query_fragment"
+    "parse_query_fragment",
+    "parse_simplified_query_fragment"
 ]
 
 
-def parse_yaml_query(yaml_content):
+def parse_yaml_query(yaml_content, loader=None):
     """Parses the given YAML string to attempt to extract a query.
 
     Args:
         yaml_content: A string containing YAML content.
+        loader: The safe YAML loader class to use. Defaults to PyYAML's libyaml-based CSafeLoader if libyaml is
+            available, or its pure-Python SafeLoader otherwise. Use RestrictedSafeLoader or RestrictedCSafeLoader
+            to only allow the scalar types that MLAlchemy queries can contain.
 
     Returns:
         On success, the processed MLQuery object.
     """
-    logger.debug("Attempting to parse YAML content:\n%s" % yaml_content)
-    return parse_query(yaml.safe_load(yaml_content))
+    logger.debug("Attempting to parse YAML content:\n%s", yaml_content)
+    return parse_query(yaml.load(yaml_content, Loader=loader or DEFAULT_YAML_LOADER))
 
 
 def parse_json_query(json_content):
-    """Parses the given JSON string to attempt to extract a query.
+    """Parses the given JSON string to attempt to extract a query. The JSON content is decoded using the JSON backend
+    selected through mlalchemy.utils.set_json_backend().
 
     Args:
-        json_content: A string containing JSON content.
+        json_content: A string containing JSON content, or a bytes, bytearray or memoryview object containing
+            UTF-8 encoded JSON content.
 
     Returns:
         On success, the processed MLQuery object.
     """
-    logger.debug("Attempting to parse JSON content:\n%s" % json_content)
-    return parse_query(json.loads(json_content))
+    logger.debug("Attempting to parse JSON content:\n%s", json_content)
+    return parse_query(json_loads(json_content))
 
 
-def parse_query(qd):
+def parse_query(qd, single_pass=True, tables=None, optimize=False, policy=None):
     """Parses the given query dictionary to produce an MLQuery object.
 
     Args:
         qd: A Python dictionary (pre-parsed from JSON/YAML) from which to extract the query.
+        single_pass: If True (the default), the query fragment tree is simplified while it is being parsed, in a
+            single pass over the "where" clause. If False, the tree is first parsed and then simplified through
+            MLQueryFragment.simplify(). Both approaches produce the same MLQuery.
+        tables: An optional dictionary mapping table names to their SQLAlchemy mapped classes. If supplied, the
+            query's table and all of the fields it references are validated against it.
+        optimize: If True, the query's criteria are rewritten into a smaller, equivalent form through
+            optimize_query().
+        policy: An optional QueryPolicy to enforce on the parsed (and optimized) query. Its limits on the nesting
+            and number of clauses are already checked while parsing. Unindexed fields are only checked if tables are
+            supplied.
 
     Returns:
         On success, the processed MLQuery object.
@@ -63,23 +80,68 @@ def parse_query(qd):
     if 'from' not in qd:
         raise QuerySyntaxError("Missing \"from\" argument in query")
 
-    logger.debug("Attempting to parse query dictionary:\n%s" % json_dumps(qd, indent=2))
+    # in the summary format, the query is only summarized once it has been parsed
+    if logger.isEnabledFor(logging.DEBUG) and get_debug_log_format() == DEBUG_LOG_FULL:
+        logger.debug("Attempting to parse query dictionary:\n%s", LazyDebugRepr(qd))
 
-    qf = parse_query_fragment(qd['where']).simplify() if 'where' in qd else None
+    qf = None
+    if 'where' in qd:
+        if single_pass:
+            qf = parse_simplified_query_fragment(qd['where'], policy=policy)
+        else:
+            qf = parse_query_fragment(qd['where'], policy=policy).simplify()
     if isinstance(qf, MLClause):
         qf = MLQueryFragment(OP_AND, clauses=[qf])
 
-    return MLQuery(
+    having = None
+    if 'having' in qd:
+        if single_pass:
+            having = parse_simplified_query_fragment(qd['having'], policy=policy)
+        else:
+            having = parse_query_fragment(qd['having'], policy=policy).simplify()
+    if isinstance(having, MLClause):
+        having = MLQueryFragment(OP_AND, clauses=[having])
+
+    query = MLQuery(
         qd['from'],
         query_fragment=qf,
         order_by=qd.get('orderBy', qd.get('order-by', qd.get('order_by', None))),
         offset=qd.get('offset', None),
-        limit=qd.get('limit', None)
+        limit=qd.get('limit', None),
+        after=qd.get('after', None),
+        select=qd.get('select', qd.get('fields', None)),
+        include=qd.get('include', None),
+        group_by=qd.get('groupBy', qd.get('group-by', qd.get('group_by', None))),
+        aggregates=qd.get('aggregate', None),
+        having=having,
+        count=qd.get('count', False)
     )
+    if logger.isEnabledFor(logging.DEBUG) and get_debug_log_format() == DEBUG_LOG_SUMMARY:
+        logger.debug("Parsed query dictionary:\n%s", LazyDebugRepr(query))
+    if tables is not None:
+        query.validate(tables)
+    if optimize:
+        query = optimize_query(query)
+    if policy is not None:
+        query = policy.enforce(query, tables)
+    return query
+
 
+def parse_query_fragment(q, op=OP_AND, comp=COMP_EQ, policy=None, depth=1, clause_count=None):
+    """Parses the given query object for its query fragment only.
 
-def parse_query_fragment(q, op=OP_AND, comp=COMP_EQ):
-    """Parses the given query object for its query fragment only."""
+    Args:
+        q: The query object (a dictionary or a list of dictionaries) to parse.
+        op: The operator joining the query object's clauses and sub-fragments.
+        comp: The comparator for the query object's clauses.
+        policy: An optional QueryPolicy whose limits on the nesting and number of clauses to check while parsing.
+        depth: The nesting depth of the query object within the query being parsed.
+        clause_count: A single-element list counting the clauses parsed so far, shared between recursive calls.
+    """
+    if policy is not None:
+        policy.check_parse_depth(depth)
+        if clause_count is None:
+            clause_count = [0]
     if not isinstance(q, list) and not isinstance(q, dict):
         raise TypeError("\"Where\" clause in query fragment must either be a list or a dictionary")
 
@@ -97,13 +159,18 @@ def parse_query_fragment(q, op=OP_AND, comp=COMP_EQ):
         for k, v in iteritems(sub_q):
             # if v is a sub-fragment with a specific operator
             if k in OPERATORS:
-                s = parse_query_fragment(v, op=k, comp=comp).simplify()
+                s = parse_query_fragment(v, op=k, comp=comp, policy=policy, depth=depth + 1,
+                                         clause_count=clause_count).simplify()
             elif k in COMPARATORS:
                 # it's a sub-fragment, but its comparator is explicitly specified
-                s = parse_query_fragment(v, op=op, comp=k).simplify()
+                s = parse_query_fragment(v, op=op, comp=k, policy=policy, depth=depth + 1,
+                                         clause_count=clause_count).simplify()
             else:
                 # it must be a clause
                 s = MLClause(k, comp, v)
+                if policy is not None:
+                    clause_count[0] += 1
+                    policy.check_parsed_clause(s, clause_count[0])
 
             if isinstance(s, MLQueryFragment):
                 sub_fragments.append(s)
@@ -111,3 +178,59 @@ def parse_query_fragment(q, op=OP_AND, comp=COMP_EQ):
                 clauses.append(s)
 
     return MLQueryFragment(op, clauses=clauses, sub_fragments=sub_fragments)
+
+
+def parse_simplified_query_fragment(q, op=OP_AND, comp=COMP_EQ, policy=None, depth=1, clause_count=None):
+    """Parses the given query object for its query fragment, simplifying the tree as it is built. This produces the
+    same result as calling parse_query_fragment(q, op, comp).simplify(), but only visits each node once. The policy,
+    depth and clause_count arguments are as for parse_query_fragment().
+
+    Returns:
+        Either an MLClause (if the query object collapses to a single clause) or an MLQueryFragment.
+    """
+    if policy is not None:
+        policy.check_parse_depth(depth)
+        if clause_count is None:
+            clause_count = [0]
+    if not isinstance(q, list) and not isinstance(q, dict):
+        raise TypeError("\"Where\" clause in query fragment must either be a list or a dictionary")
+
+    # ensure we're always dealing with a list
+    if not isinstance(q, list):
+        q = [q]
+
+    clauses = []
+    sub_fragments = []
+
+    for sub_q in q:
+        if not isinstance(sub_q, dict):
+            raise TypeError("Sub-fragment must be a dictionary: %s" % sub_q)
+
+        for k, v in iteritems(sub_q):
+            if k in OPERATORS:
+                s = parse_simplified_query_fragment(v, op=k, comp=comp, policy=policy, depth=depth + 1,
+                                                    clause_count=clause_count)
+            elif k in COMPARATORS:
+                s = parse_simplified_query_fragment(v, op=op, comp=k, policy=policy, depth=depth + 1,
+                                                    clause_count=clause_count)
+            else:
+                s = MLClause(k, comp, v)
+                if policy is not None:
+                    clause_count[0] += 1
+                    policy.check_parsed_clause(s, clause_count[0])
+
+            if isinstance(s, MLQueryFragment):
+                sub_fragments.append(s)
+            elif isinstance(s, MLClause):
+                clauses.append(s)
+
+    if op == OP_NOT and (len(clauses) + len(sub_fragments)) > 1:
+        raise QuerySyntaxError("NOT operations can only contain a single clause or sub-query fragment")
+
+    # sub-fragments have already been simplified, so we only need to collapse this level of the tree
+    if len(clauses) == 1 and len(sub_fragments) == 0 and op == OP_AND:
+        return clauses[0]
+    if len(clauses) == 0 and len(sub_fragments) == 1:
+        return sub_fragments[0]
+
+    return MLQueryFragment._from_parts(op, clauses, sub_fragments)
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from mlalchemy.constants import *
+from mlalchemy.errors import *
+from mlalchemy.structures import *
+from mlalchemy.utils import normalize_field_name
+from mlalchemy.fields import get_field_index, resolve_field_path
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "QueryPolicy",
+    "QueryCost",
+    "estimate_cost"
+]
+
+# comparators for which the database can look up matching entries through an index on the compared column
+INDEXABLE_COMPARATORS = {COMP_EQ, COMP_GT, COMP_GTE, COMP_LT, COMP_LTE, COMP_IN, COMP_IS, COMP_LIKE}
+
+
+class QueryPolicy(object):
+    """Limits on the complexity of the queries accepted from untrusted sources, to protect the database from
+    expensive queries. Pass an instance of this class to parse_query() or MLQuery.to_sqlalchemy() to enforce it.
+
+    When passed to parse_query(), the clause and $in/$nin limits are also checked while the "where" clause is being
+    parsed, so that abusive queries are rejected before they have been parsed in full (and thus also apply to the query
+    as written, before it is optimized). As the query dictionary's redundant levels of nesting are only collapsed as it
+    is parsed, its nesting may be up to twice the maximum depth (plus one) during parsing; the depth of the parsed query
+    itself is checked afterwards.
+    """
+
+    def __init__(self, max_depth=None, max_clauses=None, max_in_size=None, require_limit=False, max_limit=None,
+                 allowed_fields=None, allow_leading_wildcards=True, unindexed=POLICY_ALLOW):
+        """Constructor.
+
+        Args:
+            max_depth: The maximum nesting depth of the fragments of a query's "where" clause.
+            max_clauses: The maximum total number of clauses in a query's "where" clause.
+            max_in_size: The maximum number of values in any $in/$nin clause.
+            require_limit: If True, queries without a limit are rejected (except for counting queries).
+            max_limit: The maximum number of entries a query may return. Greater limits are capped to this value,
+                as is the limit of queries without one (unless require_limit is True).
+            allowed_fields: An optional dictionary mapping table names to the names of the fields that may be
+                filtered on, sorted by or selected from each table, and of the relationships that may be included.
+                Fields of related entries must be listed by their dotted paths (e.g. "author.name"). Queries on tables
+                that aren't in the dictionary are rejected.
+            allow_leading_wildcards: If False, $like patterns starting with a wildcard are rejected, as they can't
+                make use of an index.
+            unindexed: What to do with queries that filter or sort on columns that can't be looked up through the
+                primary key, an index or a unique constraint (filtering on the second column of a composite index
+                only counts if the query also filters on the first): POLICY_ALLOW, POLICY_WARN (log a warning) or
+                POLICY_REJECT. Only applied when the query's tables are supplied.
+        """
+        if unindexed not in POLICY_ACTIONS:
+            raise ValueError("Invalid policy action for unindexed fields: %s" % unindexed)
+        for limit in [max_depth, max_clauses, max_in_size, max_limit]:
+            if limit is not None and (not isinstance(limit, int) or limit < 1):
+                raise ValueError("Query policy limits must be positive integers")
+
+        self.max_depth = max_depth
+        self.max_clauses = max_clauses
+        self.max_in_size = max_in_size
+        self.require_limit = require_limit
+        self.max_limit = max_limit
+        self.allowed_fields = None
+        if allowed_fields is not None:
+            self.allowed_fields = dict([
+                (table, frozenset([normalize_field_name(field) for field in fields]))
+                for table, fields in allowed_fields.items()
+            ])
+        self.allow_leading_wildcards = allow_leading_wildcards
+        self.unindexed = unindexed
+
+    def check_parse_depth(self, depth):
+        """Checks the nesting depth of the query dictionary being parsed, as described in the class' docstring."""
+        if self.max_depth is not None and depth > 2 * self.max_depth + 1:
+            raise QueryPolicyError("Query is nested too deeply (maximum depth is %d)" % self.max_depth)
+
+    def check_parsed_clause(self, clause, clauses):
+        """Checks the given clause, and the number of clauses parsed so far (including it), while parsing a query."""
+        if self.max_clauses is not None and clauses > self.max_clauses:
+            raise QueryPolicyError("Query has too many clauses (maximum is %d)" % self.max_clauses)
+        if self.max_in_size is not None and clause.comp in {COMP_IN, COMP_NIN} and \
+                isinstance(clause.value, (list, tuple)) and len(clause.value) > self.max_in_size:
+            raise QueryPolicyError("Query has too many values in an $in/$nin clause (maximum is %d)" %
+                                   self.max_in_size)
+
+    def enforce(self, query, tables=None):
+        """Checks the given query against this policy.
+
+        Args:
+            query: The MLQuery to check.
+            tables: An optional dictionary mapping table names to their SQLAlchemy mapped classes, required for
+                checking whether the query filters or sorts on unindexed columns.
+
+        Returns:
+            The query, or a copy of it with its limit capped to this policy's maximum limit.
+        """
+        if not isinstance(query, MLQuery):
+            raise TypeError("Only MLQuery objects can be checked against a query policy")
+
+        table = None
+        if tables is not None and self.unindexed != POLICY_ALLOW:
+            if query.table not in tables:
+                raise InvalidTableError("Table does not exist in tables dictionary: %s" % query.table)
+            table = tables[query.table]
+        cost = estimate_cost(query, table)
+
+        if self.max_depth is not None and cost.depth > self.max_depth:
+            raise QueryPolicyError("Query is nested too deeply (maximum depth is %d)" % self.max_depth)
+        if self.max_clauses is not None and cost.clauses > self.max_clauses:
+            raise QueryPolicyError("Query has too many clauses (maximum is %d)" % self.max_clauses)
+        if self.max_in_size is not None and cost.max_in_size > self.max_in_size:
+            raise QueryPolicyError("Query has too many values in an $in/$nin clause (maximum is %d)" %
+                                   self.max_in_size)
+        if not self.allow_leading_wildcards and len(cost.leading_wildcards) > 0:
+            raise QueryPolicyError("$like patterns may not start with a wildcard (field: %s)" %
+                                   cost.leading_wildcards[0])
+
+        if self.allowed_fields is not None:
+            if query.table not in self.allowed_fields:
+                raise QueryPolicyError("Querying table is not allowed: %s" % query.table)
+            fields = query.unique_field_names
+            if query.include is not None:
+                fields = fields.union([path for path, strategy in query.include])
+            disallowed = sorted(fields.difference(self.allowed_fields[query.table]))
+            if len(disallowed) > 0:
+                raise QueryPolicyError("Querying field is not allowed: %s" % disallowed[0])
+
+        if table is not None:
+            unindexed = sorted(set(cost.unindexed_filters).union(cost.unindexed_sorts))
+            if len(unindexed) > 0:
+                if self.unindexed == POLICY_REJECT:
+                    raise QueryPolicyError("Query filters or sorts on unindexed field: %s" % unindexed[0])
+                logger.warning(
+                    "Query on table \"%s\" filters or sorts on unindexed fields: %s", query.table, ", ".join(unindexed)
+                )
+
+        if query.limit is not None and (not isinstance(query.limit, int) or query.limit < 0):
+            # e.g. SQLite treats negative limits as no limit at all
+            raise QueryPolicyError("Query limit must be a non-negative integer: %r" % (query.limit,))
+        if query.limit is None:
+            if self.require_limit and not query.count:
+                raise QueryPolicyError("Query must have a limit")
+            if self.max_limit is not None:
+                query = query.with_limit(self.max_limit)
+        elif self.max_limit is not None and query.limit > self.max_limit:
+            query = query.with_limit(self.max_limit)
+        return query
+
+
+class QueryCost(object):
+    """Estimate of how expensive a query is to execute."""
+
+    __slots__ = ("depth", "clauses", "max_in_size", "leading_wildcards", "unindexed_filters", "unindexed_sorts",
+                 "index_assisted")
+
+    def __init__(self, depth=0, clauses=0, max_in_size=0, leading_wildcards=None, unindexed_filters=None,
+                 unindexed_sorts=None, index_assisted=None):
+        """Constructor.
+
+        Args:
+            depth: The nesting depth of the fragments of the query's "where" clause.
+            clauses: The total number of clauses in the query's "where" clause.
+            max_in_size: The number of values in the query's largest $in/$nin clause.
+            leading_wildcards: The names of the fields compared against $like patterns starting with a wildcard.
+            unindexed_filters: The names of the unindexed fields the query filters on.
+            unindexed_sorts: The names of the unindexed fields the query sorts on.
+            index_assisted: Whether the database can narrow down the entries matching the query through an index,
+                rather than having to scan the whole table. None if the query's table isn't known.
+        """
+        self.depth = depth
+        self.clauses = clauses
+        self.max_in_size = max_in_size
+        self.leading_wildcards = leading_wildcards or []
+        self.unindexed_filters = unindexed_filters or []
+        self.unindexed_sorts = unindexed_sorts or []
+        self.index_assisted = index_assisted
+
+    def as_dict(self):
+        return dict([(attr, getattr(self, attr)) for attr in QueryCost.__slots__])
+
+    def __repr__(self):
+        return "QueryCost(%s)" % ", ".join(["%s=%r" % (attr, getattr(self, attr)) for attr in QueryCost.__slots__])
+
+
+def estimate_cost(query, table=None):
+    """Estimates the cost of executing the given query, using the index metadata of the given mapped class (if any).
+
+    Args:
+        query: The MLQuery for which to estimate the cost.
+        table: The SQLAlchemy mapped class the query selects from. If None, the index-related properties of the
+            estimate are left empty.
+
+    Returns:
+        A QueryCost object.
+    """
+    cost = QueryCost()
+    filter_fields = []
+
+    # walk the tree iteratively, so that overly deep queries are measured (and rejected) without recursing
+    stack = [(query.query_fragment, 1)] if query.query_fragment is not None else []
+    while len(stack) > 0:
+        fragment, depth = stack.pop()
+        cost.depth = max(cost.depth, depth)
+        cost.clauses += len(fragment.clauses)
+        for clause in fragment.clauses:
+            filter_fields.append(clause.field)
+            if clause.comp in {COMP_IN, COMP_NIN} and isinstance(clause.value, (list, tuple)):
+                cost.max_in_size = max(cost.max_in_size, len(clause.value))
+            elif clause.comp == COMP_LIKE and is_leading_wildcard(clause.value):
+                cost.leading_wildcards.append(clause.field)
+        stack.extend([(sub_frag, depth + 1) for sub_frag in fragment.sub_fragments])
+
+    if table is not None:
+        index = get_field_index(table)
+        filter_fields = set(filter_fields)
+        local_fields = set([field for field in filter_fields if "." not in field])
+        cost.unindexed_filters = sorted(
+            local_fields.difference(index.indexed_subset(local_fields)).union([
+                field for field in filter_fields.difference(local_fields) if not is_path_indexed(table, field)
+            ])
+        )
+        cost.unindexed_sorts = [
+            list(ob.keys())[0] for ob in query.order_by if not is_path_indexed(table, list(ob.keys())[0])
+        ]
+        cost.index_assisted = query.query_fragment is not None and is_index_assisted(query.query_fragment, index)
+    return cost
+
+
+def is_index_assisted(node, index):
+    """Checks whether the database can narrow down the entries matching the given clause or fragment through an
+    index."""
+    if isinstance(node, MLClause):
+        # clauses on the fields of related entries are evaluated through (correlated) subqueries
+        if "." in node.field:
+            return False
+        if node.comp == COMP_LIKE and is_leading_wildcard(node.value):
+            return False
+        return node.comp in INDEXABLE_COMPARATORS and index.is_indexed(node.field)
+
+    children = node.clauses + node.sub_fragments
+    if node.op == OP_AND:
+        return any([is_index_assisted(child, index) for child in children])
+    elif node.op == OP_OR:
+        return len(children) > 0 and all([is_index_assisted(child, index) for child in children])
+    return False
+
+
+def is_path_indexed(table, field):
+    """Checks whether the given (possibly dotted) field is indexed on the table on which it resides."""
+    relationships, index, field_name = resolve_field_path(table, field)
+    return index.is_indexed(field_name)
+
+
+def is_leading_wildcard(pattern):
+    return isinstance(pattern, str) and pattern[:1] in {"%", "_"}
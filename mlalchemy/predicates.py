@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from collections.abc import Mapping
+from itertools import chain, islice
+import heapq
+import re
+
+from mlalchemy.constants import *
+from mlalchemy.errors import *
+from mlalchemy.structures import *
+from mlalchemy.structures import get_path_value
+from mlalchemy.cache import LRUCache
+from mlalchemy.utils import like_to_regex
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "compile_predicate",
+    "filter_iterable",
+    "predicate_cache"
+]
+
+IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Cache of compiled predicates, keyed by the canonical key of the fragment they were compiled from, as the same
+# filters tend to be applied over and over
+predicate_cache = LRUCache(max_size=256)
+
+
+def compile_predicate(fragment, mapping=True):
+    """Compiles the given query fragment into a Python function that takes a single row and returns whether the
+    fragment matches it. The function is generated as flat Python code (with $like patterns compiled to regular
+    expressions and $in/$nin values collected into sets up front), so that the fragment's tree isn't walked for each
+    row. Compiled predicates are cached in predicate_cache.
+
+    The predicate follows SQL's three-valued logic, so that it matches the same rows as the fragment would in the
+    database: None values are treated as NULLs, with which comparisons are neither true nor false (so they don't
+    match negated comparisons either). Clauses comparing against None are evaluated as IS NULL/IS NOT NULL checks,
+    and empty $in lists as always false criteria (even for NULLs), as SQLAlchemy renders them. Comparisons between
+    values of incompatible types raise InvalidComparatorError when the predicate is called.
+
+    Args:
+        fragment: The MLQueryFragment (or MLClause) to compile.
+        mapping: If True, rows are expected to be dictionaries (or other mappings) keyed by the snake_case field
+            names. Otherwise, field values are read from the rows' attributes (e.g. of ORM objects), following dotted
+            paths through related objects.
+
+    Returns:
+        A function taking a row, and returning True if the fragment matches it and False otherwise.
+    """
+    if not isinstance(fragment, (MLQueryFragment, MLClause)):
+        raise TypeError("Only MLQueryFragment and MLClause objects can be compiled into predicates")
+
+    key = (fragment.canonical_key(), bool(mapping))
+    predicate = predicate_cache.get(key)
+    if predicate is None:
+        predicate = PredicateCompiler(mapping).compile(fragment)
+        predicate_cache.put(key, predicate)
+    return predicate
+
+
+def filter_iterable(query, rows, mapping=None):
+    """Applies the given query to the given iterable of in-memory rows, lazily yielding the rows it returns.
+
+    Unordered queries stream through the rows, consuming only as many of them as necessary to fill the query's
+    offset and limit. Ordered queries with a limit only keep the first offset + limit rows in memory (through
+    heapq.nsmallest()). NULLs (None values) are sorted before all other values, as in SQLite.
+
+    Args:
+        query: The MLQuery to apply. Its filter, ordering, offset, limit and pagination cursor are taken into
+            account; its field selection is not.
+        rows: An iterable of dictionaries keyed by the snake_case field names, or of objects (e.g. ORM objects)
+            holding the field values in their attributes.
+        mapping: Whether the rows are dictionaries (True) or objects (False). If None, this is determined from the
+            first row.
+
+    Returns:
+        An iterator over the rows returned by the query.
+    """
+    if not isinstance(query, MLQuery):
+        raise TypeError("Only MLQuery objects can be applied to in-memory rows")
+    if query.count or query.is_aggregate():
+        raise QuerySyntaxError("Counting and aggregate queries cannot be applied to in-memory rows")
+
+    rows = iter(rows)
+    if mapping is None:
+        try:
+            first = next(rows)
+        except StopIteration:
+            return iter([])
+        mapping = isinstance(first, Mapping)
+        rows = chain([first], rows)
+
+    if query.query_fragment is not None:
+        if query.matches_nothing():
+            return iter([])
+        predicate = compile_predicate(query.query_fragment, mapping=mapping)
+        rows = (row for row in rows if predicate(row))
+
+    offset = query.offset or 0
+    if len(query.order_by) == 0:
+        return islice(rows, offset, offset + query.limit if query.limit is not None else None)
+
+    sort_key = order_key(query.order_by, mapping)
+    if query._after_values is not None:
+        after = order_key_for_values(query.order_by, query._after_values)
+        rows = (row for row in rows if sort_key(row) > after)
+
+    if query.limit is not None:
+        return iter(heapq.nsmallest(offset + query.limit, rows, key=sort_key)[offset:])
+    return iter(sorted(rows, key=sort_key)[offset:])
+
+
+class PredicateCompiler(object):
+    """Generates the source code of a predicate function from a query fragment. Each node is compiled into a pair of
+    expressions: one that is true if the node evaluates to TRUE, and one that is true if it evaluates to FALSE (as
+    opposed to NULL), so that negations can be compiled into flat expressions as well."""
+
+    __slots__ = ("mapping", "fields", "constants")
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+        # field name -> name of the local variable holding the field's value
+        self.fields = {}
+        # name -> value of the constants referenced by the generated code
+        self.constants = {}
+
+    def compile(self, fragment):
+        is_true = self.expressions(fragment)[0]
+        lines = ["def predicate(row):"]
+        for field, var in sorted(self.fields.items(), key=lambda item: item[1]):
+            lines.append("    %s = %s" % (var, self.accessor(field)))
+        # values of types that can't be compared with each other (e.g. strings and numbers) can only be detected
+        # while evaluating the predicate
+        lines.extend([
+            "    try:",
+            "        return %s" % is_true,
+            "    except TypeError as e:",
+            "        raise InvalidComparatorError(\"Cannot compare field values in query: %s\" % e)"
+        ])
+        source = "\n".join(lines)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Compiled predicate:\n%s", source)
+
+        namespace = dict(self.constants)
+        namespace["get_path_value"] = get_path_value
+        namespace["InvalidComparatorError"] = InvalidComparatorError
+        try:
+            code = compile(source, "<mlalchemy predicate>", "exec")
+        except (SyntaxError, RecursionError, MemoryError):
+            raise QuerySyntaxError("Query fragment is nested too deeply to be compiled into a predicate")
+        exec(code, namespace)
+        return namespace["predicate"]
+
+    def accessor(self, field):
+        if self.mapping:
+            return "row[%r]" % str(field)
+        if IDENTIFIER_RE.match(field):
+            return "row.%s" % field
+        return "get_path_value(row, %r)" % str(field)
+
+    def variable(self, field):
+        var = self.fields.get(field)
+        if var is None:
+            var = self.fields[field] = "v%d" % len(self.fields)
+        return var
+
+    def constant(self, value):
+        name = "c%d" % len(self.constants)
+        self.constants[name] = value
+        return name
+
+    def expressions(self, node):
+        """Returns the pair of expressions that are true if the given node is TRUE and FALSE respectively."""
+        if isinstance(node, MLClause):
+            return self.clause_expressions(node)
+
+        children = [self.expressions(child) for child in node.clauses + node.sub_fragments]
+        if node.op == OP_NOT:
+            # NOT applies to the conjunction of its children
+            is_true, is_false = junction(OP_AND, children)
+            return is_false, is_true
+        return junction(node.op, children)
+
+    def clause_expressions(self, clause):
+        v = self.variable(clause.field)
+        comp, value = clause.comp, clause.value
+
+        if clause.uses_is_operator():
+            if value is None:
+                is_true = "%s is None" % v
+            else:
+                is_true = "(%s is not None and %s == %s)" % (v, v, self.constant(value))
+            pair = (is_true, "not %s" % is_true)
+            return pair[::-1] if comp == COMP_NEQ else pair
+
+        if comp in {COMP_IN, COMP_NIN}:
+            values = list(value) if isinstance(value, (list, tuple, set, frozenset)) else [value]
+            try:
+                lookup = frozenset([item for item in values if item is not None])
+            except TypeError:
+                lookup = tuple([item for item in values if item is not None])
+            c = self.constant(lookup)
+            is_true = "(%s is not None and %s in %s)" % (v, v, c)
+            if len(values) == 0:
+                # SQLAlchemy renders empty IN lists as an always false criterion, even for NULLs
+                is_false = "True"
+            elif None not in values:
+                is_false = "(%s is not None and %s not in %s)" % (v, v, c)
+            else:
+                # x IN (..., NULL) is NULL rather than false if x doesn't match any of the other values
+                is_false = "False"
+            return (is_false, is_true) if comp == COMP_NIN else (is_true, is_false)
+
+        if comp == COMP_LIKE:
+            c = self.constant(like_to_regex(value).match)
+            return (
+                "(%s is not None and %s(%s) is not None)" % (v, c, v),
+                "(%s is not None and %s(%s) is None)" % (v, c, v)
+            )
+
+        if comp not in COMPARISON_OPERATORS:
+            raise InvalidComparatorError("Unsupported comparator for in-memory rows: %s" % comp)
+        c = self.constant(value)
+        return (
+            "(%s is not None and %s %s %s)" % (v, v, COMPARISON_OPERATORS[comp], c),
+            "(%s is not None and %s %s %s)" % (v, v, COMPARISON_OPERATORS[INVERTED_COMPARISONS[comp]], c)
+        )
+
+
+COMPARISON_OPERATORS = {
+    COMP_EQ: "==", COMP_NEQ: "!=", COMP_GT: ">", COMP_GTE: ">=", COMP_LT: "<", COMP_LTE: "<="
+}
+INVERTED_COMPARISONS = {
+    COMP_EQ: COMP_NEQ, COMP_NEQ: COMP_EQ, COMP_GT: COMP_LTE, COMP_GTE: COMP_LT, COMP_LT: COMP_GTE, COMP_LTE: COMP_GT
+}
+
+
+def junction(op, children):
+    if len(children) == 0:
+        # empty AND/OR fragments are always true/false respectively
+        return ("False", "True") if op == OP_OR else ("True", "False")
+    if len(children) == 1:
+        return children[0]
+    true_op, false_op = (" or ", " and ") if op == OP_OR else (" and ", " or ")
+    return (
+        "(%s)" % true_op.join([is_true for is_true, is_false in children]),
+        "(%s)" % false_op.join([is_false for is_true, is_false in children])
+    )
+
+
+class Descending(object):
+    """Wraps a value so that it sorts in descending order."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __gt__(self, other):
+        return self.key < other.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def null_key(value):
+    # NULLs come first
+    return (0,) if value is None else (1, value)
+
+
+def descending_null_key(value):
+    # NULLs come last, and numbers are negated rather than wrapped, as that's considerably cheaper
+    if value is None:
+        return (1,)
+    elif isinstance(value, (int, float)):
+        return (0, -value)
+    return (0, Descending(value))
+
+
+def order_key_for_values(order_by, values):
+    return tuple([
+        descending_null_key(value) if list(ob.values())[0] == ORDER_DESC else null_key(value)
+        for ob, value in zip(order_by, values)
+    ])
+
+
+def order_key(order_by, mapping):
+    """Builds the function computing the sort key of a row for the given ordering."""
+    keys = [
+        (list(ob.keys())[0], descending_null_key if list(ob.values())[0] == ORDER_DESC else null_key)
+        for ob in order_by
+    ]
+    if mapping:
+        if len(keys) == 1:
+            field, key = keys[0]
+            return lambda row: (key(row[field]),)
+        return lambda row: tuple([key(row[field]) for field, key in keys])
+    return lambda row: tuple([key(get_path_value(row, field)) for field, key in keys])
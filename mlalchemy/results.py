@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import sys
+import time
+
+from collections import namedtuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import SessionEvents
+
+from mlalchemy.cache import LRUCache
+from mlalchemy.constants import *
+from mlalchemy.errors import *
+from mlalchemy.structures import *
+from mlalchemy.fields import get_field_index, resolve_field_path
+from mlalchemy.streaming import get_column_fields
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "ResultCacheBackend",
+    "MemoryResultBackend",
+    "ResultCache"
+]
+
+CachedResult = namedtuple("CachedResult", ["rows", "tables", "expires", "size"])
+
+
+class ResultCacheBackend(object):
+    """Interface for the storage backends of a ResultCache. Cached values are opaque to the backend, apart from the
+    names of the database tables from which they were read, which are used to invalidate them."""
+
+    def get(self, key):
+        """Returns the value cached for the given key, or None if there is no such (unexpired) value."""
+        raise NotImplementedError()
+
+    def put(self, key, value, tables, generations=None):
+        """Caches the given value, which was read from the given set of database table names. If given, the value is
+        only cached if none of the tables have been invalidated since the generations() snapshot was taken."""
+        raise NotImplementedError()
+
+    def generations(self, tables):
+        """Returns a snapshot of the number of times each of the given database table names has been invalidated,
+        taken before reading a value from them."""
+        raise NotImplementedError()
+
+    def invalidate(self, tables):
+        """Discards all cached values that were read from any of the given database table names."""
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def stats(self):
+        raise NotImplementedError()
+
+
+class MemoryResultBackend(LRUCache, ResultCacheBackend):
+    """In-process result cache backend, evicting the least recently used results when either its maximum number of
+    entries or its memory budget is exceeded, and expiring results after a fixed time to live."""
+
+    def __init__(self, max_size=128, ttl=None, max_memory=None, clock=time.monotonic):
+        """Constructor.
+
+        Args:
+            max_size: The maximum number of results to keep in the cache.
+            ttl: An optional number of seconds after which cached results expire.
+            max_memory: An optional budget, in bytes, for the estimated memory usage of all cached results. Results
+                that wouldn't fit into the budget by themselves are never cached.
+            clock: A function returning the current time in seconds, against which the time to live is measured.
+        """
+        super(MemoryResultBackend, self).__init__(max_size=max_size)
+        if ttl is not None and ttl <= 0:
+            raise ValueError("Time to live for cached results must be positive")
+        if max_memory is not None and (not isinstance(max_memory, int) or max_memory < 1):
+            raise ValueError("Memory budget for cached results must be a positive integer")
+
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.memory = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._clock = clock
+        # table name -> set of keys of the results read from that table
+        self._keys_by_table = {}
+        # table name -> number of times the table has been invalidated
+        self._generations = {}
+
+    def get(self, key, default=None):
+        """Looks up the given key, marking it as the most recently used entry on success, unless it has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires is not None and entry.expires <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.rows
+
+    def put(self, key, value, tables=None, generations=None):
+        size = estimate_size(value)
+        if self.max_memory is not None and size > self.max_memory:
+            logger.debug("Not caching result of %d bytes, as it exceeds the memory budget", size)
+            return
+
+        tables = frozenset(tables or [])
+        entry = CachedResult(
+            rows=value,
+            tables=tables,
+            expires=(self._clock() + self.ttl) if self.ttl is not None else None,
+            size=size
+        )
+        with self._lock:
+            # the tables may have been changed (and invalidated) while the result was being read from them
+            if generations is not None and generations != self._snapshot(tables):
+                logger.debug("Not caching result, as the tables it was read from have since been invalidated")
+                return
+            self._remove(key)
+            self._entries[key] = entry
+            self.memory += size
+            for table in tables:
+                self._keys_by_table.setdefault(table, set()).add(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_size or \
+                (self.max_memory is not None and self.memory > self.max_memory and len(self._entries) > 0):
+            key, entry = self._entries.popitem(last=False)
+            self._forget(key, entry)
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._forget(key, entry)
+        return entry
+
+    def _forget(self, key, entry):
+        self.memory -= entry.size
+        for table in entry.tables:
+            keys = self._keys_by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del self._keys_by_table[table]
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._remove(key)
+        return entry.rows if entry is not None else default
+
+    def generations(self, tables):
+        with self._lock:
+            return self._snapshot(frozenset(tables))
+
+    def _snapshot(self, tables):
+        return {table: self._generations.get(table, 0) for table in tables}
+
+    def invalidate(self, tables):
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+                for key in list(self._keys_by_table.get(table, [])):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_table.clear()
+            self.memory = 0
+
+    def reset_stats(self):
+        with self._lock:
+            super(MemoryResultBackend, self).reset_stats()
+            self.expirations = 0
+            self.invalidations = 0
+
+    def stats(self):
+        with self._lock:
+            stats = super(MemoryResultBackend, self).stats()
+            stats.update({
+                "memory": self.memory,
+                "max_memory": self.max_memory,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            })
+            return stats
+
+
+class ResultCache(object):
+    """Caches the results of MLQuery objects, keyed on the canonical form of each query and the mapped class it
+    selects from, so that semantically identical queries are only executed against the database once.
+
+    Cached results are invalidated per database table: once attached to a session (or sessionmaker, or Session
+    class), changes flushed, committed or rolled back through it, as well as bulk updates and deletes executed
+    through it, discard all cached results read from the affected tables. Changes made to the database by other
+    means go unnoticed, and are only picked up once the affected results expire or are evicted.
+
+    Results are cached as plain tuples of column values, rather than as mapped objects, as the latter are bound to
+    the session through which they were loaded.
+    """
+
+    def __init__(self, backend=None):
+        """Constructor.
+
+        Args:
+            backend: The ResultCacheBackend in which to store results. Defaults to a MemoryResultBackend with its
+                default settings.
+        """
+        self.backend = backend if backend is not None else MemoryResultBackend()
+        # the key under which changed tables are tracked in each session's info dictionary until the end of its
+        # transaction, kept distinct for each cache attached to the same session
+        self._info_key = "mlalchemy_result_cache_%d" % id(self)
+
+    def execute(self, query, session, tables, row_format=ROW_FORMAT_DICT, fields=None, plan_cache=None):
+        """Returns the results of the given query, executing it through the given session only if they aren't
+        cached yet.
+
+        Args:
+            query: The MLQuery to execute.
+            session: The SQLAlchemy session through which to query the database.
+            tables: A dictionary mapping table names to their SQLAlchemy mapped classes.
+            row_format: The format in which to return each row: ROW_FORMAT_TUPLE (plain tuples of column values) or
+                ROW_FORMAT_DICT (dictionaries mapping field names to column values).
+            fields: An optional list of the names of the fields to return. Defaults to the query's selected fields,
+                or all of the table's mapped columns if it has none.
+            plan_cache: An optional QueryPlanCache to use when converting the query to an SQLAlchemy query.
+
+        Returns:
+            A list containing the query's results.
+        """
+        if not isinstance(query, MLQuery):
+            raise TypeError("Only the results of MLQuery objects can be cached")
+        if row_format not in {ROW_FORMAT_TUPLE, ROW_FORMAT_DICT}:
+            raise ValueError("Only tuple and dictionary rows can be cached, not: %s" % row_format)
+        if query.table not in tables:
+            raise InvalidTableError("Table does not exist in tables dictionary: %s" % query.table)
+        if query.count or query.is_aggregate():
+            raise QuerySyntaxError("The results of counting and aggregate queries cannot be cached")
+
+        table = tables[query.table]
+        fields = get_column_fields(table, fields if fields is not None else query.select)
+        if query.matches_nothing():
+            return []
+        key = (table, query.canonical_key(), tuple(fields))
+
+        rows = self.backend.get(key)
+        if rows is None:
+            names = get_query_table_names(query, table)
+            # taken before executing the query, so that results read before a concurrent invalidation aren't cached
+            generations = self.backend.generations(names)
+            index = get_field_index(table)
+            q = query.to_sqlalchemy(session, tables, plan_cache=plan_cache)
+            rows = tuple([tuple(row) for row in q.with_entities(*[index.resolve(field) for field in fields])])
+            # results read from the session's own uncommitted changes (tracked once they've been flushed, which may
+            # have happened while executing the query) mustn't be served to other sessions
+            if names.isdisjoint(session.info.get(self._info_key, ())):
+                self.backend.put(key, rows, names, generations=generations)
+            else:
+                logger.debug("Not caching result of query on %s, as it reads uncommitted changes", query.table)
+        else:
+            logger.debug("Result cache hit for query on %s", query.table)
+
+        if row_format == ROW_FORMAT_DICT:
+            return [dict(zip(fields, row)) for row in rows]
+        return list(rows)
+
+    def invalidate(self, tables):
+        """Discards all cached results that were read from the given database tables, specified either by name or
+        as SQLAlchemy Table objects or mapped classes."""
+        names = set()
+        for table in tables:
+            if isinstance(table, type):
+                names.update(get_table_names(inspect(table)))
+            else:
+                names.add(getattr(table, "fullname", table))
+        self.backend.invalidate(names)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """Returns the statistics of the cache's backend, including its hit rate."""
+        return self.backend.stats()
+
+    def attach(self, target):
+        """Listens for changes made through the given Session, sessionmaker or Session class, invalidating the cached
+        results read from the affected tables."""
+        for name, fn in self._listeners():
+            event.listen(target, name, fn)
+
+    def detach(self, target):
+        for name, fn in self._listeners():
+            event.remove(target, name, fn)
+
+    def _listeners(self):
+        listeners = [
+            ("after_flush", self._after_flush),
+            ("after_commit", self._after_transaction),
+            ("after_rollback", self._after_transaction)
+        ]
+        if hasattr(SessionEvents, "do_orm_execute"):
+            listeners.append(("do_orm_execute", self._do_orm_execute))
+        else:
+            listeners.extend([
+                ("after_bulk_update", self._after_bulk_statement),
+                ("after_bulk_delete", self._after_bulk_statement)
+            ])
+        return listeners
+
+    def _changed(self, session, names):
+        if len(names) == 0:
+            return
+        # results may be read (and cached) from the session's own uncommitted changes until its transaction ends, so
+        # the changed tables are invalidated once more at that point
+        session.info.setdefault(self._info_key, set()).update(names)
+        logger.debug("Invalidating cached results for tables: %s", ", ".join(sorted(names)))
+        self.backend.invalidate(names)
+
+    def _after_flush(self, session, flush_context):
+        names = set()
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            names.update(get_table_names(inspect(obj).mapper))
+        self._changed(session, names)
+
+    def _after_transaction(self, session):
+        names = session.info.pop(self._info_key, None)
+        if names:
+            self.backend.invalidate(names)
+
+    def _do_orm_execute(self, orm_execute_state):
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            names = get_table_names(mapper)
+        else:
+            table = getattr(orm_execute_state.statement, "table", None)
+            names = {table.fullname} if hasattr(table, "fullname") else set()
+        self._changed(orm_execute_state.session, names)
+
+    def _after_bulk_statement(self, context):
+        self._changed(context.session, get_table_names(context.mapper))
+
+
+def get_table_names(mapper):
+    # Core tables are their own inspection targets
+    return {table.fullname for table in getattr(mapper, "tables", [mapper])}
+
+
+def get_query_table_names(query, table):
+    """Returns the names of the database tables from which the given query reads, including those of the related
+    entries its (dotted) fields refer to."""
+    names = get_table_names(inspect(table))
+    for field in query.unique_field_names:
+        if "." in field:
+            for rel in resolve_field_path(table, field)[0]:
+                names.update(get_table_names(inspect(rel.target)))
+    return names
+
+
+def estimate_size(value):
+    """Estimates the memory used by the given value, including that of the items of lists and tuples."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum([estimate_size(item) for item in value])
+    return size
@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from datetime import date, datetime
+import struct
+
+from mlalchemy.constants import *
+from mlalchemy.errors import *
+from mlalchemy.structures import *
+from mlalchemy.pagination import decode_cursor
+
+__all__ = [
+    "dumps_query",
+    "loads_query"
+]
+
+MAGIC = b"MLQ"
+FORMAT_VERSION = 1
+
+# value type tags
+TAG_NONE = 0xC0
+TAG_FALSE = 0xC2
+TAG_TRUE = 0xC3
+TAG_INT = 0xD3
+TAG_BIGINT = 0xC9
+TAG_FLOAT = 0xCB
+TAG_STR = 0xD9
+TAG_BYTES = 0xC4
+TAG_LIST = 0xDD
+TAG_DICT = 0xDF
+TAG_DATE = 0xD6
+TAG_DATETIME = 0xD7
+# integers from 0 to 0x7F are encoded as a single byte
+MAX_FIXINT = 0x7F
+
+INT64 = struct.Struct(">q")
+FLOAT64 = struct.Struct(">d")
+
+# single-byte codes for operators, comparators and ordering directions
+OPERATOR_CODES = {OP_AND: 1, OP_OR: 2, OP_NOT: 3}
+COMPARATOR_CODES = {
+    COMP_EQ: 1, COMP_GT: 2, COMP_GTE: 3, COMP_LT: 4, COMP_LTE: 5, COMP_NEQ: 6, COMP_LIKE: 7, COMP_IN: 8,
+    COMP_NIN: 9, COMP_IS: 10
+}
+ORDER_CODES = {ORDER_ASC: 0, ORDER_DESC: 1}
+LOAD_STRATEGY_CODES = {None: 0, LOAD_SELECTIN: 1, LOAD_JOINED: 2}
+AGGREGATE_CODES = {AGG_COUNT: 1, AGG_SUM: 2, AGG_AVG: 3, AGG_MIN: 4, AGG_MAX: 5}
+OPERATORS_BY_CODE = dict([(code, op) for op, code in OPERATOR_CODES.items()])
+COMPARATORS_BY_CODE = dict([(code, comp) for comp, code in COMPARATOR_CODES.items()])
+ORDERS_BY_CODE = dict([(code, order) for order, code in ORDER_CODES.items()])
+LOAD_STRATEGIES_BY_CODE = dict([(code, strategy) for strategy, code in LOAD_STRATEGY_CODES.items()])
+AGGREGATES_BY_CODE = dict([(code, agg_func) for agg_func, code in AGGREGATE_CODES.items()])
+
+
+def dumps_query(query):
+    """Encodes the given MLQuery into a compact binary representation, which can be decoded again by loads_query().
+
+    Table and field names are interned in a string table at the start of the encoded query, and operators,
+    comparators and ordering directions are encoded as single-byte codes. Clause values may be None, booleans,
+    integers, floats, strings, bytes, dates, datetimes, lists and dictionaries of these.
+    """
+    if not isinstance(query, MLQuery):
+        raise TypeError("Only MLQuery objects can be serialized")
+
+    encoder = Encoder()
+    body = bytearray()
+    encoder.write_name(body, query.table)
+    encoder.write_value(body, query.offset)
+    encoder.write_value(body, query.limit)
+    encoder.write_value(body, query.after)
+
+    write_varint(body, len(query.order_by))
+    for order_by in query.order_by:
+        field, direction = list(order_by.items())[0]
+        encoder.write_name(body, field)
+        body.append(ORDER_CODES[direction])
+
+    if query.select is None:
+        body.append(0)
+    else:
+        body.append(1)
+        write_varint(body, len(query.select))
+        for field in query.select:
+            encoder.write_name(body, field)
+
+    if query.query_fragment is None:
+        body.append(0)
+    else:
+        body.append(1)
+        encoder.write_fragment(body, query.query_fragment)
+
+    if query.include is None:
+        body.append(0)
+    else:
+        body.append(1)
+        write_varint(body, len(query.include))
+        for path, strategy in query.include:
+            encoder.write_name(body, path)
+            body.append(LOAD_STRATEGY_CODES[strategy])
+
+    body.append(1 if query.count else 0)
+    if query.group_by is None:
+        body.append(0)
+    else:
+        body.append(1)
+        write_varint(body, len(query.group_by))
+        for field in query.group_by:
+            encoder.write_name(body, field)
+
+    if query.aggregates is None:
+        body.append(0)
+    else:
+        body.append(1)
+        write_varint(body, len(query.aggregates))
+        for name, agg_func, field in query.aggregates:
+            encoder.write_name(body, name)
+            body.append(AGGREGATE_CODES[agg_func])
+            if field is None:
+                body.append(0)
+            else:
+                body.append(1)
+                encoder.write_name(body, field)
+
+    if query.having is None:
+        body.append(0)
+    else:
+        body.append(1)
+        encoder.write_fragment(body, query.having)
+
+    header = bytearray(MAGIC)
+    header.append(FORMAT_VERSION)
+    # the string table is stored as a single NUL-separated string, so that it can be decoded in one go
+    for name in encoder.names:
+        if "\x00" in name:
+            raise ValueError("Table and field names cannot contain NUL characters")
+    write_str(header, "\x00".join(encoder.names))
+    return bytes(header + body)
+
+
+def loads_query(data):
+    """Decodes an MLQuery from the given binary representation, as produced by dumps_query().
+
+    This is a trusted fast path: the query tree is rebuilt directly, without re-validating it, normalizing its field
+    names or simplifying it, so only data produced by dumps_query() should be decoded.
+    """
+    data = bytearray(data)
+    if data[:len(MAGIC)] != MAGIC:
+        raise SerializationError("Data is not a serialized MLQuery")
+    try:
+        return Decoder(data).read_query()
+    except (IndexError, KeyError, struct.error, UnicodeDecodeError, ValueError):
+        raise SerializationError("Malformed serialized MLQuery")
+
+
+class Encoder(object):
+
+    __slots__ = ("names", "name_ids")
+
+    def __init__(self):
+        self.names = []
+        self.name_ids = {}
+
+    def write_name(self, buf, name):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        write_varint(buf, name_id)
+
+    def write_fragment(self, buf, fragment):
+        buf.append(OPERATOR_CODES[fragment.op])
+        write_varint(buf, len(fragment.clauses))
+        for clause in fragment.clauses:
+            self.write_name(buf, clause.field)
+            buf.append(COMPARATOR_CODES[clause.comp])
+            self.write_value(buf, clause.value)
+        write_varint(buf, len(fragment.sub_fragments))
+        for sub_fragment in fragment.sub_fragments:
+            self.write_fragment(buf, sub_fragment)
+
+    def write_value(self, buf, value):
+        if value is None:
+            buf.append(TAG_NONE)
+        elif value is True:
+            buf.append(TAG_TRUE)
+        elif value is False:
+            buf.append(TAG_FALSE)
+        elif isinstance(value, int):
+            if 0 <= value <= MAX_FIXINT:
+                buf.append(value)
+            elif -2 ** 63 <= value < 2 ** 63:
+                buf.append(TAG_INT)
+                buf.extend(INT64.pack(value))
+            else:
+                buf.append(TAG_BIGINT)
+                write_str(buf, str(value))
+        elif isinstance(value, float):
+            buf.append(TAG_FLOAT)
+            buf.extend(FLOAT64.pack(value))
+        elif isinstance(value, str):
+            buf.append(TAG_STR)
+            write_str(buf, value)
+        elif isinstance(value, (bytes, bytearray)):
+            buf.append(TAG_BYTES)
+            write_varint(buf, len(value))
+            buf.extend(value)
+        elif isinstance(value, datetime):
+            buf.append(TAG_DATETIME)
+            write_str(buf, value.isoformat())
+        elif isinstance(value, date):
+            buf.append(TAG_DATE)
+            write_varint(buf, value.toordinal())
+        elif isinstance(value, (list, tuple)):
+            buf.append(TAG_LIST)
+            write_varint(buf, len(value))
+            for item in value:
+                self.write_value(buf, item)
+        elif isinstance(value, dict):
+            buf.append(TAG_DICT)
+            write_varint(buf, len(value))
+            for k, v in value.items():
+                self.write_value(buf, k)
+                self.write_value(buf, v)
+        else:
+            raise TypeError("Cannot serialize value of type %s" % type(value).__name__)
+
+
+class Decoder(object):
+    """Decodes serialized queries. Decoding is performed by reading directly from a bytes object, with the current
+    position passed around explicitly, to keep per-value overhead to a minimum."""
+
+    __slots__ = ("data", "names")
+
+    def __init__(self, data):
+        self.data = data
+        self.names = None
+
+    def read_query(self):
+        data = self.data
+        pos = len(MAGIC)
+        if data[pos] != FORMAT_VERSION:
+            raise SerializationError("Unsupported serialized MLQuery version: %d" % data[pos])
+        names, pos = read_str(data, pos + 1)
+        names = self.names = names.split("\x00")
+
+        query = MLQuery.__new__(MLQuery)
+        name_id, pos = read_varint(data, pos)
+        query.table = names[name_id]
+        query.offset, pos = read_value(data, pos)
+        query.limit, pos = read_value(data, pos)
+        query.after, pos = read_value(data, pos)
+
+        count, pos = read_varint(data, pos)
+        query.order_by = []
+        for _ in range(count):
+            name_id, pos = read_varint(data, pos)
+            query.order_by.append({names[name_id]: ORDERS_BY_CODE[data[pos]]})
+            pos += 1
+
+        query.select = None
+        pos += 1
+        if data[pos - 1]:
+            count, pos = read_varint(data, pos)
+            query.select = []
+            for _ in range(count):
+                name_id, pos = read_varint(data, pos)
+                query.select.append(names[name_id])
+
+        query.query_fragment = None
+        pos += 1
+        if data[pos - 1]:
+            query.query_fragment, pos = self.read_fragment(pos)
+
+        query.include = None
+        pos += 1
+        if data[pos - 1]:
+            count, pos = read_varint(data, pos)
+            query.include = []
+            for _ in range(count):
+                name_id, pos = read_varint(data, pos)
+                query.include.append([names[name_id], LOAD_STRATEGIES_BY_CODE[data[pos]]])
+                pos += 1
+
+        query.keyset = False
+        query.group_by = query.aggregates = query.having = None
+        query.count = bool(data[pos])
+        pos += 2
+        if data[pos - 1]:
+            count, pos = read_varint(data, pos)
+            query.group_by = []
+            for _ in range(count):
+                name_id, pos = read_varint(data, pos)
+                query.group_by.append(names[name_id])
+
+        pos += 1
+        if data[pos - 1]:
+            count, pos = read_varint(data, pos)
+            query.aggregates = []
+            for _ in range(count):
+                name_id, pos = read_varint(data, pos)
+                agg_func = AGGREGATES_BY_CODE[data[pos]]
+                field = None
+                pos += 2
+                if data[pos - 1]:
+                    field_id, pos = read_varint(data, pos)
+                    field = names[field_id]
+                query.aggregates.append([names[name_id], agg_func, field])
+
+        pos += 1
+        if data[pos - 1]:
+            query.having, pos = self.read_fragment(pos)
+
+        if pos != len(data):
+            raise SerializationError("Unexpected trailing data in serialized MLQuery")
+
+        query._after_values = decode_cursor(query.after) if query.after is not None else None
+        query._unique_field_names = None
+        query._canonical_key = None
+        query._hash = None
+        return query
+
+    def read_fragment(self, pos):
+        data, names = self.data, self.names
+        op = OPERATORS_BY_CODE[data[pos]]
+        count, pos = read_varint(data, pos + 1)
+        clauses = []
+        for _ in range(count):
+            name_id, pos = read_varint(data, pos)
+            comp = COMPARATORS_BY_CODE[data[pos]]
+            value, pos = read_value(data, pos + 1)
+            clauses.append(MLClause._from_parts(names[name_id], comp, value))
+
+        count, pos = read_varint(data, pos)
+        sub_fragments = []
+        for _ in range(count):
+            sub_fragment, pos = self.read_fragment(pos)
+            sub_fragments.append(sub_fragment)
+        return MLQueryFragment._from_parts(op, clauses, sub_fragments), pos
+
+
+def read_varint(data, pos):
+    b = data[pos]
+    if b < 0x80:
+        return b, pos + 1
+    result, shift = 0, 0
+    while b >= 0x80:
+        result |= (b & 0x7F) << shift
+        shift += 7
+        pos += 1
+        b = data[pos]
+    return result | (b << shift), pos + 1
+
+
+def read_str(data, pos):
+    length, pos = read_varint(data, pos)
+    end = pos + length
+    if end > len(data):
+        raise IndexError("Unexpected end of data")
+    return data[pos:end].decode("utf-8"), end
+
+
+def read_value(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag <= MAX_FIXINT:
+        return tag, pos
+    elif tag == TAG_STR:
+        return read_str(data, pos)
+    elif tag == TAG_NONE:
+        return None, pos
+    elif tag == TAG_TRUE:
+        return True, pos
+    elif tag == TAG_FALSE:
+        return False, pos
+    elif tag == TAG_INT:
+        return INT64.unpack_from(data, pos)[0], pos + INT64.size
+    elif tag == TAG_FLOAT:
+        return FLOAT64.unpack_from(data, pos)[0], pos + FLOAT64.size
+    elif tag == TAG_LIST:
+        count, pos = read_varint(data, pos)
+        result = []
+        for _ in range(count):
+            # inline the most common case of small integers in $in/$nin lists
+            if data[pos] <= MAX_FIXINT:
+                result.append(data[pos])
+                pos += 1
+            else:
+                value, pos = read_value(data, pos)
+                result.append(value)
+        return result, pos
+    elif tag == TAG_DATE:
+        ordinal, pos = read_varint(data, pos)
+        return date.fromordinal(ordinal), pos
+    elif tag == TAG_DATETIME:
+        s, pos = read_str(data, pos)
+        return datetime.fromisoformat(s), pos
+    elif tag == TAG_BIGINT:
+        s, pos = read_str(data, pos)
+        return int(s), pos
+    elif tag == TAG_BYTES:
+        length, pos = read_varint(data, pos)
+        if pos + length > len(data):
+            raise IndexError("Unexpected end of data")
+        return bytes(data[pos:pos + length]), pos + length
+    elif tag == TAG_DICT:
+        count, pos = read_varint(data, pos)
+        result = {}
+        for _ in range(count):
+            k, pos = read_value(data, pos)
+            result[k], pos = read_value(data, pos)
+        return result, pos
+    raise SerializationError("Unknown value tag in serialized MLQuery: 0x%02X" % tag)
+
+
+def write_varint(buf, value):
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def write_str(buf, s):
+    encoded = s.encode("utf-8")
+    write_varint(buf, len(encoded))
+    buf.extend(encoded)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from mlalchemy.constants import *
+from mlalchemy.errors import *
+from mlalchemy.structures import *
+from mlalchemy.utils import *
+from mlalchemy.fields import get_field_index
+
+__all__ = [
+    "stream_query"
+]
+
+
+def stream_query(query, session, tables, chunk_size=1000, row_format=ROW_FORMAT_ENTITY, fields=None, chunks=False,
+                 plan_cache=None):
+    """Executes the given query, streaming its results from the database in chunks rather than loading them all
+    into memory at once.
+
+    Args:
+        query: The MLQuery to execute.
+        session: The SQLAlchemy session through which to query the database.
+        tables: A dictionary mapping table names to their SQLAlchemy mapped classes.
+        chunk_size: The number of rows to fetch from the database at a time.
+        row_format: The format in which to return each row: ROW_FORMAT_ENTITY (mapped objects), ROW_FORMAT_TUPLE
+            (plain tuples of column values) or ROW_FORMAT_DICT (dictionaries mapping field names to column values).
+        fields: For the tuple and dictionary row formats, an optional list of the names of the fields to return.
+            Defaults to the query's selected fields, or all of the table's mapped columns if it has none.
+        chunks: If True, lists of up to chunk_size rows are yielded instead of individual rows.
+        plan_cache: An optional QueryPlanCache to use when converting the query to an SQLAlchemy query.
+
+    Returns:
+        A generator yielding the query's results.
+    """
+    if not isinstance(query, MLQuery):
+        raise TypeError("Only MLQuery objects can be streamed")
+    if not isinstance(chunk_size, int) or chunk_size < 1:
+        raise ValueError("Chunk size for streaming query results must be a positive integer")
+    if row_format not in ROW_FORMATS:
+        raise ValueError("Invalid row format: %s" % row_format)
+    if query.count or query.is_aggregate():
+        raise QuerySyntaxError("Counting and aggregate queries cannot be streamed")
+    if query.matches_nothing():
+        return iter([])
+
+    q = query.to_sqlalchemy(session, tables, plan_cache=plan_cache)
+    if row_format != ROW_FORMAT_ENTITY:
+        fields = get_column_fields(tables[query.table], fields if fields is not None else query.select)
+        index = get_field_index(tables[query.table])
+        q = q.with_entities(*[index.resolve(field) for field in fields])
+
+    rows = iter_rows(q.yield_per(chunk_size), row_format, fields)
+    return iter_chunks(rows, chunk_size) if chunks else rows
+
+
+def get_column_fields(table, fields=None):
+    """Normalizes and validates the given list of field names against the given mapped class or table, or returns
+    the names of all of its columns if no fields are given."""
+    index = get_field_index(table)
+    if fields is None:
+        return list(index.field_names)
+    return [index.field_name(normalize_field_name(field)) for field in fields]
+
+
+def iter_rows(q, row_format, fields):
+    for row in q:
+        if row_format == ROW_FORMAT_TUPLE:
+            yield tuple(row)
+        elif row_format == ROW_FORMAT_DICT:
+            yield dict(zip(fields, row))
+        else:
+            yield row
+
+
+def iter_chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
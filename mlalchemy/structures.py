@@ -3,12 +3,16 @@
 from __future__ import unicode_literals
 from past.builtins import basestring
 
-from sqlalchemy.sql.expression import and_, or_, not_
-from sqlalchemy.orm.attributes import QueryableAttribute
+from sqlalchemy.sql.expression import and_, or_, not_, bindparam, true, false, select, func
+from sqlalchemy.orm import load_only, aliased, selectinload, joinedload
+from sqlalchemy import inspect
+from sqlalchemy.exc import NoInspectionAvailable
 
 from mlalchemy.constants import *
 from mlalchemy.errors import *
 from mlalchemy.utils import *
+from mlalchemy.pagination import encode_cursor, decode_cursor, seek_criterion, is_nullable, order_criterion
+from mlalchemy.fields import get_field_index, resolve_field_path, resolve_relationship_path
 
 import logging
 logger = logging.getLogger(__name__)
@@ -23,7 +27,12 @@ __all__ = [
 class MLQuery(object):
     """Broad data structure used to represent a selection query in its entirety."""
 
-    def __init__(self, table, query_fragment=None, order_by=None, offset=None, limit=None):
+    __slots__ = ("table", "query_fragment", "order_by", "offset", "limit", "after", "_after_values", "select",
+                 "include", "group_by", "aggregates", "having", "count", "keyset", "_unique_field_names",
+                 "_canonical_key", "_hash")
+
+    def __init__(self, table, query_fragment=None, order_by=None, offset=None, limit=None, after=None, select=None,
+                 include=None, group_by=None, aggregates=None, having=None, count=False):
         """Constructor.
 
         Args:
@@ -37,6 +46,25 @@ class MLQuery(object):
                 descending direction. This can also be an ordered list of field names/directions.
             offset: The number of entries to skip. Set to None if no offset is required.
             limit: The maximum number of entries to return. Set to None to specify no limit.
+            after: An opaque pagination cursor, as returned by cursor_for(), indicating that only entries that come
+                after the entry from which the cursor was generated (in terms of the query's ordering) must be
+                returned. Requires the query to be ordered.
+            select: A string or list containing the names of the fields to load for each entry. Set to None to load
+                all fields.
+            include: A string or list containing the names (or dotted paths) of the relationships whose related
+                entries must be eagerly loaded along with each entry, or a dictionary mapping such names to the
+                loading strategy to use (LOAD_SELECTIN or LOAD_JOINED). By default, collections are loaded through a
+                separate SELECT ... IN query and single related entries through a join.
+            group_by: A string or list containing the names of the fields by which to group the entries. Each result
+                of the query is then a row containing the values of these fields and of the aggregates for its group.
+            aggregates: A dictionary mapping result names to the aggregate to compute for each group (or for all
+                matching entries if there is no grouping), as a dictionary mapping an aggregate function (AGG_COUNT,
+                AGG_SUM, AGG_AVG, AGG_MIN or AGG_MAX) to the name of the field to aggregate, e.g.
+                {"total": {"$sum": "children"}}. Use COUNT_ALL as the field to count all entries.
+            having: An optional MLQueryFragment filtering the groups, referring to the grouped fields and the names
+                of the aggregates.
+            count: If True, the query only counts the entries matching its "where" clause, ignoring its ordering,
+                offset, limit, pagination cursor, field selection and included relationships.
         """
         if not isinstance(table, basestring):
             raise TypeError("The table name supplied to an MLQuery object must be a string")
@@ -44,13 +72,26 @@ class MLQuery(object):
             raise TypeError("Primary query fragment for MLQuery must be of type MLQueryFragment")
         if order_by is not None and not isinstance(order_by, basestring) and not isinstance(order_by, list):
             raise TypeError("Query ordering parameter must be a string or a list")
+        if select is not None and not isinstance(select, basestring) and not isinstance(select, list):
+            raise TypeError("Query field selection parameter must be a string or a list")
+        if include is not None and not isinstance(include, (basestring, list, dict)):
+            raise TypeError("Query relationship inclusion parameter must be a string, a list or a dictionary")
+        if group_by is not None and not isinstance(group_by, (basestring, list)):
+            raise TypeError("Query grouping parameter must be a string or a list")
+        if aggregates is not None and not isinstance(aggregates, dict):
+            raise TypeError("Query aggregates parameter must be a dictionary")
+        if having is not None and not isinstance(having, MLQueryFragment):
+            raise TypeError("Query fragment for filtering groups must be of type MLQueryFragment")
+        if offset is not None and not is_non_negative_int(offset):
+            raise QuerySyntaxError("Query offset must be a non-negative integer: %r" % (offset,))
+        if limit is not None and not is_non_negative_int(limit):
+            raise QuerySyntaxError("Query limit must be a non-negative integer: %r" % (limit,))
 
-        self.unique_field_names = set()
         self.table = table
         self.query_fragment = query_fragment
-
-        if self.query_fragment is not None:
-            self.unique_field_names = self.unique_field_names.union(self.query_fragment.unique_field_names)
+        self._unique_field_names = None
+        self._canonical_key = None
+        self._hash = None
 
         self.order_by = []
         if order_by is not None:
@@ -59,61 +100,410 @@ class MLQuery(object):
                 order_by = [order_by]
 
             for ob in order_by:
-                field_name = ob.strip("-")
+                if not isinstance(ob, basestring):
+                    raise QuerySyntaxError("Ordering field names must be strings: %r" % (ob,))
+                if len(ob.strip("-")) == 0:
+                    raise QuerySyntaxError("Invalid ordering field name: %r" % ob)
                 # make sure it's in snake_case
-                if is_camelcase_string(field_name):
-                    field_name = camelcase_to_snakecase(field_name)
-                elif is_kebabcase_string(field_name):
-                    field_name = kebabcase_to_snakecase(field_name)
+                field_name = normalize_field_name(ob.strip("-"))
                 self.order_by.append({field_name: ORDER_DESC if ob[0] == "-" else ORDER_ASC})
-                self.unique_field_names.add(field_name)
 
         self.offset = offset
         self.limit = limit
 
+        self.select = None
+        if select is not None:
+            if not isinstance(select, list):
+                select = [select]
+            for field_name in select:
+                if not isinstance(field_name, basestring):
+                    raise TypeError("Selected field names must be strings")
+            self.select = [normalize_field_name(field_name) for field_name in select]
+
+        self.include = None
+        if include is not None:
+            if isinstance(include, basestring):
+                include = [include]
+            if isinstance(include, list):
+                include = [(path, None) for path in include]
+            else:
+                include = sorted(include.items())
+            self.include = []
+            for path, strategy in include:
+                if not isinstance(path, basestring):
+                    raise TypeError("Included relationship names must be strings")
+                if strategy is not None and strategy not in LOAD_STRATEGIES:
+                    raise QuerySyntaxError("Invalid loading strategy for included relationship: %s" % strategy)
+                self.include.append([normalize_field_name(path), strategy])
+
+        self.after = after
+        self._after_values = None
+        if after is not None:
+            if not isinstance(after, basestring):
+                raise TypeError("Query pagination cursor must be a string")
+            if len(self.order_by) == 0:
+                raise QuerySyntaxError("Keyset pagination requires the query to be ordered")
+            self._after_values = decode_cursor(after)
+            # cursors also contain the values of the primary key columns that break ties in the ordering, which are
+            # only known once the query is compiled against its table
+            if len(self._after_values) < len(self.order_by):
+                raise InvalidCursorError("Pagination cursor does not match the query's ordering")
+
+        self.count = bool(count)
+        self.keyset = False
+        self.group_by = None
+        if group_by is not None:
+            if not isinstance(group_by, list):
+                group_by = [group_by]
+            for field_name in group_by:
+                if not isinstance(field_name, basestring):
+                    raise TypeError("Grouped field names must be strings")
+            self.group_by = [normalize_field_name(field_name) for field_name in group_by]
+
+        self.aggregates = None
+        if aggregates is not None:
+            self.aggregates = []
+            for name, aggregate in sorted(aggregates.items()):
+                if not isinstance(aggregate, dict) or len(aggregate) != 1:
+                    raise QuerySyntaxError("Aggregate must be a dictionary with a single function: %s" % name)
+                agg_func, field_name = list(aggregate.items())[0]
+                if agg_func not in AGGREGATES:
+                    raise QuerySyntaxError("Invalid aggregate function: %s" % agg_func)
+                if not isinstance(field_name, basestring):
+                    raise TypeError("Aggregated field names must be strings")
+                if field_name == COUNT_ALL:
+                    if agg_func != AGG_COUNT:
+                        raise QuerySyntaxError("Only %s can be applied to all entries" % AGG_COUNT)
+                    field_name = None
+                else:
+                    field_name = normalize_field_name(field_name)
+                self.aggregates.append([normalize_field_name(name), agg_func, field_name])
+
+        self.having = having
+        self._check_aggregation()
+
+    def _check_aggregation(self):
+        if self.count and self.is_aggregate():
+            raise QuerySyntaxError("Counting queries cannot group or aggregate entries")
+        if not self.is_aggregate():
+            if self.having is not None:
+                raise QuerySyntaxError("Filtering groups requires the query to group or aggregate entries")
+            return
+
+        if self.select is not None or self.include is not None or self.after is not None:
+            raise QuerySyntaxError("Aggregate queries cannot select fields, include relationships or be paginated")
+        group_fields = self.group_by or []
+        names = [name for name, agg_func, field_name in self.aggregates or []]
+        if len(set(names).intersection(group_fields)) > 0 or len(set(names)) != len(names):
+            raise QuerySyntaxError("Aggregate names must be unique, and distinct from the grouped fields")
+        for field_name in group_fields + [field_name for name, agg_func, field_name in self.aggregates or []]:
+            if field_name is not None and "." in field_name:
+                raise QuerySyntaxError("Only fields of the queried table can be grouped or aggregated: %s" %
+                                       field_name)
+
+        result_names = set(group_fields).union(names)
+        for field_name in [list(ob.keys())[0] for ob in self.order_by]:
+            if field_name not in result_names:
+                raise QuerySyntaxError("Aggregate queries can only be ordered by their grouped fields or aggregates: %s"
+                                       % field_name)
+        if self.having is not None:
+            for field_name in self.having.unique_field_names:
+                if field_name not in result_names:
+                    raise QuerySyntaxError("Groups can only be filtered by their grouped fields or aggregates: %s" %
+                                           field_name)
+
+    def is_aggregate(self):
+        """Whether this query groups or aggregates entries, rather than returning them."""
+        return self.group_by is not None or self.aggregates is not None
+
+    @property
+    def unique_field_names(self):
+        """A frozenset containing the names of all of the fields referenced by this query. Computed on first
+        access."""
+        if self._unique_field_names is None:
+            field_names = self.query_fragment.unique_field_names if self.query_fragment is not None else frozenset()
+            aggregate_names = frozenset([agg[0] for agg in self.aggregates or []])
+            if len(self.order_by) > 0:
+                field_names = field_names.union([
+                    list(ob.keys())[0] for ob in self.order_by if list(ob.keys())[0] not in aggregate_names
+                ])
+            if self.select is not None:
+                field_names = field_names.union(self.select)
+            if self.group_by is not None:
+                field_names = field_names.union(self.group_by)
+            if self.aggregates is not None:
+                field_names = field_names.union([agg[2] for agg in self.aggregates if agg[2] is not None])
+            self._unique_field_names = field_names
+        return self._unique_field_names
+
     def as_dict(self):
         return {
             "table": self.table,
             "query_fragment": self.query_fragment.as_dict() if self.query_fragment is not None else None,
             "order_by": self.order_by,
             "offset": self.offset,
-            "limit": self.limit
+            "limit": self.limit,
+            "after": self.after,
+            "select": self.select,
+            "include": self.include,
+            "group_by": self.group_by,
+            "aggregates": self.aggregates,
+            "having": self.having.as_dict() if self.having is not None else None,
+            "count": self.count
         }
 
     def unpack(self):
         return self.table, self.query_fragment, self.order_by, self.offset, self.limit
 
+    def matches_nothing(self):
+        """Whether this query is known not to match any entries without consulting the database (i.e. its query
+        fragment is a contradiction, as produced by the optimizer)."""
+        return self.query_fragment is not None and self.query_fragment.matches_nothing()
+
+    def with_fragment(self, query_fragment):
+        """Returns a copy of this query, with its query fragment replaced by the given one."""
+        if query_fragment is not None and not isinstance(query_fragment, MLQueryFragment):
+            raise TypeError("Primary query fragment for MLQuery must be of type MLQueryFragment")
+        query = self._copy()
+        query.query_fragment = query_fragment
+        return query
+
+    def with_limit(self, limit):
+        """Returns a copy of this query, with its limit replaced by the given one."""
+        query = self._copy()
+        query.limit = limit
+        return query
+
+    def counting(self):
+        """Returns a copy of this query that only counts the entries matching its "where" clause (e.g. to compute the
+        total number of pages of a paginated query), or the query itself if it's already a counting query."""
+        if self.count:
+            return self
+        if self.is_aggregate():
+            raise QuerySyntaxError("Counting queries cannot group or aggregate entries")
+        query = self._copy()
+        query.count = True
+        return query
+
+    def paginated(self):
+        """Returns a copy of this query whose results are ordered for keyset pagination (see is_paginated()), or the
+        query itself if it already is."""
+        if self.keyset:
+            return self
+        query = self._copy()
+        query.keyset = True
+        return query
+
+    def is_paginated(self):
+        """Whether this query's results are ordered for keyset pagination, i.e. it has a pagination cursor or was
+        returned by paginated(). Their ordering is then made unique through the primary key, and NULLs come first
+        in ascending order (and last in descending order) on all databases, so that cursors identify where the next
+        page starts."""
+        return self.keyset or self._after_values is not None
+
+    def _copy(self):
+        query = MLQuery.__new__(MLQuery)
+        for attr in MLQuery.__slots__:
+            setattr(query, attr, getattr(self, attr))
+        query._unique_field_names = None
+        query._canonical_key = None
+        query._hash = None
+        return query
+
+    def summary(self):
+        """Computes a cheap structural summary of this query for logging purposes: the number of nodes in its
+        query fragment tree, the depth of that tree and the sorted list of field names referenced by the query."""
+        nodes, depth = self.query_fragment.tree_size() if self.query_fragment is not None else (0, 0)
+        return {
+            "nodes": nodes,
+            "depth": depth,
+            "fields": sorted(self.unique_field_names)
+        }
+
     def __repr__(self):
         return json_dumps(self.as_dict(), indent=2)
 
-    def to_sqlalchemy(self, session, tables):
+    def canonical_key(self):
+        """Returns a hashable key describing this query, such that semantically identical queries (differing only in
+        the order of the clauses and sub-fragments of AND/OR fragments, or of the values in IN/NOT IN clauses) have
+        equal keys. Computed on first access, reusing the cached keys of the query's fragments."""
+        if self._canonical_key is None:
+            self._canonical_key = (
+                self.table,
+                self.query_fragment.canonical_key() if self.query_fragment is not None else None,
+                tuple([tuple(ob.items())[0] for ob in self.order_by]),
+                self.offset,
+                self.limit,
+                self.after,
+                tuple(self.select) if self.select is not None else None,
+                frozenset([tuple(i) for i in self.include]) if self.include is not None else None,
+                tuple(self.group_by) if self.group_by is not None else None,
+                frozenset([tuple(agg) for agg in self.aggregates]) if self.aggregates is not None else None,
+                self.having.canonical_key() if self.having is not None else None,
+                self.count,
+                self.keyset
+            )
+        return self._canonical_key
+
+    def __eq__(self, other):
+        return isinstance(other, MLQuery) and hash(self) == hash(other) and \
+            self.canonical_key() == other.canonical_key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self.canonical_key())
+        return self._hash
+
+    def structure_key(self):
+        """Returns a hashable key describing the structure of this query (its table, operators, fields, comparators
+        and ordering), but not the values being compared against."""
+        return (
+            self.table,
+            self.query_fragment.structure_key() if self.query_fragment is not None else None,
+            tuple([tuple(ob.items())[0] for ob in self.order_by]),
+            tuple([value is None for value in self._after_values]) if self._after_values is not None else None,
+            tuple(self.select) if self.select is not None else None,
+            tuple([tuple(i) for i in self.include]) if self.include is not None else None,
+            tuple(self.group_by) if self.group_by is not None else None,
+            tuple([tuple(agg) for agg in self.aggregates]) if self.aggregates is not None else None,
+            self.having.structure_key() if self.having is not None else None,
+            self.count,
+            self.keyset
+        )
+
+    def bind_values(self):
+        """Returns a dictionary of the bind parameter values for this query, named in the same way as the bind
+        parameters generated when compiling the query with a plan cache."""
+        params = []
+        if self.query_fragment is not None:
+            self.query_fragment.bind_values(params)
+        if self._after_values is not None:
+            # NULL cursor values are rendered as IS NULL checks
+            params.extend([value for value in self._after_values if value is not None])
+        if self.having is not None:
+            self.having.bind_values(params)
+        return dict([(bind_param_name(i), value) for i, value in enumerate(params)])
+
+    def to_sqlalchemy(self, session, tables, plan_cache=None, policy=None):
+        """Converts this query into an SQLAlchemy ORM query.
+
+        Args:
+            session: The SQLAlchemy session through which to query the database.
+            tables: A dictionary mapping table names to their SQLAlchemy mapped classes.
+            plan_cache: An optional QueryPlanCache. If supplied, the filter and ordering criteria for this query's
+                structure are compiled once using bind parameters, and reused for all subsequent queries sharing
+                the same structure.
+            policy: An optional QueryPolicy to enforce on this query before converting it.
+
+        Returns:
+            An SQLAlchemy Query object. For counting and aggregate queries, the query returns rows containing the
+            count, or the values of the grouped fields and aggregates (labelled with their names), respectively.
+        """
+        if policy is not None:
+            return policy.enforce(self, tables).to_sqlalchemy(session, tables, plan_cache=plan_cache)
+
+        table = self.resolve_table(tables)
+        if self.count or self.is_aggregate():
+            return self.apply_aggregation(session.query(), table, plan_cache=plan_cache)
+        return self.apply_criteria(session.query(table), table, plan_cache=plan_cache)
+
+    def to_select(self, tables, plan_cache=None, policy=None):
+        """Converts this query into a 2.0-style SQLAlchemy select() statement, which can be executed through either
+        a Session or an AsyncSession.
+
+        Args:
+            tables: A dictionary mapping table names to their SQLAlchemy mapped classes.
+            plan_cache: An optional QueryPlanCache, as for to_sqlalchemy().
+            policy: An optional QueryPolicy to enforce on this query before converting it.
+
+        Returns:
+            An SQLAlchemy Select object.
+        """
+        if policy is not None:
+            return policy.enforce(self, tables).to_select(tables, plan_cache=plan_cache)
+
+        table = self.resolve_table(tables)
+        if self.count or self.is_aggregate():
+            return self.apply_aggregation(select(), table, plan_cache=plan_cache)
+        return self.apply_criteria(select(table), table, plan_cache=plan_cache)
+
+    def resolve_table(self, tables):
         if not isinstance(tables, dict):
             raise TypeError("Supplied tables structure for MLQuery-to-SQLAlchemy query conversion must be a dictionary")
         if self.table not in tables:
             raise InvalidTableError("Table does not exist in tables dictionary: %s" % self.table)
+        return tables[self.table]
 
-        table = tables[self.table]
-        query = session.query(table)
+    def to_core_select(self, tables, fields=None, plan_cache=None, policy=None):
+        """Converts this query into an SQLAlchemy Core select() statement, selecting plain columns rather than mapped
+        objects. The tables dictionary may contain either mapped classes or Table objects.
 
-        logger.debug("Attempting to build SQLAlchemy query for table \"%s\":\n%s" % (self.table, self))
+        Args:
+            tables: A dictionary mapping table names to their SQLAlchemy mapped classes or Table objects.
+            fields: An optional list of the names of the fields to select. Defaults to this query's selected fields,
+                or all of the table's columns if it has none. Each column is labelled with its field name. Ignored
+                for counting and aggregate queries.
+            plan_cache: An optional QueryPlanCache, as for to_sqlalchemy().
+            policy: An optional QueryPolicy to enforce on this query before converting it.
 
-        if self.query_fragment is not None:
-            query = query.filter(self.query_fragment.to_sqlalchemy(table))
-
-        if self.order_by is not None:
-            criteria = []
-            for order_by in self.order_by:
-                field, direction = [i for i in order_by.items()][0]
-                criterion = getattr(table, field)
-                if not isinstance(criterion, QueryableAttribute):
-                    raise InvalidFieldError("Invalid field for specified table: %s" % field)
-
-                if direction == ORDER_ASC:
-                    criterion = criterion.asc()
-                elif direction == ORDER_DESC:
-                    criterion = criterion.desc()
-                criteria.append(criterion)
-            query = query.order_by(*criteria)
+        Returns:
+            An SQLAlchemy Select object.
+        """
+        if policy is not None:
+            return policy.enforce(self, tables).to_core_select(tables, fields=fields, plan_cache=plan_cache)
+
+        table = self.resolve_table(tables)
+        index = get_field_index(table)
+        if index.core_table is not None and index.core_table is not table and \
+                not any(["." in field for field in self.unique_field_names]):
+            # avoid the overhead of ORM-enabled statements where the mapped class' table can be selected directly
+            table = index.core_table
+            index = get_field_index(table)
+        if self.count or self.is_aggregate():
+            return self.apply_aggregation(select(), table, plan_cache=plan_cache)
+        if fields is None:
+            fields = self.select if self.select is not None else index.field_names
+        fields = [index.field_name(normalize_field_name(field)) for field in fields]
+        statement = select(*[index.resolve(field).label(field) for field in fields])
+        return self.apply_criteria(statement, table, plan_cache=plan_cache, load_options=False)
+
+    def apply_criteria(self, query, table, plan_cache=None, load_options=True, params=None):
+        """Applies this query's filter and ordering criteria, offset and limit (and, if load_options is True, its
+        loader options) to the given SQLAlchemy ORM Query or Select statement, selecting from the given mapped class
+        or table. Where no plan cache is used, the clause values can be collected into the given list of params,
+        which allows for statements combining several queries (e.g. through UNION ALL) to share it so that the names
+        of their bind parameters don't clash."""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Attempting to build SQLAlchemy query for table \"%s\":\n%s", self.table, LazyDebugRepr(self)
+            )
+
+        if plan_cache is None:
+            joins, filter_criterion, order_criteria, options = self.compile_criteria(table, params=params)
+            params = None
+        else:
+            key = (table, self.structure_key())
+            plan = plan_cache.get(key)
+            if plan is None:
+                plan = self.compile_criteria(table, params=[])
+                plan_cache.put(key, plan)
+            joins, filter_criterion, order_criteria, options = plan
+            params = self.bind_values()
+
+        for join in joins:
+            query = query.outerjoin(join)
+
+        if load_options and len(options) > 0:
+            query = query.options(*options)
+
+        if filter_criterion is not None:
+            query = query.filter(filter_criterion)
+
+        if len(order_criteria) > 0:
+            query = query.order_by(*order_criteria)
 
         if self.offset is not None:
             query = query.offset(self.offset)
@@ -121,12 +511,241 @@ class MLQuery(object):
         if self.limit is not None:
             query = query.limit(self.limit)
 
+        if params:
+            query = query.params(**params)
+
         return query
 
+    def apply_aggregation(self, query, table, plan_cache=None):
+        """Applies this counting or aggregate query's columns, filter, grouping and ordering criteria, offset and
+        limit to the given SQLAlchemy ORM Query or Select statement (which must not select anything yet), selecting
+        from the given mapped class or table."""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Attempting to build SQLAlchemy aggregate query for table \"%s\":\n%s", self.table, LazyDebugRepr(self)
+            )
+
+        params = None
+        if plan_cache is None:
+            columns, filter_criterion, group_criteria, having_criterion, order_criteria = \
+                self.compile_aggregation(table)
+        else:
+            key = (table, self.structure_key())
+            plan = plan_cache.get(key)
+            if plan is None:
+                plan = self.compile_aggregation(table, params=[])
+                plan_cache.put(key, plan)
+            columns, filter_criterion, group_criteria, having_criterion, order_criteria = plan
+            params = self.bind_values()
+
+        query = query.add_columns(*columns).select_from(table)
+        if filter_criterion is not None:
+            query = query.filter(filter_criterion)
+        if self.count:
+            return query.params(**params) if params else query
+
+        if len(group_criteria) > 0:
+            query = query.group_by(*group_criteria)
+        if having_criterion is not None:
+            query = query.having(having_criterion)
+        if len(order_criteria) > 0:
+            query = query.order_by(*order_criteria)
+        if self.offset is not None:
+            query = query.offset(self.offset)
+        if self.limit is not None:
+            query = query.limit(self.limit)
+        if params:
+            query = query.params(**params)
+        return query
+
+    def compile_aggregation(self, table, params=None):
+        """Builds the list of columns, SQLAlchemy filter criterion, list of grouping criteria, group filter
+        criterion and list of ordering criteria for this counting or aggregate query against the given mapped class
+        or table.
+
+        Args:
+            table: The SQLAlchemy mapped class or table being queried.
+            params: An optional list into which the clause values will be collected, as for compile_criteria().
+
+        Returns:
+            A tuple containing the list of (labelled) columns to select, the filter criterion (or None if there is
+            none), the list of grouping criteria, the group filter criterion (or None) and the list of ordering
+            criteria.
+        """
+        if params is None:
+            params = []
+        filter_criterion = None
+        if self.query_fragment is not None:
+            filter_criterion = self.query_fragment.to_sqlalchemy(table, params=params)
+        if self.count:
+            return [func.count().label("count")], filter_criterion, [], None, []
+
+        index = get_field_index(table)
+        group_criteria = [index.resolve(field) for field in self.group_by or []]
+        columns = dict([(field, col.label(field)) for field, col in zip(self.group_by or [], group_criteria)])
+        for name, agg_func, field in self.aggregates or []:
+            col = index.resolve(field) if field is not None else None
+            if agg_func == AGG_COUNT:
+                aggregate = func.count(col) if col is not None else func.count()
+            elif agg_func == AGG_SUM:
+                aggregate = func.sum(col)
+            elif agg_func == AGG_AVG:
+                aggregate = func.avg(col)
+            elif agg_func == AGG_MIN:
+                aggregate = func.min(col)
+            else:
+                aggregate = func.max(col)
+            columns[name] = aggregate.label(name)
+
+        having_criterion = None
+        if self.having is not None:
+            having_criterion = self.having.to_sqlalchemy(table, params=params, columns=columns)
+
+        order_criteria = []
+        for order_by in self.order_by:
+            field, direction = [i for i in order_by.items()][0]
+            order_criteria.append(columns[field].desc() if direction == ORDER_DESC else columns[field].asc())
+
+        result_names = (self.group_by or []) + [agg[0] for agg in self.aggregates or []]
+        return [columns[name] for name in result_names], filter_criterion, group_criteria, having_criterion, \
+            order_criteria
+
+    def compile_criteria(self, table, params=None):
+        """Builds the list of joins, SQLAlchemy filter criterion, list of ordering criteria and list of loader options
+        for this query against the given mapped class.
+
+        Args:
+            table: The SQLAlchemy mapped class being queried.
+            params: An optional list into which the clause values will be collected. The filter criterion refers to
+                the values through bind parameters named after their index in this list (see bind_param_name()), so
+                that queries sharing the same structure are compiled into the same SQL.
+
+        Returns:
+            A tuple containing the list of relationships to outer join (for ordering by the fields of related entries),
+            the filter criterion (or None if there is none), a list of ordering criteria and a list of loader options.
+        """
+        if params is None:
+            params = []
+        filter_criterion = None
+        if self.query_fragment is not None:
+            filter_criterion = self.query_fragment.to_sqlalchemy(table, params=params)
+
+        fields = get_field_index(table)
+        joins = []
+        # dotted relationship path -> aliased related class joined for that path
+        join_aliases = {}
+        order_columns, order_directions, order_criteria = [], [], []
+        for order_by in self.order_by:
+            field, direction = [i for i in order_by.items()][0]
+            relationships, field_index, field_name = resolve_field_path(table, field)
+            entity, path = table, []
+            for rel in relationships:
+                if rel.uselist:
+                    raise QuerySyntaxError("Cannot order by a field of a collection of related entries: %s" % field)
+                path.append(rel.key)
+                alias = join_aliases.get(".".join(path))
+                if alias is None:
+                    alias = join_aliases[".".join(path)] = aliased(rel.target)
+                    joins.append(getattr(entity, rel.key).of_type(alias))
+                entity = alias
+            criterion = getattr(entity, field_name) if len(relationships) > 0 else field_index.resolve(field_name)
+            order_columns.append(criterion)
+            order_directions.append(direction)
+
+        paginated = self.is_paginated()
+        if paginated and len(order_columns) > 0:
+            # break ties through the primary key, so that the ordering (and thus keyset pagination) is deterministic
+            for field in self.tiebreaker_fields(table):
+                order_columns.append(fields.resolve(field))
+                order_directions.append(ORDER_ASC)
+
+        order_criteria = [
+            order_criterion(col, direction, nullable=paginated and is_nullable(col))
+            for col, direction in zip(order_columns, order_directions)
+        ]
+
+        if self._after_values is not None:
+            if len(self._after_values) != len(order_columns):
+                raise InvalidCursorError("Pagination cursor does not match the query's ordering")
+            values = []
+            for col, value in zip(order_columns, self._after_values):
+                if value is None:
+                    values.append(None)
+                    continue
+                values.append(bindparam(bind_param_name(len(params)), value=value, type_=col.type))
+                params.append(value)
+            seek = seek_criterion(order_columns, order_directions, values)
+            filter_criterion = seek if filter_criterion is None else and_(filter_criterion, seek)
+
+        options = []
+        if self.select is not None and fields.mapped:
+            options.append(load_only(*[fields.resolve(field) for field in self.select]))
+        if self.include is not None:
+            options.extend([
+                loader_option(resolve_relationship_path(table, path), strategy) for path, strategy in self.include
+            ])
+
+        return joins, filter_criterion, order_criteria, options
+
+    def validate(self, tables):
+        """Checks that this query's table exists in the given tables dictionary, and that all of the fields referenced
+        by this query exist in that table, without building an SQLAlchemy query.
+
+        Args:
+            tables: A dictionary mapping table names to their SQLAlchemy mapped classes.
+        """
+        if not isinstance(tables, dict):
+            raise TypeError("Supplied tables structure for MLQuery validation must be a dictionary")
+        if self.table not in tables:
+            raise InvalidTableError("Table does not exist in tables dictionary: %s" % self.table)
+
+        table = tables[self.table]
+        for field in self.unique_field_names:
+            resolve_field_path(table, field)
+        if self.select is not None:
+            fields = get_field_index(table)
+            for field in self.select:
+                fields.field_name(field)
+        if self.include is not None:
+            for path, strategy in self.include:
+                resolve_relationship_path(table, path)
+
+    def tiebreaker_fields(self, table):
+        """Returns the list of the names of the primary key fields of the given mapped class or table by which this
+        query's results are ordered after its own ordering fields, so that entries never tie."""
+        ordered = set([list(ob.keys())[0] for ob in self.order_by])
+        fields = get_field_index(table)
+        return [field for field in fields.primary_key_fields if field not in ordered]
+
+    def cursor_for(self, entry, tables=None):
+        """Generates the pagination cursor with which to fetch the entries that come after the given entry (a result
+        of this query), in terms of this query's ordering. The cursor includes the values of the primary key fields
+        that break ties in the ordering.
+
+        Args:
+            entry: The mapped object (or row) for which to generate the cursor.
+            tables: A dictionary mapping table names to their SQLAlchemy mapped classes or tables. Only required if
+                the entry isn't a mapped object.
+        """
+        if len(self.order_by) == 0:
+            raise QuerySyntaxError("Keyset pagination requires the query to be ordered")
+        if tables is not None:
+            table = self.resolve_table(tables)
+        else:
+            try:
+                table = inspect(entry).mapper.class_
+            except (NoInspectionAvailable, AttributeError):
+                raise TypeError("The tables must be supplied to generate cursors for entries that aren't mapped objects")
+        fields = [list(ob.keys())[0] for ob in self.order_by] + self.tiebreaker_fields(table)
+        return encode_cursor([get_path_value(entry, field) for field in fields])
+
 
 class MLQueryFragment(object):
     """Recursive object to allow for relatively complex data selection queries."""
 
+    __slots__ = ("op", "clauses", "sub_fragments", "_unique_field_names", "_canonical_key", "_hash",
+                 "_structure_key", "_ordered_children")
+
     def __init__(self, op, clauses=None, sub_fragments=None):
         """Constructor.
 
@@ -150,29 +769,67 @@ class MLQueryFragment(object):
         if sub_fragments is None:
             sub_fragments = []
 
-        self.unique_field_names = set()
-
         for clause in clauses:
             if not isinstance(clause, MLClause):
                 raise TypeError("All clauses within an MLQueryFragment must be of type MLClause")
-            self.unique_field_names.add(clause.field)
 
         for sub_frag in sub_fragments:
             if not isinstance(sub_frag, MLQueryFragment):
                 raise TypeError("All sub-fragments within an MLQueryFragment must be of type MLQueryFragment")
 
-            self.unique_field_names = self.unique_field_names.union(sub_frag.unique_field_names)
-
         if op == OP_NOT and (len(clauses) + len(sub_fragments)) > 1:
             raise QuerySyntaxError("NOT operations can only contain a single clause or sub-query fragment")
 
         self.op = op
         self.clauses = clauses
         self.sub_fragments = sub_fragments
+        self._unique_field_names = None
+        self._canonical_key = None
+        self._hash = None
+        self._structure_key = None
+        self._ordered_children = None
+
+    @classmethod
+    def _from_parts(cls, op, clauses, sub_fragments):
+        """Internal constructor that skips validation, for building fragments from parts that are already known to
+        be valid (e.g. when simplifying an existing fragment)."""
+        frag = cls.__new__(cls)
+        frag.op = op
+        frag.clauses = clauses
+        frag.sub_fragments = sub_fragments
+        frag._unique_field_names = None
+        frag._canonical_key = None
+        frag._hash = None
+        frag._structure_key = None
+        frag._ordered_children = None
+        return frag
+
+    @property
+    def unique_field_names(self):
+        """A frozenset containing the names of all of the fields referenced by this fragment and its sub-fragments.
+        Computed on first access, and shared with the sub-fragment where this fragment only wraps one."""
+        if self._unique_field_names is None:
+            if len(self.clauses) == 0 and len(self.sub_fragments) == 1:
+                field_names = self.sub_fragments[0].unique_field_names
+            else:
+                field_names = frozenset([clause.field for clause in self.clauses])
+                for sub_frag in self.sub_fragments:
+                    field_names = field_names.union(sub_frag.unique_field_names)
+            self._unique_field_names = field_names
+        return self._unique_field_names
 
     def unpack(self):
         return self.op, self.clauses, self.sub_fragments
 
+    def matches_nothing(self):
+        """Whether this fragment is an empty OR fragment, which never matches any entries."""
+        return self.op == OP_OR and len(self.clauses) == 0 and len(self.sub_fragments) == 0
+
+    def tree_size(self):
+        """Returns a tuple containing the number of nodes (fragments and clauses) in this fragment's tree, and the
+        depth of the tree (see fragment_size())."""
+        return fragment_size(len(self.clauses), [sub_frag.tree_size() for sub_frag in self.sub_fragments])
+
     def as_dict(self):
         return {
             "op": self.op,
@@ -183,17 +840,52 @@ class MLQueryFragment(object):
     def __repr__(self):
         return json_dumps(self.as_dict(), indent=2)
 
+    def canonical_key(self):
+        """Returns a hashable key describing this fragment, in which the clauses and sub-fragments of AND/OR
+        fragments are treated as unordered sets. Computed on first access, reusing the cached keys of the fragment's
+        clauses and sub-fragments."""
+        if self._canonical_key is None:
+            keys = [clause.canonical_key() for clause in self.clauses]
+            keys.extend([sub_frag.canonical_key() for sub_frag in self.sub_fragments])
+            self._canonical_key = (self.op, tuple(keys) if self.op == OP_NOT else frozenset(keys))
+        return self._canonical_key
+
+    def __eq__(self, other):
+        return isinstance(other, MLQueryFragment) and hash(self) == hash(other) and \
+            self.canonical_key() == other.canonical_key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self.canonical_key())
+        return self._hash
+
     def simplify(self):
+        """Simplifies this fragment by collapsing single-clause AND fragments into their clause, and fragments
+        containing only a single sub-fragment into that sub-fragment.
+
+        Returns:
+            Either an MLClause or an MLQueryFragment. If nothing in this fragment's tree can be simplified, the
+            fragment itself is returned.
+        """
         op = self.op
-        clauses = [clause for clause in self.clauses]
+        clauses = self.clauses
         sub_fragments = []
+        changed = False
 
         for sub_fragment in self.sub_fragments:
             s = sub_fragment.simplify()
             if isinstance(s, MLClause):
+                # copy this fragment's clauses before adding to them, as the fragment itself mustn't be modified
+                if clauses is self.clauses:
+                    clauses = list(clauses)
                 clauses.append(s)
+                changed = True
             elif isinstance(s, MLQueryFragment):
                 sub_fragments.append(s)
+                changed = changed or (s is not sub_fragment)
 
         # if this query fragment is only made up of a single clause
         if len(clauses) == 1 and len(sub_fragments) == 0 and op == OP_AND:
@@ -202,13 +894,64 @@ class MLQueryFragment(object):
         # if this query fragment is just a single sub-fragment, collapse its properties into the simplified
         # fragment we're currently generating
         if len(clauses) == 0 and len(sub_fragments) == 1:
-            op, clauses, sub_fragments = sub_fragments[0].unpack()
+            return sub_fragments[0]
+
+        if not changed:
+            return self
 
-        return MLQueryFragment(op, clauses=clauses, sub_fragments=sub_fragments)
+        return MLQueryFragment._from_parts(op, clauses, sub_fragments)
+
+    def ordered_children(self):
+        """Returns a tuple containing this fragment's clauses and sub-fragments, each sorted by their structure, so
+        that fragments differing only in the order of their clauses are compiled into the same SQL. Clauses and
+        sub-fragments sharing the same structure keep their original order."""
+        if self._ordered_children is None:
+            self._ordered_children = (
+                sorted(self.clauses, key=clause_order_key),
+                sorted(self.sub_fragments, key=lambda sub_frag: repr(sub_frag.structure_key()))
+            )
+        return self._ordered_children
+
+    def structure_key(self):
+        """Returns a hashable key describing the structure of this fragment (its operators, fields and comparators),
+        but not the values being compared against. Independent of the order of the fragment's clauses and
+        sub-fragments."""
+        if self._structure_key is None:
+            clauses, sub_fragments = self.ordered_children()
+            self._structure_key = (
+                self.op,
+                tuple([clause.structure_key() for clause in clauses]),
+                tuple([sub_frag.structure_key() for sub_frag in sub_fragments])
+            )
+        return self._structure_key
+
+    def bind_values(self, params):
+        """Appends the values of all of the clauses in this fragment to the given list, in the same order in which
+        they are bound by to_sqlalchemy()."""
+        clauses, sub_fragments = self.ordered_children()
+        for clause in clauses:
+            clause.bind_values(params)
+        for sub_frag in sub_fragments:
+            sub_frag.bind_values(params)
 
-    def to_sqlalchemy(self, table):
-        filter_criteria = [clause.to_sqlalchemy(table) for clause in self.clauses]
-        filter_criteria.extend([sub_frag.to_sqlalchemy(table) for sub_frag in self.sub_fragments])
+    def to_sqlalchemy(self, table, params=None, columns=None):
+        """Builds the SQLAlchemy criterion for this fragment against the given mapped class or table. If a dictionary
+        of columns is given, field names are resolved through it instead (e.g. to refer to labelled aggregates).
+
+        Clause values are supplied through bind parameters named after their index in the given list of parameters
+        (to which they are appended), and the clauses and sub-fragments are rendered in the order given by
+        ordered_children(), so that fragments sharing the same structure are always compiled into the same SQL."""
+        if params is None:
+            params = []
+        clauses, sub_fragments = self.ordered_children()
+        filter_criteria = [clause.to_sqlalchemy(table, params=params, columns=columns) for clause in clauses]
+        filter_criteria.extend([
+            sub_frag.to_sqlalchemy(table, params=params, columns=columns) for sub_frag in sub_fragments
+        ])
+
+        # empty AND/OR fragments are always true/false respectively
+        if len(filter_criteria) == 0 and self.op != OP_NOT:
+            return false() if self.op == OP_OR else true()
 
         if self.op == OP_OR:
             return or_(*filter_criteria)
@@ -221,6 +964,8 @@ class MLQueryFragment(object):
 class MLClause(object):
     """A single clause in an MLQuery object."""
 
+    __slots__ = ("field", "comp", "value", "_canonical_key")
+
     def __init__(self, field, comp, value):
         """Constructor.
 
@@ -236,14 +981,21 @@ class MLClause(object):
             raise TypeError("Clause field names must be strings")
 
         # ensure field name is in snake_case
-        if is_kebabcase_string(field):
-            field = kebabcase_to_snakecase(field)
-        elif is_camelcase_string(field):
-            field = camelcase_to_snakecase(field)
-
-        self.field = field
+        self.field = normalize_field_name(field)
         self.comp = comp
         self.value = value
+        self._canonical_key = None
+
+    @classmethod
+    def _from_parts(cls, field, comp, value):
+        """Internal constructor that skips validation and field name normalization, for building clauses from parts
+        that are already known to be valid."""
+        clause = cls.__new__(cls)
+        clause.field = field
+        clause.comp = comp
+        clause.value = value
+        clause._canonical_key = None
+        return clause
 
     def as_dict(self):
         return {
@@ -255,35 +1007,151 @@ class MLClause(object):
     def unpack(self):
         return self.field, self.comp, self.value
 
+    def canonical_key(self):
+        """Returns a hashable key describing this clause, in which the values of IN/NOT IN clauses are treated as
+        unordered sets."""
+        if self._canonical_key is None:
+            value = self.value
+            if self.comp in {COMP_IN, COMP_NIN} and isinstance(value, (list, tuple, set, frozenset)):
+                value = frozenset([canonical_value(item) for item in value])
+            else:
+                value = canonical_value(value)
+            self._canonical_key = (self.field, self.comp, value)
+        return self._canonical_key
+
+    def __eq__(self, other):
+        return isinstance(other, MLClause) and self.canonical_key() == other.canonical_key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.canonical_key())
+
     def __repr__(self):
         return json_dumps(self.as_dict(), indent=2)
 
-    def to_sqlalchemy(self, table):
-        col = getattr(table, self.field)
-        # make sure it's the right kind of field
-        if not isinstance(col, QueryableAttribute):
-            raise InvalidFieldError("Invalid field for specified table: %s" % self.field)
+    def uses_is_operator(self):
+        """Whether or not this clause is rendered through SQL's IS/IS NOT operators: IS comparisons, as well as
+        equality comparisons against None (rendered as IS NULL/IS NOT NULL). Such comparisons are never NULL."""
+        return self.comp == COMP_IS or (self.value is None and self.comp in {COMP_EQ, COMP_NEQ})
+
+    def is_bindable(self):
+        """Whether or not this clause's value can be supplied through a bind parameter. The values of comparisons
+        using the IS operator need to be rendered directly into the SQL, and thus form part of the query's structure:
+        binding None would render an equality comparison as "= NULL", matching nothing."""
+        return not self.uses_is_operator()
+
+    def structure_key(self):
+        if self.is_bindable():
+            return self.field, self.comp
+        return self.field, self.comp, self.value
+
+    def bind_values(self, params):
+        if self.is_bindable():
+            params.append(self.value)
+
+    def to_sqlalchemy(self, table, params=None, columns=None):
+        if params is None:
+            params = []
+        if columns is not None:
+            return self.compare(columns[self.field], params)
+        if "." not in self.field:
+            return self.compare(get_field_index(table).resolve(self.field), params)
+
+        # filter on a field of related entries through EXISTS subqueries, from the innermost relationship outwards
+        relationships, index, field_name = resolve_field_path(table, self.field)
+        criterion = self.compare(index.resolve(field_name), params)
+        for rel in reversed(relationships):
+            criterion = rel.attr.any(criterion) if rel.uselist else rel.attr.has(criterion)
+        return criterion
+
+    def compare(self, col, params):
+        value = self.value
+        if self.is_bindable():
+            expanding = self.comp in {COMP_IN, COMP_NIN}
+            if expanding and isinstance(value, (set, frozenset)):
+                value = list(value)
+            value = bindparam(bind_param_name(len(params)), value=value, type_=col.type, expanding=expanding)
+            params.append(self.value)
 
         if self.comp == COMP_EQ:
-            return col == self.value
+            return col == value
         elif self.comp == COMP_GT:
-            return col > self.value
+            return col > value
         elif self.comp == COMP_GTE:
-            return col >= self.value
+            return col >= value
         elif self.comp == COMP_LT:
-            return col < self.value
+            return col < value
         elif self.comp == COMP_LTE:
-            return col <= self.value
+            return col <= value
         elif self.comp == COMP_NEQ:
-            return col != self.value
+            return col != value
         elif self.comp == COMP_LIKE:
-            return col.like(self.value)
+            return col.like(value)
         elif self.comp == COMP_IN:
-            return col.in_(self.value)
+            return col.in_(value)
         elif self.comp == COMP_NIN:
-            return ~col.in_(self.value)
+            return ~col.in_(value)
         elif self.comp == COMP_IS:
-            return col.is_(self.value)
+            return col.is_(value)
 
         # default to equals
-        return col == self.value
+        return col == value
+
+
+def get_path_value(entry, field):
+    """Returns the value of the given (possibly dotted) field of the given entry, or None if one of the related
+    entries along the way is missing."""
+    for part in field.split("."):
+        if entry is None:
+            return None
+        entry = getattr(entry, part)
+    return entry
+
+
+def loader_option(relationships, strategy=None):
+    """Builds the loader option with which to eagerly load the related entries along the given list of relationships
+    (RelationshipInfo objects). The given strategy applies to the last relationship; the others are loaded through
+    SELECT ... IN queries if they're collections, or through joins otherwise."""
+    option = None
+    for i, rel in enumerate(relationships):
+        rel_strategy = strategy if (i == len(relationships) - 1 and strategy is not None) else \
+            (LOAD_SELECTIN if rel.uselist else LOAD_JOINED)
+        if option is None:
+            option = (selectinload if rel_strategy == LOAD_SELECTIN else joinedload)(rel.attr)
+        elif rel_strategy == LOAD_SELECTIN:
+            option = option.selectinload(rel.attr)
+        else:
+            option = option.joinedload(rel.attr)
+    return option
+
+
+def canonical_value(value):
+    """Converts the given clause value into a hashable equivalent. Booleans are tagged, so as not to be considered
+    equal to the integers 0 and 1."""
+    if isinstance(value, bool):
+        return bool, value
+    elif isinstance(value, (list, tuple)):
+        return tuple([canonical_value(item) for item in value])
+    elif isinstance(value, dict):
+        return frozenset([(k, canonical_value(v)) for k, v in value.items()])
+    elif isinstance(value, (set, frozenset)):
+        return frozenset([canonical_value(item) for item in value])
+    return value
+
+
+def clause_order_key(clause):
+    """The key by which clauses are sorted when compiling fragments. The values of clauses that can't be bound are
+    rendered into the SQL, so they're taken into account as well."""
+    return clause.field, clause.comp, "" if clause.is_bindable() else repr(clause.value)
+
+
+def bind_param_name(index):
+    """Generates the name of the bind parameter for the clause value at the given (zero-based) index."""
+    return "mlq_%d" % index
+
+
+def is_non_negative_int(value):
+    # booleans are integers as well, but True and False are no sensible offsets or limits
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
@@ -17,7 +17,10 @@ class MLAlchemyTestCase(unittest.TestCase):
     def assertQueryEquals(self, src, q):
         self.assertIsInstance(q, MLQuery)
         self.assertEqual(src.table, q.table)
-        self.assertQueryFragmentEquals(src.query_fragment, q.query_fragment)
+        if src.query_fragment is None:
+            self.assertIsNone(q.query_fragment)
+        else:
+            self.assertQueryFragmentEquals(src.query_fragment, q.query_fragment)
         self.assertEqual(src.order_by, q.order_by)
         self.assertEqual(src.offset, q.offset)
         self.assertEqual(src.limit, q.limit)
@@ -6,13 +6,38 @@ from datetime import date, datetime
 import json
 import re
 
+from mlalchemy.constants import *
+from mlalchemy.cache import LRUCache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
 __all__ = [
     "is_camelcase_string",
     "is_kebabcase_string",
     "camelcase_to_snakecase",
     "kebabcase_to_snakecase",
+    "normalize_field_name",
+    "field_name_cache",
+    "set_field_name_cache_size",
     "json_date_serializer",
-    "json_dumps"
+    "like_to_regex",
+    "json_dumps",
+    "json_loads",
+    "available_json_backends",
+    "set_json_backend",
+    "get_json_backend",
+    "set_debug_log_format",
+    "get_debug_log_format",
+    "fragment_size",
+    "LazyDebugRepr"
 ]
 
 KEBABCASE_DETECT_RE = re.compile(r"^(([a-z][a-z0-9]+)\-)*([a-z][a-z0-9]+)$")
@@ -42,11 +67,167 @@ def kebabcase_to_snakecase(s):
     return KEBABCASE_REPLACE_RE.sub(r"\1_", s)
 
 
+# Cache of field names already converted by normalize_field_name(), as clients generally use a small, fixed set of
+# field names
+field_name_cache = LRUCache(max_size=1024)
+
+
+def normalize_field_name(s):
+    """Converts the given field name from camelCase or kebab-case to snake_case. Results are cached in
+    field_name_cache."""
+    normalized = field_name_cache.get(s)
+    if normalized is None:
+        normalized = convert_field_name(s)
+        field_name_cache.put(s, normalized)
+    return normalized
+
+
+def convert_field_name(s):
+    """Uncached version of normalize_field_name()."""
+    if "." in s:
+        # dotted paths through relationships
+        return ".".join([convert_field_name(part) for part in s.split(".")])
+    if is_kebabcase_string(s):
+        return kebabcase_to_snakecase(s)
+    elif is_camelcase_string(s):
+        return camelcase_to_snakecase(s)
+    return s
+
+
+def like_to_regex(pattern):
+    """Compiles the given SQL LIKE pattern (in which "%" matches any sequence of characters and "_" any single
+    character) into a regular expression matching entire strings. Matching is case-sensitive, as in most databases
+    (but unlike SQLite's LIKE for ASCII characters)."""
+    parts = []
+    for c in pattern:
+        if c == "%":
+            parts.append(".*")
+        elif c == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(c))
+    return re.compile("".join(parts) + r"\Z", re.DOTALL)
+
+
+def set_field_name_cache_size(max_size):
+    """Sets the maximum number of field names for which to cache normalize_field_name() results."""
+    field_name_cache.resize(max_size)
+
+
 def json_date_serializer(obj):
     if isinstance(obj, (date, datetime)):
         return obj.isoformat()
     raise TypeError("Type not serializable")
 
 
+def available_json_backends():
+    """Returns the list of the JSON backends that are installed, in order of preference."""
+    modules = {JSON_BACKEND_ORJSON: orjson, JSON_BACKEND_UJSON: ujson, JSON_BACKEND_STDLIB: json}
+    return [backend for backend in JSON_BACKENDS if modules[backend] is not None]
+
+
+_json_backend = available_json_backends()[0]
+
+
+def set_json_backend(backend):
+    """Selects the library used by json_loads() and json_dumps(). By default, the fastest of the installed backends
+    is used (orjson, then ujson, then Python's built-in json module).
+
+    Args:
+        backend: One of JSON_BACKEND_ORJSON, JSON_BACKEND_UJSON or JSON_BACKEND_STDLIB.
+    """
+    global _json_backend
+    if backend not in available_json_backends():
+        raise ValueError("JSON backend is not supported or not installed: %s" % backend)
+    _json_backend = backend
+
+
+def get_json_backend():
+    return _json_backend
+
+
+def json_loads(content):
+    """Decodes the given JSON content using the selected JSON backend.
+
+    Args:
+        content: A string, or a bytes, bytearray or memoryview object containing UTF-8 encoded JSON content.
+    """
+    if _json_backend == JSON_BACKEND_ORJSON:
+        return orjson.loads(content)
+    if isinstance(content, (bytearray, memoryview)):
+        content = bytes(content)
+    if _json_backend == JSON_BACKEND_UJSON:
+        return ujson.loads(content)
+    if isinstance(content, bytes):
+        content = content.decode("utf-8")
+    return json.loads(content)
+
+
 def json_dumps(obj, indent=None):
+    """Encodes the given object as a JSON string using the selected JSON backend, serializing dates and datetimes in
+    ISO 8601 format."""
+    if _json_backend == JSON_BACKEND_ORJSON and indent in {None, 2}:
+        option = orjson.OPT_INDENT_2 if indent == 2 else 0
+        return orjson.dumps(obj, default=json_date_serializer, option=option).decode("utf-8")
+    if _json_backend == JSON_BACKEND_UJSON:
+        return ujson.dumps(obj, indent=indent or 0, default=json_date_serializer)
     return json.dumps(obj, indent=indent, default=json_date_serializer)
+
+
+_debug_log_format = DEBUG_LOG_FULL
+
+
+def set_debug_log_format(fmt):
+    """Configures how queries are rendered in MLAlchemy's debug log messages.
+
+    Args:
+        fmt: Either DEBUG_LOG_FULL (the default), which logs a complete JSON dump of each query, or
+            DEBUG_LOG_SUMMARY, which only logs a cheap structural summary (node count, depth and field names).
+            Raw query dictionaries are then only summarized once they have been parsed.
+    """
+    global _debug_log_format
+    if fmt not in DEBUG_LOG_FORMATS:
+        raise ValueError("Invalid debug log format: %s" % fmt)
+    _debug_log_format = fmt
+
+
+def get_debug_log_format():
+    return _debug_log_format
+
+
+def fragment_size(clause_count, sub_fragment_sizes):
+    """Computes the size of a query fragment tree, in which fragments and clauses each count as a node, and clauses
+    are one level deeper than the fragment containing them.
+
+    Args:
+        clause_count: The number of clauses in the tree's root fragment.
+        sub_fragment_sizes: The sizes of the root fragment's sub-fragments, as computed by this function.
+
+    Returns:
+        A tuple containing the number of nodes in the tree and its depth.
+    """
+    nodes, depth = 1 + clause_count, 2 if clause_count > 0 else 1
+    for sub_nodes, sub_depth in sub_fragment_sizes:
+        nodes += sub_nodes
+        depth = max(depth, sub_depth + 1)
+    return nodes, depth
+
+
+class LazyDebugRepr(object):
+    """Wraps a query (either a raw query dictionary or one of the MLAlchemy query structures) for use as a logging
+    argument, such that it is only rendered if the log message is actually emitted. Only the query structures can be
+    rendered as a summary."""
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        if _debug_log_format == DEBUG_LOG_SUMMARY and hasattr(self.obj, "summary"):
+            return "nodes=%(nodes)d, depth=%(depth)d, fields=%(fields)s" % self.obj.summary()
+        if hasattr(self.obj, "as_dict"):
+            return json_dumps(self.obj.as_dict(), indent=2)
+        return json_dumps(self.obj, indent=2)
+
+    __repr__ = __str__
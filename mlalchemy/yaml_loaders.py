@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import yaml
+from yaml.constructor import SafeConstructor
+
+__all__ = [
+    "LIBYAML_AVAILABLE",
+    "RestrictedSafeLoader",
+    "RestrictedCSafeLoader",
+    "DEFAULT_YAML_LOADER",
+    "available_yaml_loaders"
+]
+
+LIBYAML_AVAILABLE = getattr(yaml, "__with_libyaml__", False)
+
+# The only YAML types that can be used in MLAlchemy queries
+ALLOWED_YAML_TAGS = {
+    "tag:yaml.org,2002:null",
+    "tag:yaml.org,2002:bool",
+    "tag:yaml.org,2002:int",
+    "tag:yaml.org,2002:float",
+    "tag:yaml.org,2002:str",
+    "tag:yaml.org,2002:timestamp",
+    "tag:yaml.org,2002:seq",
+    "tag:yaml.org,2002:map"
+}
+
+# The safe constructors for the allowed tags. The None entry handles all other tags by raising a ConstructorError.
+RESTRICTED_YAML_CONSTRUCTORS = dict([
+    (tag, constructor) for tag, constructor in SafeConstructor.yaml_constructors.items()
+    if tag is None or tag in ALLOWED_YAML_TAGS
+])
+
+
+class RestrictedSafeLoader(yaml.SafeLoader):
+    """Pure-Python safe YAML loader that only constructs the types that MLAlchemy queries can contain (null, boolean,
+    integer, float, string, timestamp, sequence and mapping values)."""
+    yaml_constructors = RESTRICTED_YAML_CONSTRUCTORS
+
+
+if LIBYAML_AVAILABLE:
+    class RestrictedCSafeLoader(yaml.CSafeLoader):
+        """libyaml-based equivalent of RestrictedSafeLoader."""
+        yaml_constructors = RESTRICTED_YAML_CONSTRUCTORS
+
+    DEFAULT_YAML_LOADER = yaml.CSafeLoader
+else:
+    RestrictedCSafeLoader = None
+    DEFAULT_YAML_LOADER = yaml.SafeLoader
+
+
+def available_yaml_loaders():
+    """Returns the list of safe YAML loader classes that can be used to parse YAML queries in this environment."""
+    loaders = [yaml.SafeLoader, RestrictedSafeLoader]
+    if LIBYAML_AVAILABLE:
+        loaders.extend([yaml.CSafeLoader, RestrictedCSafeLoader])
+    return loaders
@@ -32,6 +32,7 @@ setup(
     author_email="connect@thanethomson.com",
     url="https://github.com/thanethomson/MLAlchemy",
     install_requires=[r.strip() for r in read_file("requirements.txt") if len(r.strip()) > 0],
+    python_requires=">=3.7",
     license='MIT',
     packages=["mlalchemy"],
     include_package_data=True,
@@ -42,9 +43,13 @@ setup(
         "Natural Language :: English",
         "Operating System :: POSIX",
         "Operating System :: MacOS",
-        "Programming Language :: Python :: 2.7",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
         "Topic :: Database",
         "Topic :: Utilities",
         "Topic :: Software Development :: Libraries"
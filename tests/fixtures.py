@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import os
+
+from sqlalchemy import create_engine, Column, Integer, String, Date
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from datetime import date
+
+__all__ = [
+    "Base",
+    "User",
+    "TABLES",
+    "DEBUG_LOGGING",
+    "EQUIVALENCE_QUERIES",
+    "create_test_session"
+]
+
+Base = declarative_base()
+
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True)
+    first_name = Column(String)
+    last_name = Column(String)
+    date_of_birth = Column(Date)
+    children = Column(Integer)
+
+
+TABLES = {
+    "User": User
+}
+
+# queries covering all comparators, NULL handling and ordering, whose results are fully determined by their
+# ordering, so that the results of in-memory evaluation can be compared with those of SQLite
+EQUIVALENCE_QUERIES = [
+    {"from": "User"},
+    {"from": "User", "where": {"firstName": "Michael"}},
+    {"from": "User", "where": {"$gt": {"children": 1}}, "orderBy": ["-children", "id"]},
+    {"from": "User", "where": {"$lte": {"dateOfBirth": date(1985, 2, 3)}}, "orderBy": "dateOfBirth"},
+    {"from": "User", "where": {"$neq": {"lastName": "Michaels"}}},
+    {"from": "User", "where": {"$not": {"lastName": "Michaels"}}},
+    {"from": "User", "where": {"lastName": None}},
+    {"from": "User", "where": {"$neq": {"lastName": None}}},
+    {"from": "User", "where": {"$is": {"lastName": None}}},
+    {"from": "User", "where": {"$like": {"lastName": "Mich%"}}},
+    {"from": "User", "where": {"$like": {"firstName": "%a_"}}},
+    {"from": "User", "where": {"$like": {"firstName": "_a%"}}},
+    {"from": "User", "where": {"$in": {"lastName": ["Anderson", "Michaels"]}}},
+    {"from": "User", "where": {"$nin": {"lastName": ["Anderson"]}}},
+    {"from": "User", "where": {"$in": {"children": [0, 3]}}},
+    {"from": "User", "where": {"$nin": {"children": [0, 3]}}},
+    {"from": "User", "where": {"$or": [{"lastName": "Anderson"}, {"$gte": {"children": 3}}]}},
+    {"from": "User", "where": {"$not": {"$or": [{"lastName": "Anderson"}, {"children": 2}]}}},
+    {"from": "User", "where": {"$or": [{"$not": {"lastName": "Anderson"}}, {"children": 2}]}},
+    {"from": "User", "orderBy": "lastName"},
+    {"from": "User", "orderBy": ["-lastName", "-firstName"]},
+    {"from": "User", "orderBy": ["-children", "-dateOfBirth"], "offset": 1, "limit": 2},
+    {"from": "User", "orderBy": "id", "offset": 3}
+]
+
+DEBUG_LOGGING = (os.environ.get("DEBUG", False) == "True")
+
+
+def create_test_session():
+    """Creates an in-memory SQLite database containing the standard set of test users, and returns a session
+    connected to it."""
+    engine = create_engine("sqlite:///:memory:", echo=DEBUG_LOGGING)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        User(first_name="Michael", last_name="Anderson", date_of_birth=date(1980, 1, 1), children=0),
+        User(first_name="James", last_name="Michaels", date_of_birth=date(1976, 10, 23), children=2),
+        User(first_name="Andrew", last_name="Michaels", date_of_birth=date(1988, 8, 12), children=3),
+        User(first_name="Gary", last_name=None, date_of_birth=date(1985, 2, 3), children=2)
+    ])
+    session.commit()
+    return session
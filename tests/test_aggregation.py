@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from datetime import date
+
+from mlalchemy import *
+from tests.fixtures import *
+
+CORE_TABLES = {"User": User.__table__}
+
+GROUPED_QUERY = {
+    "from": "User",
+    "groupBy": "lastName",
+    "aggregate": {
+        "users": {"$count": "*"},
+        "totalChildren": {"$sum": "children"},
+        "oldest": {"$min": "dateOfBirth"}
+    },
+    "orderBy": "-totalChildren"
+}
+
+
+class TestAggregation(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.connection = self.session.connection()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_parsing(self):
+        query = parse_query(GROUPED_QUERY, tables=TABLES)
+        self.assertTrue(query.is_aggregate())
+        self.assertEqual(["last_name"], query.group_by)
+        self.assertEqual([
+            ["oldest", AGG_MIN, "date_of_birth"],
+            ["total_children", AGG_SUM, "children"],
+            ["users", AGG_COUNT, None]
+        ], query.aggregates)
+        # aggregate names aren't fields of the table
+        self.assertEqual({"last_name", "children", "date_of_birth"}, query.unique_field_names)
+
+    def test_group_by(self):
+        for tables in [TABLES, CORE_TABLES]:
+            results = execute_aggregate(parse_query(GROUPED_QUERY), self.connection, tables)
+            self.assertEqual([
+                {"last_name": "Michaels", "users": 2, "total_children": 5, "oldest": date(1976, 10, 23)},
+                {"last_name": None, "users": 1, "total_children": 2, "oldest": date(1985, 2, 3)},
+                {"last_name": "Anderson", "users": 1, "total_children": 0, "oldest": date(1980, 1, 1)}
+            ], [dict(row) for row in results])
+
+    def test_orm_query(self):
+        query = parse_query(dict(GROUPED_QUERY, limit=1))
+        self.assertEqual([("Michaels", date(1976, 10, 23), 5, 2)], [
+            tuple(row) for row in query.to_sqlalchemy(self.session, TABLES).all()
+        ])
+
+    def test_having(self):
+        query = parse_query({
+            "from": "User",
+            "where": {"$gt": {"children": 0}},
+            "groupBy": ["lastName"],
+            "aggregate": {"users": {"$count": "id"}, "avgChildren": {"$avg": "children"}},
+            "having": {"$gt": {"users": 1}}
+        })
+        self.assertEqual([{"last_name": "Michaels", "users": 2, "avg_children": 2.5}],
+                         [dict(row) for row in execute_aggregate(query, self.session, TABLES)])
+
+    def test_aggregates_without_grouping(self):
+        query = parse_query({"from": "User", "aggregate": {
+            "most": {"$max": "children"}, "total": {"$sum": "children"}
+        }})
+        self.assertEqual([{"most": 3, "total": 7}],
+                         [dict(row) for row in execute_aggregate(query, self.connection, CORE_TABLES)])
+
+    def test_count(self):
+        query = parse_query({"from": "User", "where": {"$gte": {"children": 2}}, "orderBy": "id", "limit": 1,
+                             "count": True})
+        self.assertEqual(3, execute_aggregate(query, self.connection, TABLES))
+        self.assertEqual(3, query.to_sqlalchemy(self.session, TABLES).scalar())
+        sql = str(query.to_select(TABLES))
+        self.assertNotIn("ORDER BY", sql)
+        self.assertNotIn("LIMIT", sql)
+
+    def test_count_results(self):
+        query = parse_query({"from": "User", "where": {"lastName": "Michaels"}, "orderBy": "id", "limit": 1,
+                             "offset": 1})
+        for tables in [TABLES, CORE_TABLES]:
+            self.assertEqual(2, count_results(query, self.connection, tables))
+        self.assertEqual(4, count_results(parse_query({"from": "User"}), self.connection, TABLES))
+        self.assertEqual(0, count_results(parse_query({"from": "User", "where": {"$or": [
+            {"children": 1}, {"children": 2}
+        ], "children": 3}}, optimize=True), self.connection, TABLES))
+        # paginated queries are counted without their cursor
+        paginated = parse_query({"from": "User", "orderBy": "id", "after": encode_cursor([2])})
+        self.assertEqual(4, count_results(paginated, self.connection, TABLES))
+
+    def test_plan_cache(self):
+        plan_cache = QueryPlanCache()
+        for minimum, expected in [(0, ["Michaels", "Anderson"]), (1, ["Michaels"]), (0, ["Michaels", "Anderson"])]:
+            query = parse_query({"from": "User", "where": {"$like": {"lastName": "%"}}, "groupBy": "lastName",
+                                 "aggregate": {"users": {"$count": "*"}}, "having": {"$gt": {"users": minimum}},
+                                 "orderBy": "-users"})
+            self.assertEqual(expected, [
+                row["last_name"] for row in execute_aggregate(query, self.connection, TABLES, plan_cache=plan_cache)
+            ])
+        self.assertEqual(1, len(plan_cache))
+
+    def test_invalid_queries(self):
+        for qd in [
+            dict(GROUPED_QUERY, aggregate={"total": {"$median": "children"}}),
+            dict(GROUPED_QUERY, aggregate={"total": {"$sum": "*"}}),
+            dict(GROUPED_QUERY, aggregate={"total": {"$sum": "children", "$max": "children"}}),
+            dict(GROUPED_QUERY, aggregate={"lastName": {"$count": "*"}}),
+            dict(GROUPED_QUERY, orderBy="id"),
+            dict(GROUPED_QUERY, select=["id"]),
+            dict(GROUPED_QUERY, having={"firstName": "Michael"}),
+            dict(GROUPED_QUERY, count=True),
+            {"from": "User", "having": {"$gt": {"children": 1}}}
+        ]:
+            with self.assertRaises(QuerySyntaxError):
+                parse_query(qd)
+        with self.assertRaises(InvalidFieldError):
+            parse_query(dict(GROUPED_QUERY, groupBy="nickname"), tables=TABLES)
+        with self.assertRaises(QuerySyntaxError):
+            execute_aggregate(parse_query({"from": "User"}), self.connection, TABLES)
+        with self.assertRaises(QuerySyntaxError):
+            list(stream_query(parse_query(GROUPED_QUERY), self.session, TABLES))
+
+    def test_serialization(self):
+        for qd in [
+            dict(GROUPED_QUERY, having={"$gte": {"users": 1}}),
+            {"from": "User", "where": {"children": 2}, "count": True}
+        ]:
+            query = parse_query(qd)
+            decoded = loads_query(dumps_query(query))
+            self.assertEqual(query, decoded)
+            self.assertEqual(repr(query), repr(decoded))
+
+    def test_structural_hashing(self):
+        query = parse_query(GROUPED_QUERY)
+        self.assertEqual(query, parse_query(dict(GROUPED_QUERY, aggregate=dict(reversed(
+            list(GROUPED_QUERY["aggregate"].items())
+        )))))
+        self.assertNotEqual(query, parse_query(dict(GROUPED_QUERY, groupBy="firstName")))
+        self.assertNotEqual(parse_query({"from": "User"}), parse_query({"from": "User", "count": True}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import asyncio
+import unittest
+
+from datetime import date
+
+from mlalchemy import *
+from tests.fixtures import *
+
+try:
+    import aiosqlite
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.pool import StaticPool
+    from mlalchemy.aio import execute_async, stream_async
+    ASYNC_SQLITE_AVAILABLE = True
+except ImportError:
+    ASYNC_SQLITE_AVAILABLE = False
+
+ORDERED_QUERY = {"from": "User", "where": {"$gte": {"children": 2}}, "orderBy": "-dateOfBirth"}
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def collect(agen):
+    return [item async for item in agen]
+
+
+@unittest.skipUnless(ASYNC_SQLITE_AVAILABLE, "aiosqlite is not installed")
+class TestAsyncExecution(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        run(self.populate())
+
+    def tearDown(self):
+        run(self.dispose())
+
+    async def populate(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(self.engine) as session:
+            session.add_all([
+                User(first_name="Michael", last_name="Anderson", date_of_birth=date(1980, 1, 1), children=0),
+                User(first_name="James", last_name="Michaels", date_of_birth=date(1976, 10, 23), children=2),
+                User(first_name="Andrew", last_name="Michaels", date_of_birth=date(1988, 8, 12), children=3),
+                User(first_name="Gary", last_name=None, date_of_birth=date(1985, 2, 3), children=2)
+            ])
+            await session.commit()
+
+    async def dispose(self):
+        await self.engine.dispose()
+
+    def execute(self, fn, *args, **kwargs):
+        async def wrapper():
+            async with AsyncSession(self.engine) as session:
+                result = fn(parse_query(args[0]), session, TABLES, *args[1:], **kwargs)
+                if hasattr(result, "__aiter__"):
+                    return await collect(result)
+                return await result
+        return run(wrapper())
+
+    def test_to_select_matches_to_sqlalchemy(self):
+        session = create_test_session()
+        try:
+            plan_cache = QueryPlanCache()
+            for qd in [ORDERED_QUERY, {"from": "User", "where": {"$in": {"id": [1, 3]}}, "orderBy": "id", "limit": 1}]:
+                query = parse_query(qd)
+                expected = [user.id for user in query.to_sqlalchemy(session, TABLES).all()]
+                self.assertEqual(expected, [user.id for user in session.scalars(query.to_select(TABLES)).all()])
+                # bind parameters are filled in when the statement is built from the plan cache
+                for _ in range(2):
+                    results = session.scalars(query.to_select(TABLES, plan_cache=plan_cache)).all()
+                    self.assertEqual(expected, [user.id for user in results])
+        finally:
+            session.close()
+
+    def test_execute_async(self):
+        results = self.execute(execute_async, ORDERED_QUERY)
+        self.assertEqual([3, 4, 2], [user.id for user in results])
+        self.assertEqual([], self.execute(execute_async, {"from": "User", "where": {"$or": []}}))
+
+    def test_execute_async_aggregates(self):
+        self.assertEqual(3, self.execute(execute_async, dict(ORDERED_QUERY, count=True)))
+        self.assertEqual(0, self.execute(execute_async, {"from": "User", "where": {"$or": []}, "count": True}))
+        results = self.execute(execute_async, {
+            "from": "User", "groupBy": "lastName", "aggregate": {"users": {"$count": "*"}},
+            "orderBy": ["-users", "lastName"]
+        })
+        self.assertEqual([
+            {"last_name": "Michaels", "users": 2}, {"last_name": None, "users": 1}, {"last_name": "Anderson", "users": 1}
+        ], [dict(row) for row in results])
+        self.assertEqual([{"total": 7}], [dict(row) for row in self.execute(execute_async, {
+            "from": "User", "aggregate": {"total": {"$sum": "children"}}
+        })])
+
+    def test_execute_async_with_policy(self):
+        results = self.execute(execute_async, ORDERED_QUERY, policy=QueryPolicy(max_limit=2))
+        self.assertEqual([3, 4], [user.id for user in results])
+
+    def test_stream_async_entities(self):
+        results = self.execute(stream_async, ORDERED_QUERY, chunk_size=1)
+        self.assertEqual([3, 4, 2], [user.id for user in results])
+
+    def test_stream_async_rows(self):
+        results = self.execute(stream_async, ORDERED_QUERY, row_format=ROW_FORMAT_TUPLE, fields=["id", "firstName"])
+        self.assertEqual([(3, "Andrew"), (4, "Gary"), (2, "James")], results)
+        results = self.execute(stream_async, dict(ORDERED_QUERY, select=["id"]), row_format=ROW_FORMAT_DICT)
+        self.assertEqual([{"id": 3}, {"id": 4}, {"id": 2}], results)
+
+    def test_stream_async_chunks(self):
+        chunks = self.execute(stream_async, ORDERED_QUERY, chunk_size=2, chunks=True)
+        self.assertEqual([[3, 4], [2]], [[user.id for user in chunk] for chunk in chunks])
+
+
+if __name__ == "__main__":
+    unittest.main()
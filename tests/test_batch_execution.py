@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from sqlalchemy import event, Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from mlalchemy import *
+from tests.fixtures import *
+
+NoCaseBase = declarative_base()
+
+
+class NoCaseUser(NoCaseBase):
+    __tablename__ = "nocase_users"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(collation="NOCASE"))
+
+
+BATCH_QUERIES = [
+    "from: User\nwhere:\n  first-name: Michael",
+    "from: User\nwhere:\n  first-name: James",
+    "from: User\nwhere:\n  first-name: Nobody",
+    "from: User\nwhere:\n  children: 3",
+    "from: User\nwhere:\n  children: 2",
+    "from: User\nwhere:\n  last-name: Michaels",
+    "from: User\nwhere:\n  $gt:\n    children: 1",
+    "from: User\nwhere:\n  $is:\n    last-name: null",
+    "from: User\nwhere:\n  $or:\n    - first-name: Michael\n    - children: 3",
+    "from: User",
+    "from: User\norder-by: -date-of-birth\nlimit: 2",
+]
+
+
+class TestBatchExecution(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.statements = []
+        event.listen(self.session.get_bind(), "before_cursor_execute", self.record_statement)
+
+    def tearDown(self):
+        event.remove(self.session.get_bind(), "before_cursor_execute", self.record_statement)
+        self.session.close()
+
+    def record_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def test_batch_results_match_individual_queries(self):
+        queries = [parse_yaml_query(qs) for qs in BATCH_QUERIES]
+        expected = [[user.id for user in query.to_sqlalchemy(self.session, TABLES).all()] for query in queries]
+        del self.statements[:]
+
+        results = execute_batch(self.session, TABLES, queries)
+        self.assertEqual(len(queries), len(results))
+        for qs, expected_ids, users in zip(BATCH_QUERIES, expected, results):
+            ids = [user.id for user in users]
+            if "order-by" in qs:
+                self.assertEqual(expected_ids, ids, qs)
+            else:
+                self.assertEqual(sorted(expected_ids), sorted(ids), qs)
+
+        # one IN query for the children lookups, one UNION ALL query (including the first-name lookups) and one query
+        # for the ordered query
+        self.assertEqual(3, len(self.statements))
+        self.assertEqual(1, len([s for s in self.statements if "UNION ALL" in s]))
+        self.assertEqual(1, len([s for s in self.statements if "users.children IN" in s]))
+        self.assertEqual(0, len([s for s in self.statements if "users.first_name IN" in s]))
+
+    def test_string_lookups_respect_collation(self):
+        NoCaseUser.__table__.create(self.session.connection())
+        self.session.add_all([NoCaseUser(id=1, name="Michael"), NoCaseUser(id=2, name="James")])
+        tables = {"NoCaseUser": NoCaseUser}
+        queries = [parse_query({"from": "NoCaseUser", "where": {"name": name}}) for name in ["michael", "Michael"]]
+        queries.extend([parse_query({"from": "NoCaseUser", "where": {"id": i}}) for i in [1, 2]])
+        expected = [[entry.id for entry in query.to_sqlalchemy(self.session, tables).all()] for query in queries]
+        self.assertEqual([[1], [1], [1], [2]], expected)
+        self.assertEqual(expected, [
+            [entry.id for entry in entries] for entries in execute_batch(self.session, tables, queries)
+        ])
+
+    def test_field_selections_are_not_combined(self):
+        queries = [parse_query(qd) for qd in [
+            {"from": "User", "where": {"$gt": {"children": 2}}, "select": ["firstName"]},
+            {"from": "User", "where": {"$lt": {"children": 1}}, "select": ["firstName"]},
+            {"from": "User", "where": {"$gt": {"children": 2}}},
+            {"from": "User", "where": {"children": 2}, "select": ["lastName"]},
+            {"from": "User", "where": {"children": 0}, "select": ["lastName"]}
+        ]]
+        self.assertEqual([[3], [1], [3], [2, 4], [1]], [
+            sorted([user.id for user in users]) for users in execute_batch(self.session, TABLES, queries)
+        ])
+        # one IN query for the last name selections, one UNION ALL query for the first name selections, and one
+        # query loading all of the fields
+        self.assertEqual(3, len(self.statements))
+        lookup, union, full = self.statements
+        self.assertNotIn("users.first_name", lookup)
+        self.assertIn("UNION ALL", union)
+        self.assertNotIn("anon_1_users_date_of_birth", union)
+        self.assertIn("users.date_of_birth", full)
+
+    def test_large_unions_are_split(self):
+        queries = []
+        for i in range(1201):
+            qd = [{"$gt": {"children": i % 4}}, {"lastName": "Michaels"}, {"$lt": {"id": i % 5}}][i % 3]
+            queries.append(parse_query({"from": "User", "where": qd}))
+        expected = [sorted([user.id for user in query.to_sqlalchemy(self.session, TABLES).all()]) for query in queries]
+        del self.statements[:]
+
+        self.assertEqual(expected, [
+            sorted([user.id for user in users]) for users in execute_batch(self.session, TABLES, queries)
+        ])
+        self.assertEqual(3, len(self.statements))
+        self.assertEqual(499, max([s.count("UNION ALL") for s in self.statements]))
+
+    def test_empty_batch(self):
+        self.assertEqual([], execute_batch(self.session, TABLES, []))
+        self.assertEqual(0, len(self.statements))
+
+    def test_invalid_table(self):
+        with self.assertRaises(InvalidTableError):
+            execute_batch(self.session, TABLES, [parse_yaml_query("from: Nothing")])
+
+
+if __name__ == "__main__":
+    unittest.main()
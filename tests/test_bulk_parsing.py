@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import io
+import os
+import tempfile
+import unittest
+
+from mlalchemy import *
+from mlalchemy.bulk import MAX_PENDING_CHUNKS
+from mlalchemy.testing import MLAlchemyTestCase
+
+NDJSON_QUERIES = """{"from": "User", "where": {"lastName": "Michaels"}}
+{"from": "User", "limit": 2}
+
+{"from": "User", "where": {"$not": [{"id": 1}, {"id": 2}]}}
+{"from": "User", "where":
+{"from": "User", "orderBy": "-dateOfBirth"}
+{"from": "User", "orderBy": [1]}
+{"from": "User", "orderBy": ""}
+{"from": "User", "orderBy": ["id", "-"]}
+"""
+
+YAML_QUERIES = """from: User
+where:
+  last-name: Michaels
+---
+from: User
+limit: 2
+--- {from: User, where: {$gt: {children: 1}}}
+---
+from: User
+where: [
+...
+---
+
+# just a comment
+---
+from: User
+order-by: -date-of-birth
+...
+"""
+
+
+class TestBulkParsing(MLAlchemyTestCase):
+
+    def assertNdjsonResults(self, results):
+        self.assertEqual(8, len(results))
+        self.assertQueryEquals(parse_json_query(NDJSON_QUERIES.splitlines()[0]), results[0])
+        self.assertEqual(2, results[1].limit)
+        self.assertIsInstance(results[2], QueryParseError)
+        self.assertEqual((2, 4), (results[2].index, results[2].line))
+        self.assertIsInstance(results[3], QueryParseError)
+        self.assertEqual((3, 5), (results[3].index, results[3].line))
+        self.assertEqual([{"date_of_birth": ORDER_DESC}], results[4].order_by)
+        for i in range(5, 8):
+            self.assertIsInstance(results[i], QueryParseError)
+            self.assertEqual((i, i + 2), (results[i].index, results[i].line))
+
+    def assertYamlResults(self, results):
+        self.assertEqual(5, len(results))
+        self.assertQueryEquals(parse_yaml_query("from: User\nwhere:\n  last-name: Michaels"), results[0])
+        self.assertEqual(2, results[1].limit)
+        self.assertEqual(COMP_GT, results[2].query_fragment.clauses[0].comp)
+        self.assertIsInstance(results[3], QueryParseError)
+        self.assertEqual((3, 8), (results[3].index, results[3].line))
+        self.assertEqual([{"date_of_birth": ORDER_DESC}], results[4].order_by)
+
+    def test_ndjson_stream(self):
+        self.assertNdjsonResults(list(iter_ndjson_queries(io.StringIO(NDJSON_QUERIES))))
+        self.assertNdjsonResults(list(iter_ndjson_queries(io.BytesIO(NDJSON_QUERIES.encode("utf-8")))))
+
+    def test_yaml_stream(self):
+        self.assertYamlResults(list(iter_yaml_queries(io.StringIO(YAML_QUERIES))))
+        self.assertYamlResults(list(iter_yaml_queries(io.BytesIO(YAML_QUERIES.encode("utf-8")))))
+
+    def test_stream_from_path(self):
+        fd, path = tempfile.mkstemp(suffix=".ndjson")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(NDJSON_QUERIES.encode("utf-8"))
+            self.assertNdjsonResults(list(iter_ndjson_queries(path)))
+        finally:
+            os.remove(path)
+
+    def test_raise_errors(self):
+        results = iter_ndjson_queries(io.StringIO(NDJSON_QUERIES), raise_errors=True)
+        self.assertIsInstance(next(results), MLQuery)
+        self.assertIsInstance(next(results), MLQuery)
+        with self.assertRaises(QueryParseError):
+            next(results)
+
+    def test_parallel_parsing(self):
+        self.assertNdjsonResults(list(iter_ndjson_queries(io.StringIO(NDJSON_QUERIES), processes=2, chunk_size=2)))
+        self.assertYamlResults(list(iter_yaml_queries(io.StringIO(YAML_QUERIES), processes=2, chunk_size=2)))
+
+    def test_parallel_parsing_reads_ahead_boundedly(self):
+        lines_read = [0]
+
+        def read_lines():
+            for i in range(1000):
+                lines_read[0] += 1
+                yield '{"from": "User", "limit": %d}\n' % i
+
+        results = iter_ndjson_queries(read_lines(), processes=2, chunk_size=10)
+        self.assertEqual(0, next(results).limit)
+        # the pending chunks, plus the chunk read before waiting for the first one
+        self.assertLessEqual(lines_read[0], (MAX_PENDING_CHUNKS * 2 + 1) * 10)
+        self.assertEqual(list(range(1, 1000)), [query.limit for query in results])
+
+    def test_unexpected_errors_are_raised(self):
+        results = list(iter_ndjson_queries(io.StringIO('[{"from": "User"}]\n"User"\n')))
+        self.assertEqual(2, len(results))
+        for result in results:
+            self.assertIsInstance(result, QueryParseError)
+        # errors other than those of MLAlchemy and of the JSON/YAML loaders abort the stream
+        with self.assertRaises(TypeError):
+            list(iter_ndjson_queries(io.StringIO('{"from": "User", "where": 5}\n')))
+
+
+if __name__ == "__main__":
+    unittest.main()
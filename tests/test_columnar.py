@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from mlalchemy import *
+from tests.fixtures import *
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+def load_columns(session):
+    rows = execute_core(parse_query({"from": "User", "orderBy": "id"}), session, TABLES)
+    columns = {}
+    for field in ["id", "first_name", "last_name", "date_of_birth", "children"]:
+        columns[field] = [row[field] for row in rows]
+    columns["id"] = np.array(columns["id"])
+    columns["children"] = np.array(columns["children"])
+    columns["first_name"] = np.array(columns["first_name"])
+    columns["last_name"] = np.array(columns["last_name"], dtype=object)
+    columns["date_of_birth"] = np.array(columns["date_of_birth"], dtype="datetime64[D]")
+    return columns
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "NumPy is not installed")
+class TestColumnarEvaluation(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.table = ColumnarTable(load_columns(self.session))
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_agrees_with_sqlite(self):
+        for qd in EQUIVALENCE_QUERIES:
+            query = parse_query(qd)
+            expected = [user.id for user in query.to_sqlalchemy(self.session, TABLES).all()]
+            if len(query.order_by) == 0:
+                expected = sorted(expected)
+            self.assertEqual(expected, list(self.table.query(query, fields=["id"])["id"]), qd)
+
+    def test_object_columns(self):
+        # the same data as plain Python objects, with None for NULLs
+        columns = dict([(field, np.array(values.tolist(), dtype=object)) for field, values in
+                        load_columns(self.session).items()])
+        columns["date_of_birth"] = np.array([d.astype(object) for d in load_columns(self.session)["date_of_birth"]],
+                                            dtype=object)
+        table = ColumnarTable(columns)
+        for qd in EQUIVALENCE_QUERIES:
+            query = parse_query(qd)
+            self.assertEqual(list(self.table.select(query)), list(table.select(query)), qd)
+
+    def test_nan_values(self):
+        table = ColumnarTable({"id": np.arange(4), "score": np.array([1.5, np.nan, 3.0, 0.5])})
+        for qd, expected in [
+            ({"from": "T", "where": {"$gt": {"score": 1}}}, [0, 2]),
+            ({"from": "T", "where": {"$not": {"$gt": {"score": 1}}}}, [3]),
+            ({"from": "T", "where": {"score": None}}, [1]),
+            ({"from": "T", "orderBy": "score"}, [1, 3, 0, 2]),
+            ({"from": "T", "orderBy": "-score"}, [2, 0, 3, 1])
+        ]:
+            self.assertEqual(expected, list(table.select(parse_query(qd))))
+
+    def test_empty_in_lists(self):
+        # empty IN lists are false for every entry, including those with NULLs, as they are in SQL
+        for qd in [
+            {"from": "User", "where": {"$in": {"lastName": []}}, "orderBy": "id"},
+            {"from": "User", "where": {"$nin": {"lastName": []}}, "orderBy": "id"},
+            {"from": "User", "where": {"$not": {"$in": {"lastName": []}}}, "orderBy": "id"},
+            {"from": "User", "where": {"$not": {"$nin": {"lastName": []}}}, "orderBy": "id"}
+        ]:
+            query = parse_query(qd)
+            expected = [user.id for user in query.to_sqlalchemy(self.session, TABLES).all()]
+            self.assertEqual(expected, list(self.table.query(query, fields=["id"])["id"]), qd)
+
+    def test_mixed_type_comparisons(self):
+        for qd in [
+            {"from": "User", "where": {"$gt": {"lastName": 1}}},
+            {"from": "User", "where": {"$lte": {"firstName": 1}}},
+            {"from": "User", "where": {"$lt": {"dateOfBirth": 1}}},
+            {"from": "User", "where": {"$like": {"lastName": 1}}}
+        ]:
+            with self.assertRaises(InvalidComparatorError):
+                self.table.select(parse_query(qd))
+
+    def test_query_columns(self):
+        results = query_columns(parse_query({"from": "User", "where": {"lastName": "Michaels"}, "orderBy": "-id",
+                                             "select": ["firstName", "children"]}), load_columns(self.session))
+        self.assertEqual(["children", "first_name"], sorted(results.keys()))
+        self.assertEqual(["Andrew", "James"], list(results["first_name"]))
+        self.assertEqual([3, 2], list(results["children"]))
+
+    def test_errors(self):
+        with self.assertRaises(InvalidFieldError):
+            self.table.select(parse_query({"from": "User", "where": {"nickname": "Gary"}}))
+        with self.assertRaises(QuerySyntaxError):
+            self.table.select(parse_query({"from": "User", "count": True}))
+        with self.assertRaises(ValueError):
+            ColumnarTable({"id": [1, 2], "children": [1]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from datetime import date
+
+from mlalchemy import *
+from tests.fixtures import *
+
+CORE_TABLES = {"User": User.__table__}
+
+ORDERED_QUERY = {"from": "User", "where": {"$gte": {"children": 2}}, "orderBy": "-dateOfBirth"}
+
+
+class TestCoreSelect(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.connection = self.session.connection()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_tables_and_mapped_classes(self):
+        for tables in [TABLES, CORE_TABLES]:
+            results = execute_core(parse_query(ORDERED_QUERY), self.connection, tables, fields=["id", "firstName"])
+            self.assertEqual([{"id": 3, "first_name": "Andrew"}, {"id": 4, "first_name": "Gary"},
+                              {"id": 2, "first_name": "James"}], [dict(row) for row in results])
+
+    def test_all_fields(self):
+        results = execute_core(parse_query({"from": "User", "where": {"id": 1}}), self.session, CORE_TABLES)
+        self.assertEqual([{
+            "id": 1,
+            "first_name": "Michael",
+            "last_name": "Anderson",
+            "date_of_birth": date(1980, 1, 1),
+            "children": 0
+        }], [dict(row) for row in results])
+
+    def test_selected_fields_and_paging(self):
+        query = parse_query({
+            "from": "User",
+            "where": {"$in": {"lastName": ["Michaels", "Anderson"]}},
+            "orderBy": "id",
+            "select": ["lastName"],
+            "offset": 1,
+            "limit": 1
+        })
+        for tables in [TABLES, CORE_TABLES]:
+            self.assertEqual([{"last_name": "Michaels"}],
+                             [dict(row) for row in execute_core(query, self.connection, tables)])
+
+    def test_plan_cache_and_policy(self):
+        plan_cache = QueryPlanCache()
+        for children, expected in [(2, [2, 4]), (3, [3]), (2, [2, 4])]:
+            query = parse_query({"from": "User", "where": {"children": children}, "orderBy": "id"})
+            results = execute_core(query, self.connection, CORE_TABLES, fields=["id"], plan_cache=plan_cache)
+            self.assertEqual(expected, [row["id"] for row in results])
+        self.assertEqual(1, plan_cache.stats()["size"])
+
+        results = execute_core(parse_query(ORDERED_QUERY), self.connection, CORE_TABLES,
+                               policy=QueryPolicy(max_limit=1))
+        self.assertEqual([3], [row["id"] for row in results])
+
+    def test_field_index_for_tables(self):
+        index = get_field_index(User.__table__)
+        self.assertFalse(index.mapped)
+        self.assertEqual(User.__table__.c.first_name, index.resolve("firstName"))
+        self.assertEqual(date, index.python_type("date-of-birth"))
+        self.assertTrue(index.is_indexed("id"))
+        with self.assertRaises(InvalidFieldError):
+            index.resolve("middleName")
+
+
+if __name__ == "__main__":
+    unittest.main()
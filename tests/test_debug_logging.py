@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import logging
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from mlalchemy import *
+from mlalchemy import utils
+from mlalchemy.utils import set_debug_log_format
+
+QUERY = {
+    "from": "SomeTable",
+    "where": [
+        {"$or": [{"field1": 1}, {"field2": "something"}]},
+        {"$not": {"field3": "else"}}
+    ]
+}
+
+
+class TestDebugLogging(unittest.TestCase):
+
+    def tearDown(self):
+        set_debug_log_format(DEBUG_LOG_FULL)
+
+    def test_no_serialization_when_debug_disabled(self):
+        logger = logging.getLogger("mlalchemy")
+        level = logger.level
+        logger.setLevel(logging.INFO)
+        try:
+            with mock.patch.object(utils, "json_dumps") as json_dumps:
+                parse_query(QUERY)
+                self.assertFalse(json_dumps.called)
+        finally:
+            logger.setLevel(level)
+
+    def test_full_debug_logging(self):
+        with self.assertLogs("mlalchemy.parser", level=logging.DEBUG) as logs:
+            parse_query(QUERY)
+        self.assertIn("\"field3\": \"else\"", "\n".join(logs.output))
+
+    def test_summary_debug_logging(self):
+        set_debug_log_format(DEBUG_LOG_SUMMARY)
+        with self.assertLogs("mlalchemy.parser", level=logging.DEBUG) as logs:
+            parse_query(QUERY)
+        output = "\n".join(logs.output)
+        self.assertIn("nodes=6, depth=3, fields=['field1', 'field2', 'field3']", output)
+        self.assertNotIn("\"else\"", output)
+        # the raw query dictionary isn't logged, as it is only summarized once parsed
+        self.assertEqual(1, len(logs.output))
+
+    def test_query_summary(self):
+        self.assertEqual(
+            {"nodes": 6, "depth": 3, "fields": ["field1", "field2", "field3"]},
+            parse_query(QUERY).summary()
+        )
+
+    def test_summaries_of_parsed_queries(self):
+        set_debug_log_format(DEBUG_LOG_SUMMARY)
+        for qd in [
+            QUERY,
+            {"from": "SomeTable"},
+            {"from": "SomeTable", "where": {"field1": 1}},
+            {"from": "SomeTable", "where": {"$gt": {"field1": 1, "field2": 2}, "field3": 3}},
+            {"from": "SomeTable", "where": {"$or": [
+                {"$in": {"field1": [1, 2]}}, {"$and": {"field2": 2, "field3": 3}}
+            ]}},
+            {"from": "SomeTable", "where": {"$and": {"$and": [
+                {"$or": [{"field1": 1}]}, {"$not": {"$gt": {"field2": 1}}}
+            ]}}},
+            {"from": "SomeTable", "where": []}
+        ]:
+            with self.assertLogs("mlalchemy.parser", level=logging.DEBUG) as logs:
+                summary = parse_query(qd).summary()
+            self.assertIn("nodes=%(nodes)d, depth=%(depth)d, fields=%(fields)s" % summary, logs.output[0], qd)
+
+    def test_invalid_debug_log_format(self):
+        with self.assertRaises(ValueError):
+            set_debug_log_format("verbose")
+
+
+if __name__ == "__main__":
+    unittest.main()
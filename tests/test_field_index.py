@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from datetime import date
+
+from sqlalchemy import Column, Integer, String, func
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
+from sqlalchemy.orm import configure_mappers, synonym, column_property
+
+from mlalchemy import *
+from tests.fixtures import *
+
+DescriptorBase = declarative_base()
+
+
+class Author(DescriptorBase):
+    __tablename__ = "authors"
+
+    id = Column(Integer, primary_key=True)
+    first_name = Column(String)
+    last_name = Column(String)
+    given_name = synonym("first_name")
+    full_name = column_property(first_name + " " + last_name)
+
+    @hybrid_property
+    def name_length(self):
+        return len(self.first_name)
+
+    @name_length.expression
+    def name_length(cls):
+        return func.length(cls.first_name)
+
+    @hybrid_method
+    def is_named(self, name):
+        return self.first_name == name
+
+
+AUTHOR_TABLES = {"Author": Author}
+
+
+class TestFieldIndex(unittest.TestCase):
+
+    def test_resolve_fields(self):
+        index = get_field_index(User)
+        self.assertIs(index, get_field_index(User))
+        self.assertIs(User.first_name, index.resolve("first_name"))
+        self.assertIs(User.first_name, index.resolve("firstName"))
+        self.assertIs(User.date_of_birth, index.resolve("date-of-birth"))
+        self.assertEqual("date_of_birth", index.field_name("dateOfBirth"))
+        self.assertIn("lastName", index)
+        self.assertNotIn("password", index)
+        with self.assertRaises(InvalidFieldError):
+            index.resolve("password")
+
+    def test_python_types(self):
+        index = get_field_index(User)
+        self.assertIs(int, index.python_type("id"))
+        self.assertIs(date, index.python_type("dateOfBirth"))
+
+    def test_unmapped_table(self):
+        with self.assertRaises(InvalidTableError):
+            get_field_index(object)
+
+    def test_indices_refreshed_when_mappers_change(self):
+        index = get_field_index(User)
+
+        class Pet(declarative_base()):
+            __tablename__ = "pets"
+
+            id = Column(Integer, primary_key=True)
+            name = Column(String)
+
+        configure_mappers()
+        self.assertIsNot(index, get_field_index(User))
+
+    def test_other_mapped_attributes(self):
+        index = get_field_index(Author)
+        self.assertEqual("given_name", index.field_name("givenName"))
+        self.assertIn("name-length", index)
+        self.assertIn("fullName", index)
+        self.assertNotIn("isNamed", index)
+        self.assertIs(str, index.python_type("fullName"))
+        self.assertIsNone(index.python_type("nameLength"))
+        # only actual columns are selected by default
+        self.assertEqual(("first_name", "full_name", "id", "last_name"), tuple(sorted(index.field_names)))
+
+        session = create_test_session()
+        try:
+            DescriptorBase.metadata.create_all(session.get_bind())
+            session.add_all([
+                Author(first_name="Anne", last_name="Brontë"),
+                Author(first_name="Jane", last_name="Austen"),
+                Author(first_name="Emily", last_name="Brontë")
+            ])
+            session.commit()
+            for qd, expected in [
+                ({"from": "Author", "where": {"givenName": "Jane"}}, [2]),
+                ({"from": "Author", "where": {"fullName": "Emily Brontë"}}, [3]),
+                ({"from": "Author", "where": {"$gt": {"nameLength": 4}}, "orderBy": "-givenName"}, [3]),
+                ({"from": "Author", "orderBy": ["-nameLength", "given-name"]}, [3, 1, 2])
+            ]:
+                query = parse_query(qd, tables=AUTHOR_TABLES)
+                self.assertEqual(expected, [author.id for author in query.to_sqlalchemy(session, AUTHOR_TABLES)], qd)
+            with self.assertRaises(InvalidFieldError):
+                parse_query({"from": "Author", "where": {"isNamed": "Jane"}}, tables=AUTHOR_TABLES)
+        finally:
+            session.close()
+
+    def test_parse_time_validation(self):
+        query = parse_query({"from": "User", "where": {"lastName": "Michaels"}, "orderBy": "-id"}, tables=TABLES)
+        self.assertEqual("User", query.table)
+        with self.assertRaises(InvalidFieldError):
+            parse_query({"from": "User", "where": {"$or": [{"id": 1}, {"password": "x"}]}}, tables=TABLES)
+        with self.assertRaises(InvalidFieldError):
+            parse_query({"from": "User", "orderBy": "-age"}, tables=TABLES)
+        with self.assertRaises(InvalidTableError):
+            parse_query({"from": "Account"}, tables=TABLES)
+
+    def test_invalid_field_when_querying(self):
+        session = create_test_session()
+        try:
+            with self.assertRaises(InvalidFieldError):
+                parse_query({"from": "User", "where": {"password": "x"}}).to_sqlalchemy(session, TABLES)
+        finally:
+            session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from mlalchemy import *
+from mlalchemy.utils import normalize_field_name, field_name_cache, set_field_name_cache_size
+from tests.fixtures import *
+
+
+class TestFieldNameCache(unittest.TestCase):
+
+    def setUp(self):
+        self.max_size = field_name_cache.max_size
+        field_name_cache.clear()
+        field_name_cache.reset_stats()
+
+    def tearDown(self):
+        set_field_name_cache_size(self.max_size)
+
+    def test_normalization_cached(self):
+        self.assertEqual("first_name", normalize_field_name("firstName"))
+        self.assertEqual("first_name", normalize_field_name("firstName"))
+        self.assertEqual("last_name", normalize_field_name("last-name"))
+        self.assertEqual("id", normalize_field_name("id"))
+        stats = field_name_cache.stats()
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(3, stats["misses"])
+        self.assertEqual(3, stats["size"])
+
+    def test_cache_size(self):
+        set_field_name_cache_size(2)
+        for name in ["fieldOne", "fieldTwo", "fieldThree"]:
+            normalize_field_name(name)
+        self.assertEqual(2, len(field_name_cache))
+        self.assertEqual(1, field_name_cache.evictions)
+        self.assertEqual("field_one", normalize_field_name("fieldOne"))
+
+    def test_prime_from_tables(self):
+        prime_field_name_cache(TABLES)
+        self.assertIn("dateOfBirth", field_name_cache)
+        self.assertIn("first-name", field_name_cache)
+        parse_query({"from": "User", "where": {"firstName": "Michael"}, "orderBy": "-date-of-birth"})
+        self.assertEqual(0, field_name_cache.misses)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from sqlalchemy import inspect
+
+from mlalchemy import *
+from tests.fixtures import *
+
+
+class TestFieldSelection(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_parse_select(self):
+        self.assertEqual(["first_name", "date_of_birth"], parse_query({
+            "from": "User",
+            "select": ["firstName", "date-of-birth"]
+        }).select)
+        self.assertEqual(["last_name"], parse_query({"from": "User", "fields": "lastName"}).select)
+        self.assertIsNone(parse_query({"from": "User"}).select)
+
+    def test_only_selected_fields_loaded(self):
+        query = parse_query({"from": "User", "select": ["firstName"], "where": {"lastName": "Michaels"}})
+        users = query.to_sqlalchemy(self.session, TABLES).all()
+        self.assertEqual(["Andrew", "James"], sorted([user.first_name for user in users]))
+        for user in users:
+            unloaded = inspect(user).unloaded
+            self.assertNotIn("first_name", unloaded)
+            self.assertIn("last_name", unloaded)
+            self.assertIn("date_of_birth", unloaded)
+
+    def test_select_with_plan_cache(self):
+        cache = QueryPlanCache()
+        for name in ["Michael", "James"]:
+            query = parse_query({"from": "User", "select": "lastName", "where": {"firstName": name}})
+            users = query.to_sqlalchemy(self.session, TABLES, plan_cache=cache).all()
+            self.assertEqual(1, len(users))
+            self.assertIn("first_name", inspect(users[0]).unloaded)
+        self.assertEqual(1, cache.hits)
+
+    def test_select_streamed_fields(self):
+        query = parse_query({"from": "User", "select": ["id", "lastName"], "where": {"children": 3}})
+        self.assertEqual(
+            [{"id": 3, "last_name": "Michaels"}],
+            list(stream_query(query, self.session, TABLES, row_format=ROW_FORMAT_DICT))
+        )
+
+    def test_invalid_selected_field(self):
+        query = parse_query({"from": "User", "select": ["password"]})
+        with self.assertRaises(InvalidFieldError):
+            query.to_sqlalchemy(self.session, TABLES)
+        with self.assertRaises(TypeError):
+            parse_query({"from": "User", "select": [1]})
+
+
+if __name__ == "__main__":
+    unittest.main()
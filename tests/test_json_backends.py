@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+from datetime import date
+
+from mlalchemy import *
+from mlalchemy.testing import MLAlchemyTestCase
+from mlalchemy.utils import json_dumps, json_loads, available_json_backends, set_json_backend, get_json_backend
+
+JSON_QUERY = """{
+    "from": "User",
+    "where": {
+        "$or": [
+            {"lastName": "Michaëls"},
+            {"$in": {"children": [1, 2, 3]}}
+        ]
+    },
+    "orderBy": ["-dateOfBirth"],
+    "limit": 10
+}"""
+
+
+class TestJsonBackends(MLAlchemyTestCase):
+
+    def setUp(self):
+        self.backend = get_json_backend()
+
+    def tearDown(self):
+        set_json_backend(self.backend)
+
+    def test_stdlib_always_available(self):
+        self.assertIn(JSON_BACKEND_STDLIB, available_json_backends())
+        with self.assertRaises(ValueError):
+            set_json_backend("simplejson")
+
+    def test_backends_agree(self):
+        set_json_backend(JSON_BACKEND_STDLIB)
+        expected = parse_json_query(JSON_QUERY)
+        for backend in available_json_backends():
+            set_json_backend(backend)
+            for content in [JSON_QUERY, JSON_QUERY.encode("utf-8"), bytearray(JSON_QUERY.encode("utf-8")),
+                            memoryview(JSON_QUERY.encode("utf-8"))]:
+                self.assertQueryEquals(expected, parse_json_query(content))
+
+    def test_dumps(self):
+        obj = {"name": "Michaëls", "born": date(1988, 8, 12), "values": [1, 2.5, None, True]}
+        expected = {"name": "Michaëls", "born": "1988-08-12", "values": [1, 2.5, None, True]}
+        for backend in available_json_backends():
+            set_json_backend(backend)
+            for indent in [None, 2, 4]:
+                self.assertEqual(expected, json.loads(json_dumps(obj, indent=indent)), backend)
+            self.assertEqual(expected, json_loads(json_dumps(obj)))
+
+    def test_invalid_json(self):
+        for backend in available_json_backends():
+            set_json_backend(backend)
+            with self.assertRaises(ValueError):
+                parse_json_query(b'{"from": ')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from mlalchemy import *
+from tests.fixtures import *
+
+
+class TestKeysetPagination(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.session.add_all([
+            User(
+                first_name="User%d" % i,
+                last_name="Surname%d" % (i % 3),
+                date_of_birth=date(1970 + i, 1 + (i % 12), 1),
+                children=i % 4
+            )
+            for i in range(20)
+        ])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def paginate(self, qd, plan_cache=None):
+        pages = []
+        cursor = None
+        while True:
+            page_qd = dict(qd)
+            if cursor is not None:
+                page_qd["after"] = cursor
+            results, cursor = fetch_page(parse_query(page_qd), self.session, TABLES, plan_cache=plan_cache)
+            pages.append([user.id for user in results])
+            if cursor is None:
+                return pages
+
+    def assertPaginationMatchesOffsets(self, qd, plan_cache=None):
+        expected = [user.id for user in parse_query(qd).paginated().to_sqlalchemy(self.session, TABLES).all()]
+        pages = self.paginate(dict(qd, limit=3), plan_cache=plan_cache)
+        self.assertTrue(all([len(page) == 3 for page in pages[:-1]]))
+        self.assertEqual(expected, [user_id for page in pages for user_id in page])
+
+    def test_single_field_pagination(self):
+        self.assertPaginationMatchesOffsets({"from": "User", "orderBy": "id"})
+        self.assertPaginationMatchesOffsets({"from": "User", "orderBy": "-dateOfBirth"})
+
+    def test_multiple_field_pagination(self):
+        self.assertPaginationMatchesOffsets({"from": "User", "orderBy": ["children", "id"]})
+        self.assertPaginationMatchesOffsets({"from": "User", "orderBy": ["-children", "dateOfBirth"]})
+
+    def test_non_unique_field_pagination(self):
+        # entries tying on the ordering fields are ordered by their primary key, so that none of them are skipped
+        for qd in [{"from": "User", "orderBy": "children"}, {"from": "User", "orderBy": ["-children", "-lastName"]}]:
+            self.assertPaginationMatchesOffsets(qd)
+            self.assertPaginationMatchesOffsets(qd, plan_cache=QueryPlanCache())
+
+    def test_nullable_field_pagination(self):
+        self.session.add_all([User(first_name="Nobody%d" % i, last_name=None, children=None) for i in range(4)])
+        self.session.commit()
+        for qd in [
+            {"from": "User", "orderBy": "lastName"},
+            {"from": "User", "orderBy": "-lastName"},
+            {"from": "User", "orderBy": ["children", "-lastName"]},
+            {"from": "User", "orderBy": ["-children", "dateOfBirth"]}
+        ]:
+            self.assertPaginationMatchesOffsets(qd)
+            self.assertPaginationMatchesOffsets(qd, plan_cache=QueryPlanCache())
+
+    def test_single_entry_pages(self):
+        session = create_test_session()
+        try:
+            for qd, expected in [
+                ({"from": "User", "orderBy": "children", "limit": 1}, [1, 2, 4, 3]),
+                ({"from": "User", "orderBy": "lastName", "limit": 1}, [4, 1, 2, 3]),
+                ({"from": "User", "orderBy": "-lastName", "limit": 1}, [2, 3, 1, 4])
+            ]:
+                pages, cursor = [], None
+                while True:
+                    results, cursor = fetch_page(parse_query(dict(qd, after=cursor) if cursor else qd), session,
+                                                 TABLES)
+                    pages.extend([user.id for user in results])
+                    if cursor is None:
+                        break
+                self.assertEqual(expected, pages)
+        finally:
+            session.close()
+
+    def test_filtered_pagination(self):
+        qd = {
+            "from": "User",
+            "where": {"$gte": {"children": 1}},
+            "orderBy": ["lastName", "-id"]
+        }
+        self.assertPaginationMatchesOffsets(qd)
+        self.assertPaginationMatchesOffsets(qd, plan_cache=QueryPlanCache())
+
+    def test_seek_predicate(self):
+        cursor = encode_cursor([2, 10])
+        query = parse_query({"from": "User", "orderBy": ["children", "id"], "after": cursor, "limit": 5})
+        sql = str(query.to_sqlalchemy(self.session, TABLES).statement.compile())
+        self.assertIn("(users.children, users.id) > (", sql)
+        self.assertNotIn("OFFSET", sql)
+
+    def test_paginated_ordering(self):
+        # only paginated queries are ordered by their primary key as well, with NULLs ordered consistently
+        query = parse_query({"from": "User", "orderBy": "-lastName"})
+        sql = str(query.to_select(TABLES).compile())
+        self.assertTrue(sql.endswith("ORDER BY users.last_name DESC"), sql)
+        self.assertFalse(query.is_paginated())
+
+        paginated = query.paginated()
+        self.assertTrue(paginated.is_paginated())
+        self.assertIs(paginated, paginated.paginated())
+        self.assertNotEqual(query.structure_key(), paginated.structure_key())
+        statement = paginated.to_select(TABLES)
+        sql = str(statement.compile())
+        self.assertTrue(sql.endswith("ORDER BY users.last_name DESC NULLS LAST, users.id ASC"), sql)
+        self.assertNotIn("CASE", sql)
+        # SQLite orders NULLs in this way by default
+        sql = str(statement.compile(dialect=self.session.get_bind().dialect))
+        self.assertTrue(sql.endswith("ORDER BY users.last_name DESC, users.id ASC"), sql)
+        self.assertTrue(parse_query({"from": "User", "orderBy": "id", "after": encode_cursor([1])}).is_paginated())
+
+    def test_cursor_round_trip(self):
+        values = [
+            "text", 1, 2.5, None, date(1988, 8, 12), datetime(1988, 8, 12, 10, 30, 15, 250),
+            datetime(1988, 8, 12, 10, 30, tzinfo=timezone(timedelta(hours=2))), Decimal("12.3450")
+        ]
+        decoded = decode_cursor(encode_cursor(values))
+        self.assertEqual(values, decoded)
+        self.assertEqual(timedelta(hours=2), decoded[6].utcoffset())
+        self.assertEqual("12.3450", str(decoded[7]))
+
+    def test_invalid_cursors(self):
+        with self.assertRaises(InvalidCursorError):
+            parse_query({"from": "User", "orderBy": "id", "after": "not a cursor"})
+        with self.assertRaises(InvalidCursorError):
+            decode_cursor(encode_cursor([{"$decimal": "twelve"}]))
+        with self.assertRaises(InvalidCursorError):
+            parse_query({"from": "User", "orderBy": ["children", "id"], "after": encode_cursor([1])})
+        # cursors also contain the values of the primary key, so their length is only checked once compiled
+        with self.assertRaises(InvalidCursorError):
+            parse_query({"from": "User", "orderBy": "id", "after": encode_cursor([1, 2])}).to_sqlalchemy(
+                self.session, TABLES
+            )
+        with self.assertRaises(InvalidCursorError):
+            parse_query({"from": "User", "orderBy": "children", "after": encode_cursor([1])}).to_sqlalchemy(
+                self.session, TABLES
+            )
+        with self.assertRaises(QuerySyntaxError):
+            parse_query({"from": "User", "after": encode_cursor([1])})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from mlalchemy import *
+from tests.fixtures import *
+
+FIELDS = ["id", "first_name", "last_name", "date_of_birth", "children"]
+
+
+class TestPredicates(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.users = parse_query({"from": "User", "orderBy": "id"}).to_sqlalchemy(self.session, TABLES).all()
+        self.rows = [dict([(field, getattr(user, field)) for field in FIELDS]) for user in self.users]
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_agrees_with_sqlite(self):
+        for qd in EQUIVALENCE_QUERIES:
+            query = parse_query(qd)
+            expected = [user.id for user in query.to_sqlalchemy(self.session, TABLES).all()]
+            if len(query.order_by) == 0:
+                expected = sorted(expected)
+            self.assertEqual(expected, [row["id"] for row in filter_iterable(query, self.rows)], qd)
+            self.assertEqual(expected, [user.id for user in filter_iterable(query, self.users)], qd)
+
+    def test_compile_predicate(self):
+        query = parse_query({"from": "User", "where": {"$or": [
+            {"$like": {"firstName": "J%"}}, {"$nin": {"children": [0, 2, 3]}}, {"$not": {"lastName": "Michaels"}}
+        ]}})
+        predicate = compile_predicate(query.query_fragment)
+        self.assertEqual([True, True, False, False], [predicate(row) for row in self.rows])
+        self.assertIs(predicate, compile_predicate(query.query_fragment))
+        attr_predicate = compile_predicate(query.query_fragment, mapping=False)
+        self.assertIsNot(predicate, attr_predicate)
+        self.assertEqual([True, True, False, False], [attr_predicate(user) for user in self.users])
+
+    def test_null_semantics(self):
+        rows = [{"x": None}, {"x": 1}, {"x": 2}]
+        for qd, expected in [
+            ({"from": "T", "where": {"$in": {"x": [1, None]}}}, [1]),
+            ({"from": "T", "where": {"$nin": {"x": [1, None]}}}, []),
+            ({"from": "T", "where": {"$nin": {"x": [1]}}}, [2]),
+            ({"from": "T", "where": {"$not": {"$gt": {"x": 1}}}}, [1]),
+            ({"from": "T", "where": {"$or": []}}, []),
+            # empty IN lists are false for every row, including those with NULLs, as they are in SQL
+            ({"from": "T", "where": {"$nin": {"x": []}}}, [None, 1, 2]),
+            ({"from": "T", "where": {"$not": {"$in": {"x": []}}}}, [None, 1, 2]),
+        ]:
+            self.assertEqual(expected, [row["x"] for row in filter_iterable(parse_query(qd), rows)], qd)
+        predicate = compile_predicate(MLQueryFragment(OP_NOT, sub_fragments=[
+            MLQueryFragment(OP_OR, clauses=[MLClause("x", COMP_EQ, 1), MLClause("x", COMP_EQ, None)])
+        ]))
+        self.assertEqual([2], [row["x"] for row in rows if predicate(row)])
+
+    def test_empty_in_lists(self):
+        for qd in [
+            {"from": "User", "where": {"$nin": {"lastName": []}}, "orderBy": "id"},
+            {"from": "User", "where": {"$not": {"$in": {"lastName": []}}}, "orderBy": "id"},
+            {"from": "User", "where": {"$not": {"$nin": {"lastName": []}}}, "orderBy": "id"}
+        ]:
+            query = parse_query(qd)
+            expected = [user.id for user in query.to_sqlalchemy(self.session, TABLES).all()]
+            self.assertEqual(expected, [row["id"] for row in filter_iterable(query, self.rows)], qd)
+
+    def test_lazy_evaluation(self):
+        consumed = []
+
+        def generate():
+            for i in range(1000):
+                consumed.append(i)
+                yield {"id": i, "group": i % 3}
+
+        results = filter_iterable(parse_query({"from": "T", "where": {"group": 1}, "offset": 1, "limit": 2}),
+                                  generate())
+        self.assertEqual([4, 7], [row["id"] for row in results])
+        self.assertEqual(8, len(consumed))
+
+    def test_ordering_and_limit(self):
+        rows = [{"id": i, "score": (i * 7) % 10, "name": "n%d" % (i % 4)} for i in range(20)]
+        query = parse_query({"from": "T", "orderBy": ["-name", "score", "-id"], "offset": 2, "limit": 3})
+        expected = sorted(rows, key=lambda row: -row["id"])
+        expected = sorted(expected, key=lambda row: row["score"])
+        expected = sorted(expected, key=lambda row: row["name"], reverse=True)[2:5]
+        self.assertEqual(expected, list(filter_iterable(query, rows)))
+        query = parse_query({"from": "T", "orderBy": ["-name", "score", "-id"], "offset": 2})
+        self.assertEqual(18, len(list(filter_iterable(query, rows))))
+
+    def test_keyset_pagination(self):
+        query = parse_query({"from": "User", "orderBy": ["-children", "id"], "limit": 2})
+        page = list(filter_iterable(query, self.rows))
+        self.assertEqual([3, 2], [row["id"] for row in page])
+        next_query = parse_query({"from": "User", "orderBy": ["-children", "id"], "limit": 2,
+                                  "after": encode_cursor([page[-1]["children"], page[-1]["id"]])})
+        self.assertEqual([4, 1], [row["id"] for row in filter_iterable(next_query, self.rows)])
+
+    def test_errors(self):
+        with self.assertRaises(QuerySyntaxError):
+            filter_iterable(parse_query({"from": "User", "count": True}), self.rows)
+        with self.assertRaises(TypeError):
+            compile_predicate({"firstName": "Gary"})
+        for qd in [{"from": "User", "where": {"$gt": {"lastName": 1}}},
+                   {"from": "User", "where": {"$not": {"$lte": {"dateOfBirth": "yesterday"}}}}]:
+            with self.assertRaises(InvalidComparatorError):
+                list(filter_iterable(parse_query(qd), self.rows))
+        self.assertEqual([], list(filter_iterable(parse_query({"from": "User", "orderBy": "id"}), [])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from datetime import date
+
+from mlalchemy import *
+from tests.fixtures import *
+
+
+def optimized(where):
+    return parse_query({"from": "User", "where": where}, optimize=True)
+
+
+def AND(*children):
+    return MLQueryFragment(
+        OP_AND,
+        clauses=[c for c in children if isinstance(c, MLClause)],
+        sub_fragments=[c for c in children if isinstance(c, MLQueryFragment)]
+    )
+
+
+def OR(*children):
+    return MLQueryFragment(
+        OP_OR,
+        clauses=[c for c in children if isinstance(c, MLClause)],
+        sub_fragments=[c for c in children if isinstance(c, MLQueryFragment)]
+    )
+
+
+def NOT(child):
+    if isinstance(child, MLClause):
+        return MLQueryFragment(OP_NOT, clauses=[child])
+    return MLQueryFragment(OP_NOT, sub_fragments=[child])
+
+
+class TestQueryOptimizer(unittest.TestCase):
+
+    def assertOptimizesTo(self, where, expected_fragment):
+        if isinstance(expected_fragment, MLClause):
+            expected_fragment = AND(expected_fragment)
+        self.assertEqual(expected_fragment, optimized(where).query_fragment)
+
+    def test_or_of_equalities_becomes_in(self):
+        self.assertOptimizesTo(
+            {"$or": [{"children": 1}, {"children": 2}, {"$in": {"children": [3, 2]}}, {"firstName": "Gary"}]},
+            OR(MLClause("children", COMP_IN, [1, 2, 3]), MLClause("firstName", COMP_EQ, "Gary"))
+        )
+
+    def test_range_bounds_are_merged(self):
+        self.assertOptimizesTo(
+            [{"$gt": {"children": 1}}, {"$gte": {"children": 2}}, {"$lt": {"children": 5}}, {"$lte": {"children": 5}}],
+            AND(MLClause("children", COMP_GTE, 2), MLClause("children", COMP_LT, 5))
+        )
+        self.assertOptimizesTo(
+            [{"$gte": {"children": 2}}, {"$lte": {"children": 2}}],
+            MLClause("children", COMP_EQ, 2)
+        )
+        self.assertOptimizesTo(
+            [{"$in": {"children": [0, 1, 2, 3]}}, {"$gt": {"children": 0}}, {"$neq": {"children": 2}}],
+            MLClause("children", COMP_IN, [1, 3])
+        )
+
+    def test_duplicates_and_nesting_are_removed(self):
+        self.assertOptimizesTo(
+            [{"firstName": "Gary"}, {"$and": [{"firstName": "Gary"}, {"$like": {"lastName": "M%"}}]}],
+            AND(MLClause("firstName", COMP_EQ, "Gary"), MLClause("lastName", COMP_LIKE, "M%"))
+        )
+
+    def test_negations(self):
+        like = MLClause("lastName", COMP_LIKE, "M%")
+        self.assertEqual(AND(like), optimize_fragment(NOT(NOT(like))))
+        self.assertEqual(AND(like), optimize_fragment(NOT(NOT(AND(like)))))
+        self.assertOptimizesTo({"$not": {"$gt": {"children": 2}}}, MLClause("children", COMP_LTE, 2))
+        self.assertOptimizesTo({"$not": {"$in": {"children": [1, 2]}}}, MLClause("children", COMP_NIN, [1, 2]))
+
+    def test_contradictions_match_nothing(self):
+        for where in [
+            [{"children": 1}, {"children": 2}],
+            [{"$gt": {"children": 5}}, {"$lt": {"children": 3}}],
+            [{"$gt": {"children": 3}}, {"$lte": {"children": 3}}],
+            [{"children": 1}, {"$not": {"children": 1}}],
+            [{"$in": {"children": [1, 2]}}, {"$in": {"children": [3, 4]}}],
+            [{"$lt": {"dateOfBirth": date(1980, 1, 1)}}, {"$gt": {"dateOfBirth": date(1990, 1, 1)}}],
+            {"$in": {"children": []}}
+        ]:
+            self.assertTrue(optimized(where).matches_nothing(), where)
+
+        self.assertTrue(optimized({"$or": [{"$in": {"children": []}}, {"firstName": "Gary"}]}).query_fragment.clauses)
+        self.assertIsNone(optimized({"$nin": {"children": []}}).query_fragment)
+
+    def test_negated_contradictions_exclude_nulls(self):
+        # contradictions are NULL rather than false for entries whose field is NULL, and so are their negations
+        session = create_test_session()
+        try:
+            session.add(User(first_name="Nobody", last_name="Nowhere", children=None))
+            session.commit()
+            contradiction = AND(MLClause("children", COMP_EQ, 1), MLClause("children", COMP_EQ, 2))
+            for qf in [
+                NOT(contradiction),
+                NOT(OR(MLClause("firstName", COMP_EQ, "Gary"), AND(
+                    MLClause("children", COMP_GT, 5), MLClause("children", COMP_LT, 3)
+                ))),
+                NOT(NOT(NOT(contradiction))),
+                AND(MLClause("id", COMP_GTE, 2), NOT(AND(
+                    MLClause("children", COMP_IN, [1, 2]), MLClause("children", COMP_IN, [3, 4])
+                )))
+            ]:
+                query = parse_query({"from": "User", "orderBy": "id"}).with_fragment(qf)
+                expected = [user.id for user in query.to_sqlalchemy(session, TABLES).all()]
+                self.assertNotIn(5, expected, qf)
+                self.assertEqual(
+                    expected, [user.id for user in optimize_query(query).to_sqlalchemy(session, TABLES).all()], qf
+                )
+            self.assertIsNotNone(optimize_fragment(NOT(contradiction)))
+        finally:
+            session.close()
+
+    def test_strings_are_not_reasoned_about(self):
+        # string comparisons depend on the database's collation
+        where = [{"firstName": "Gary"}, {"firstName": "gary"}]
+        self.assertFalse(optimized(where).matches_nothing())
+        self.assertEqual(parse_query({"from": "User", "where": where}), optimized(where))
+
+    def test_unchanged_queries_are_returned_as_is(self):
+        query = parse_query({"from": "User", "where": [{"firstName": "Gary"}, {"$gt": {"children": 1}}]})
+        self.assertIs(query, optimize_query(query))
+
+    def test_optimized_queries_return_same_results(self):
+        session = create_test_session()
+        try:
+            for where in [
+                {"$or": [{"children": 0}, {"children": 3}, {"$and": [{"$gte": {"children": 2}}, {"$gt": {"id": 3}}]}]},
+                [{"$gt": {"children": 1}}, {"$gte": {"children": 2}}, {"$not": {"$not": {"$lt": {"id": 4}}}}],
+                {"$not": {"$in": {"children": [2, 3]}}},
+                [{"children": 2}, {"children": 3}]
+            ]:
+                qd = {"from": "User", "where": where, "orderBy": "id"}
+                self.assertEqual(
+                    [user.id for user in parse_query(qd).to_sqlalchemy(session, TABLES).all()],
+                    [user.id for user in parse_query(qd, optimize=True).to_sqlalchemy(session, TABLES).all()]
+                )
+            empty = parse_query({"from": "User", "where": {"$or": []}})
+            self.assertEqual([], empty.to_sqlalchemy(session, TABLES).all())
+            self.assertEqual([], execute_batch(session, TABLES, [optimized([{"id": 1}, {"id": 2}])])[0])
+        finally:
+            session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
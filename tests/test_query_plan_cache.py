@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from mlalchemy import *
+from tests.fixtures import *
+
+
+class TestQueryPlanCache(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+
+    def tearDown(self):
+        self.session.close()
+
+    def query_ids(self, query, plan_cache=None):
+        return [user.id for user in query.to_sqlalchemy(self.session, TABLES, plan_cache=plan_cache).all()]
+
+    def test_cached_results_match_uncached(self):
+        cache = QueryPlanCache()
+        queries = [
+            "from: User\nwhere:\n  first-name: Michael",
+            "from: User\nwhere:\n  first-name: James",
+            "from: User\nwhere:\n  $gt:\n    date-of-birth: 1979-01-01\norder-by: -children",
+            "from: User\nwhere:\n  $gt:\n    date-of-birth: 1984-01-01\norder-by: -children",
+            "from: User\nwhere:\n  $in:\n    children: [2, 3]",
+            "from: User\nwhere:\n  $in:\n    children: [0]",
+            "from: User\nwhere:\n  $nin:\n    children: [0, 2]",
+            "from: User\nwhere:\n  $is:\n    last-name: null",
+            "from: User\nwhere:\n  $or:\n    - $like:\n        first-name: J%\n    - children: 0\nlimit: 1",
+        ]
+        for qs in queries:
+            query = parse_yaml_query(qs)
+            self.assertEqual(self.query_ids(query), self.query_ids(query, plan_cache=cache), qs)
+
+    def test_cache_statistics(self):
+        cache = QueryPlanCache(max_size=2)
+        self.query_ids(parse_yaml_query("from: User\nwhere:\n  first-name: Michael"), plan_cache=cache)
+        self.assertEqual(
+            [2],
+            self.query_ids(parse_yaml_query("from: User\nwhere:\n  firstName: James"), plan_cache=cache)
+        )
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(1, len(cache))
+
+        self.query_ids(parse_yaml_query("from: User\nwhere:\n  last-name: Michaels"), plan_cache=cache)
+        self.query_ids(parse_yaml_query("from: User\nwhere:\n  children: 3"), plan_cache=cache)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.evictions)
+
+        stats = cache.stats()
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(3, stats["misses"])
+        self.assertEqual(0.25, stats["hit_rate"])
+
+    def test_structure_keys(self):
+        q1 = parse_yaml_query("from: User\nwhere:\n  $in:\n    children: [2, 3]\norder-by: first-name")
+        q2 = parse_yaml_query("from: User\nwhere:\n  $in:\n    children: [1]\norder-by: first-name")
+        q3 = parse_yaml_query("from: User\nwhere:\n  $in:\n    children: [1]\norder-by: -first-name")
+        self.assertEqual(q1.structure_key(), q2.structure_key())
+        self.assertNotEqual(q2.structure_key(), q3.structure_key())
+        self.assertEqual({"mlq_0": [1]}, q2.bind_values())
+
+    def test_null_equality_comparisons(self):
+        # equality comparisons against null are rendered as IS NULL/IS NOT NULL rather than bound, so they mustn't
+        # share a plan with comparisons against other values
+        cache = QueryPlanCache()
+        for qs, expected in [
+            ("from: User\nwhere:\n  last-name: Michaels\norder-by: id", [2, 3]),
+            ("from: User\nwhere:\n  last-name: null\norder-by: id", [4]),
+            ("from: User\nwhere:\n  $neq:\n    last-name: Michaels\norder-by: id", [1]),
+            ("from: User\nwhere:\n  $neq:\n    last-name: null\norder-by: id", [1, 2, 3]),
+            ("from: User\nwhere:\n  last-name: null\norder-by: id", [4])
+        ]:
+            query = parse_yaml_query(qs)
+            self.assertEqual(expected, self.query_ids(query, plan_cache=cache), qs)
+            self.assertEqual(expected, self.query_ids(query), qs)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(4, cache.misses)
+        self.assertEqual({}, parse_yaml_query("from: User\nwhere:\n  last-name: null").bind_values())
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction_order(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(1, cache.get("a"))
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIsNone(cache.get("b"))
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            LRUCache(max_size=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import logging
+import unittest
+
+from sqlalchemy import Column, Integer, String, Date, Index
+from sqlalchemy.ext.declarative import declarative_base
+
+from mlalchemy import *
+from tests.fixtures import *
+
+IndexedBase = declarative_base()
+
+
+class Account(IndexedBase):
+    __tablename__ = "accounts"
+    __table_args__ = (Index("ix_accounts_country_city", "country", "city"),)
+
+    id = Column(Integer, primary_key=True)
+    email = Column(String, unique=True)
+    created_at = Column(Date, index=True)
+    country = Column(String)
+    city = Column(String)
+    nickname = Column(String)
+
+
+ACCOUNT_TABLES = {"Account": Account}
+
+
+class TestQueryPolicy(unittest.TestCase):
+
+    def test_max_depth(self):
+        policy = QueryPolicy(max_depth=2)
+        parse_query({"from": "User", "where": {"$or": [{"id": 1}, {"id": 2}]}}, policy=policy)
+        with self.assertRaises(QueryPolicyError):
+            parse_query({"from": "User", "where": {"$or": [{"id": 1}, {"$and": [
+                {"$not": {"firstName": "Michael"}}, {"lastName": "Anderson"}
+            ]}]}}, policy=policy)
+
+    def test_deep_queries_rejected_while_parsing(self):
+        where = {"id": 1}
+        for i in range(3000):
+            where = {"$or": [where, {"id": i}]} if i % 2 == 0 else {"$not": where}
+        policy = QueryPolicy(max_depth=10)
+        for single_pass in [True, False]:
+            with self.assertRaises(QueryPolicyError):
+                parse_query({"from": "User", "where": where}, single_pass=single_pass, policy=policy)
+        with self.assertRaises(QueryPolicyError):
+            parse_query({"from": "User", "groupBy": "lastName", "aggregate": {"users": {"$count": "*"}},
+                         "having": where}, policy=policy)
+        # redundant nesting is collapsed while parsing, and doesn't count towards the parsed query's depth
+        parse_query({"from": "User", "where": {"$and": {"$or": [{"id": 1}, {"id": 2}]}}},
+                    policy=QueryPolicy(max_depth=1))
+
+    def test_clauses_rejected_while_parsing(self):
+        # the query is rejected before the malformed fragment following the offending clause is parsed
+        for policy in [QueryPolicy(max_clauses=2), QueryPolicy(max_in_size=2)]:
+            with self.assertRaises(QueryPolicyError):
+                parse_query({"from": "User", "where": [{"id": 1}, {"children": 2}, {"$in": {"id": [1, 2, 3]}},
+                                                       "not a fragment"]}, policy=policy)
+
+    def test_max_clauses(self):
+        policy = QueryPolicy(max_clauses=2)
+        parse_query({"from": "User", "where": [{"id": 1}, {"children": 2}]}, policy=policy)
+        with self.assertRaises(QueryPolicyError):
+            parse_query({"from": "User", "where": [{"id": 1}, {"children": 2}, {"firstName": "Gary"}]}, policy=policy)
+
+    def test_max_in_size(self):
+        policy = QueryPolicy(max_in_size=3)
+        parse_query({"from": "User", "where": {"$in": {"id": [1, 2, 3]}}}, policy=policy)
+        with self.assertRaises(QueryPolicyError):
+            parse_query({"from": "User", "where": {"$nin": {"id": [1, 2, 3, 4]}}}, policy=policy)
+        # the optimizer's merged $in clauses are checked as well
+        with self.assertRaises(QueryPolicyError):
+            parse_query({"from": "User", "where": {"$or": [{"id": i} for i in range(4)]}}, optimize=True,
+                        policy=policy)
+
+    def test_limits(self):
+        self.assertEqual(50, parse_query({"from": "User"}, policy=QueryPolicy(max_limit=50)).limit)
+        self.assertEqual(50, parse_query({"from": "User", "limit": 500}, policy=QueryPolicy(max_limit=50)).limit)
+        self.assertEqual(5, parse_query({"from": "User", "limit": 5}, policy=QueryPolicy(max_limit=50)).limit)
+        with self.assertRaises(QueryPolicyError):
+            parse_query({"from": "User"}, policy=QueryPolicy(require_limit=True, max_limit=50))
+
+    def test_invalid_limits(self):
+        policy = QueryPolicy(require_limit=True, max_limit=2)
+        self.assertEqual(0, parse_query({"from": "User", "limit": 0}, policy=policy).limit)
+        for qd in [
+            {"from": "User", "limit": -1},
+            {"from": "User", "limit": "5"},
+            {"from": "User", "limit": True},
+            {"from": "User", "limit": 1.5},
+            {"from": "User", "limit": 1, "offset": -1},
+            {"from": "User", "limit": 1, "offset": "2"}
+        ]:
+            with self.assertRaises(QuerySyntaxError):
+                parse_query(qd, policy=policy)
+        # limits set on already constructed queries are checked as well
+        query = parse_query({"from": "User"})
+        query.limit = -1
+        with self.assertRaises(QueryPolicyError):
+            policy.enforce(query)
+
+    def test_allowed_fields(self):
+        policy = QueryPolicy(allowed_fields={"User": ["id", "firstName", "lastName"]})
+        parse_query({"from": "User", "where": {"first-name": "Gary"}, "orderBy": "-id"}, policy=policy)
+        for qd in [
+            {"from": "User", "where": {"children": 2}},
+            {"from": "User", "orderBy": "dateOfBirth"},
+            {"from": "User", "select": ["id", "children"]},
+            {"from": "Account"}
+        ]:
+            with self.assertRaises(QueryPolicyError):
+                parse_query(qd, policy=policy)
+
+    def test_leading_wildcards(self):
+        policy = QueryPolicy(allow_leading_wildcards=False)
+        parse_query({"from": "User", "where": {"$like": {"lastName": "Mich%"}}}, policy=policy)
+        for pattern in ["%chaels", "_ichaels"]:
+            with self.assertRaises(QueryPolicyError):
+                parse_query({"from": "User", "where": {"$like": {"lastName": pattern}}}, policy=policy)
+
+    def test_unindexed_fields(self):
+        reject = QueryPolicy(unindexed=POLICY_REJECT)
+        for qd in [
+            {"from": "Account", "where": {"email": "a@example.com"}},
+            {"from": "Account", "where": {"$gte": {"createdAt": "2017-01-01"}}, "orderBy": "id"},
+            {"from": "Account", "where": [{"country": "ZA"}, {"city": "Cape Town"}]}
+        ]:
+            parse_query(qd, tables=ACCOUNT_TABLES, policy=reject)
+        for qd in [
+            {"from": "Account", "where": {"nickname": "a"}},
+            {"from": "Account", "where": {"city": "Cape Town"}},
+            {"from": "Account", "orderBy": "nickname"}
+        ]:
+            with self.assertRaises(QueryPolicyError):
+                parse_query(qd, tables=ACCOUNT_TABLES, policy=reject)
+            # without the tables, the indices can't be checked
+            parse_query(qd, policy=reject)
+
+        logger = logging.getLogger("mlalchemy.policy")
+        with self.assertLogs(logger, level=logging.WARNING):
+            parse_query({"from": "Account", "where": {"nickname": "a"}}, tables=ACCOUNT_TABLES,
+                        policy=QueryPolicy(unindexed=POLICY_WARN))
+
+    def test_to_sqlalchemy(self):
+        session = create_test_session()
+        try:
+            query = parse_query({"from": "User", "orderBy": "id"})
+            results = query.to_sqlalchemy(session, TABLES, policy=QueryPolicy(max_limit=2)).all()
+            self.assertEqual([1, 2], [user.id for user in results])
+            with self.assertRaises(QueryPolicyError):
+                query.to_sqlalchemy(session, TABLES, policy=QueryPolicy(unindexed=POLICY_REJECT,
+                                                                        require_limit=True))
+        finally:
+            session.close()
+
+    def test_estimate_cost(self):
+        cost = estimate_cost(parse_query({
+            "from": "Account",
+            "where": {"$or": [{"email": "a@example.com"}, {"$like": {"nickname": "%a"}}]},
+            "orderBy": ["country", "nickname"]
+        }), Account)
+        self.assertEqual(2, cost.depth)
+        self.assertEqual(2, cost.clauses)
+        self.assertEqual(["nickname"], cost.leading_wildcards)
+        self.assertEqual(["nickname"], cost.unindexed_filters)
+        self.assertEqual(["nickname"], cost.unindexed_sorts)
+        self.assertFalse(cost.index_assisted)
+
+        cost = estimate_cost(parse_query({
+            "from": "Account",
+            "where": [{"$or": [{"email": "a@example.com"}, {"id": 5}]}, {"nickname": "a"}]
+        }), Account)
+        self.assertTrue(cost.index_assisted)
+        self.assertIsNone(estimate_cost(parse_query({"from": "Account"})).index_assisted)
+
+
+if __name__ == "__main__":
+    unittest.main()
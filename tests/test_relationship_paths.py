@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from sqlalchemy import Column, Integer, String, ForeignKey, create_engine, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, relationship
+
+from mlalchemy import *
+
+RelatedBase = declarative_base()
+
+
+class Publisher(RelatedBase):
+    __tablename__ = "publishers"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Author(RelatedBase):
+    __tablename__ = "authors"
+
+    id = Column(Integer, primary_key=True)
+    first_name = Column(String)
+    last_name = Column(String, index=True)
+    books = relationship("Book", back_populates="author", order_by="Book.id")
+
+
+class Book(RelatedBase):
+    __tablename__ = "books"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String)
+    pages = Column(Integer)
+    author_id = Column(Integer, ForeignKey("authors.id"))
+    publisher_id = Column(Integer, ForeignKey("publishers.id"))
+    author = relationship("Author", back_populates="books")
+    publisher = relationship("Publisher")
+
+
+RELATED_TABLES = {"Author": Author, "Book": Book, "Publisher": Publisher}
+
+
+class TestRelationshipPaths(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        RelatedBase.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+
+        penguin, vintage = Publisher(id=1, name="Penguin"), Publisher(id=2, name="Vintage")
+        self.session.add_all([
+            Author(id=1, first_name="Ursula", last_name="Le Guin", books=[
+                Book(id=1, title="The Dispossessed", pages=387, publisher=penguin),
+                Book(id=2, title="The Lathe of Heaven", pages=184, publisher=vintage)
+            ]),
+            Author(id=2, first_name="Octavia", last_name="Butler", books=[
+                Book(id=3, title="Kindred", pages=264, publisher=penguin)
+            ]),
+            Author(id=3, first_name="Ted", last_name="Chiang", books=[
+                Book(id=4, title="Exhalation", pages=350, publisher=vintage)
+            ]),
+            Author(id=4, first_name="Anonymous", last_name="Anonymous"),
+            Book(id=5, title="Beowulf", pages=100, publisher=penguin)
+        ])
+        self.session.commit()
+        self.session.expunge_all()
+
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._count_statement)
+
+    def tearDown(self):
+        event.remove(self.engine, "before_cursor_execute", self._count_statement)
+        self.session.close()
+
+    def _count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _ids(self, qd):
+        return [entry.id for entry in parse_query(qd, tables=RELATED_TABLES).to_sqlalchemy(
+            self.session, RELATED_TABLES
+        ).all()]
+
+    def test_path_normalization(self):
+        query = parse_query({"from": "Book", "where": {"author.last-name": "Butler"}, "orderBy": "author.firstName"})
+        self.assertEqual({"author.last_name", "author.first_name"}, query.unique_field_names)
+
+    def test_filtering_through_many_to_one(self):
+        self.assertEqual([3], self._ids({"from": "Book", "where": {"author.lastName": "Butler"}}))
+        self.assertEqual([1, 2, 4], sorted(self._ids({
+            "from": "Book", "where": {"$in": {"author.lastName": ["Le Guin", "Chiang"]}}
+        })))
+
+    def test_filtering_through_one_to_many(self):
+        self.assertEqual([1, 3], sorted(self._ids({"from": "Author", "where": {"$gt": {"books.pages": 300}}})))
+        # authors without any books don't match clauses on their books, but do match negated ones
+        self.assertEqual([2, 3, 4], sorted(self._ids({
+            "from": "Author", "where": {"$not": {"books.title": "The Dispossessed"}}
+        })))
+
+    def test_filtering_through_nested_relationships(self):
+        self.assertEqual([1, 2], sorted(self._ids({"from": "Author", "where": {"books.publisher.name": "Penguin"}})))
+        # each clause may be matched by a different book
+        self.assertEqual([1, 2], sorted(self._ids({"from": "Author", "where": [
+            {"books.publisher.name": "Penguin"}, {"$lt": {"books.pages": 300}}
+        ]})))
+
+    def test_ordering_by_related_fields(self):
+        self.assertEqual([3, 4, 1, 2], self._ids({
+            "from": "Book", "orderBy": ["author.lastName", "id"], "where": {"$lt": {"id": 5}}
+        }))
+        self.assertEqual([1, 3, 5, 4, 2], self._ids({"from": "Book", "orderBy": ["publisher.name", "-pages"]}))
+        with self.assertRaises(QuerySyntaxError):
+            self._ids({"from": "Author", "orderBy": "books.title"})
+
+    def test_invalid_paths(self):
+        for qd in [
+            {"from": "Book", "where": {"writer.lastName": "Butler"}},
+            {"from": "Book", "where": {"author.nickname": "Butler"}},
+            {"from": "Book", "orderBy": "title.length"},
+            {"from": "Book", "select": ["author.lastName"]},
+            {"from": "Author", "include": "books.author.title"}
+        ]:
+            with self.assertRaises(InvalidFieldError):
+                parse_query(qd, tables=RELATED_TABLES)
+        with self.assertRaises(QuerySyntaxError):
+            parse_query({"from": "Author", "include": {"books": "lazy"}})
+
+    def test_include_avoids_n_plus_one_queries(self):
+        for include, expected_statements in [
+            (None, 7),
+            ("books", 4),
+            (["books", "books.publisher"], 2),
+            ({"books": "selectin", "books.publisher": "selectin"}, 3)
+        ]:
+            self.session.expunge_all()
+            del self.statements[:]
+            query = parse_query({"from": "Author", "include": include, "orderBy": "id"}, tables=RELATED_TABLES)
+            authors = query.to_sqlalchemy(self.session, RELATED_TABLES).all()
+            self.assertEqual(
+                [["Penguin", "Vintage"], ["Penguin"], ["Vintage"], []],
+                [[book.publisher.name for book in author.books] for author in authors]
+            )
+            self.assertEqual(expected_statements, len(self.statements))
+
+    def test_include_in_batches(self):
+        queries = [
+            parse_query({"from": "Author", "where": {"lastName": "Chiang"}}),
+            parse_query({"from": "Author", "where": {"$lte": {"id": 4}}, "include": "books"})
+        ]
+        lookup, authors = execute_batch(self.session, RELATED_TABLES, queries)
+        self.assertEqual([3], [author.id for author in lookup])
+        self.assertEqual([2, 1, 1, 0], [len(author.books) for author in sorted(authors, key=lambda a: a.id)])
+        # the lookup, and the included query along with its SELECT ... IN query for the books
+        self.assertEqual(3, len(self.statements))
+
+    def test_include_many_to_one_with_joins(self):
+        query = parse_query({"from": "Book", "include": "author", "orderBy": "id"}, tables=RELATED_TABLES)
+        books = query.to_sqlalchemy(self.session, RELATED_TABLES).all()
+        self.assertEqual(1, len(self.statements))
+        self.assertEqual(["Le Guin", "Le Guin", "Butler", "Chiang", None],
+                         [book.author.last_name if book.author is not None else None for book in books])
+        self.assertEqual(1, len(self.statements))
+
+    def test_keyset_pagination_on_related_fields(self):
+        query = parse_query({"from": "Book", "orderBy": ["author.lastName", "id"], "limit": 2,
+                             "where": {"$lt": {"id": 5}}}, tables=RELATED_TABLES)
+        page = query.to_sqlalchemy(self.session, RELATED_TABLES).all()
+        self.assertEqual([3, 4], [book.id for book in page])
+        next_query = parse_query({"from": "Book", "orderBy": ["author.lastName", "id"], "limit": 2,
+                                  "where": {"$lt": {"id": 5}}, "after": query.cursor_for(page[-1])})
+        self.assertEqual([1, 2], [book.id for book in next_query.to_sqlalchemy(self.session, RELATED_TABLES).all()])
+
+    def test_optimizer_leaves_related_clauses_separate(self):
+        query = parse_query({"from": "Author", "where": [
+            {"$gt": {"books.pages": 300}}, {"$lt": {"books.pages": 200}}
+        ]}, optimize=True)
+        self.assertFalse(query.matches_nothing())
+        self.assertEqual([1], self._ids({"from": "Author", "where": [
+            {"$gt": {"books.pages": 300}}, {"$lt": {"books.pages": 200}}
+        ]}))
+
+    def test_plan_cache(self):
+        plan_cache = QueryPlanCache()
+        for name, expected in [("Butler", [3]), ("Chiang", [4])]:
+            query = parse_query({"from": "Book", "where": {"author.lastName": name}, "include": "author"})
+            self.assertEqual(expected, [
+                book.id for book in query.to_sqlalchemy(self.session, RELATED_TABLES, plan_cache=plan_cache).all()
+            ])
+        self.assertEqual(1, len(plan_cache))
+
+    def test_serialization(self):
+        query = parse_query({"from": "Author", "where": {"books.publisher.name": "Penguin"},
+                             "include": {"books": "joined", "books.publisher": "selectin"}})
+        decoded = loads_query(dumps_query(query))
+        self.assertEqual(query, decoded)
+        self.assertEqual(query.include, decoded.include)
+
+    def test_policy(self):
+        policy = QueryPolicy(allowed_fields={"Author": ["lastName", "books.title"]}, unindexed=POLICY_REJECT)
+        parse_query({"from": "Author", "where": {"lastName": "Butler"}}, tables=RELATED_TABLES, policy=policy)
+        for qd in [
+            {"from": "Author", "where": {"books.title": "Kindred"}},
+            {"from": "Author", "where": {"books.pages": 264}},
+            {"from": "Author", "where": {"lastName": "Butler"}, "include": "books"}
+        ]:
+            with self.assertRaises(QueryPolicyError):
+                parse_query(qd, tables=RELATED_TABLES, policy=policy)
+        cost = estimate_cost(parse_query({"from": "Book", "where": {"author.lastName": "Butler"}}), Book)
+        self.assertEqual([], cost.unindexed_filters)
+        self.assertFalse(cost.index_assisted)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from sqlalchemy import event
+
+from mlalchemy import *
+from tests.fixtures import *
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.clock = FakeClock()
+        self.cache = ResultCache(MemoryResultBackend(max_size=4, ttl=60, clock=self.clock))
+        self.cache.attach(self.session)
+        self.executed = []
+        event.listen(self.session.bind, "before_cursor_execute", self.record_statement)
+
+    def tearDown(self):
+        self.cache.detach(self.session)
+        event.remove(self.session.bind, "before_cursor_execute", self.record_statement)
+        self.session.close()
+
+    def record_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.executed.append(statement)
+
+    def execute(self, qd, **kwargs):
+        return self.cache.execute(parse_query(qd), self.session, TABLES, **kwargs)
+
+    def test_identical_queries_hit_cache(self):
+        qd = {"from": "User", "where": {"$in": {"children": [2, 3]}}, "orderBy": "id", "select": ["id", "firstName"]}
+        expected = [{"id": 2, "first_name": "James"}, {"id": 3, "first_name": "Andrew"}, {"id": 4, "first_name": "Gary"}]
+        self.assertEqual(expected, self.execute(qd))
+        # semantically identical query, with the IN values in a different order
+        self.assertEqual(expected, self.execute(dict(qd, where={"$in": {"children": [3, 2]}})))
+        self.assertEqual([(2, "James"), (3, "Andrew"), (4, "Gary")], self.execute(qd, row_format=ROW_FORMAT_TUPLE))
+        self.assertEqual(1, len(self.executed))
+
+        stats = self.cache.stats()
+        self.assertEqual(2, stats["hits"])
+        self.assertEqual(1, stats["misses"])
+        self.assertAlmostEqual(2.0 / 3.0, stats["hit_rate"])
+        self.assertGreater(stats["memory"], 0)
+
+    def test_returned_rows_are_copies(self):
+        qd = {"from": "User", "where": {"id": 1}}
+        self.execute(qd)[0]["first_name"] = "Changed"
+        self.assertEqual("Michael", self.execute(qd)[0]["first_name"])
+
+    def test_ttl_expiry(self):
+        qd = {"from": "User", "where": {"id": 1}}
+        self.execute(qd)
+        self.clock.now = 59.0
+        self.execute(qd)
+        self.assertEqual(1, len(self.executed))
+        self.clock.now = 60.0
+        self.execute(qd)
+        self.assertEqual(2, len(self.executed))
+        self.assertEqual(1, self.cache.stats()["expirations"])
+
+    def test_lru_eviction(self):
+        for i in range(1, 6):
+            self.execute({"from": "User", "where": {"id": i}})
+        stats = self.cache.stats()
+        self.assertEqual(4, stats["size"])
+        self.assertEqual(1, stats["evictions"])
+        # the least recently used result was evicted
+        self.execute({"from": "User", "where": {"id": 1}})
+        self.assertEqual(6, len(self.executed))
+
+    def test_memory_budget(self):
+        backend = MemoryResultBackend(max_size=100, max_memory=10 ** 6)
+        cache = ResultCache(backend)
+        cache.execute(parse_query({"from": "User", "where": {"id": 1}}), self.session, TABLES)
+        # leave room for two single-row results
+        backend.max_memory = int(backend.memory * 2.5)
+        for i in range(2, 5):
+            cache.execute(parse_query({"from": "User", "where": {"id": i}}), self.session, TABLES)
+            self.assertLessEqual(backend.memory, backend.max_memory)
+        self.assertEqual(2, len(backend))
+        self.assertGreater(backend.stats()["evictions"], 0)
+        # results that exceed the budget by themselves aren't cached at all
+        cache.execute(parse_query({"from": "User"}), self.session, TABLES)
+        cache.execute(parse_query({"from": "User"}), self.session, TABLES)
+        self.assertEqual(0, backend.stats()["hits"])
+
+    def test_commit_invalidates_table(self):
+        qd = {"from": "User", "where": {"lastName": "Michaels"}, "orderBy": "id", "select": ["firstName"]}
+        self.assertEqual([{"first_name": "James"}, {"first_name": "Andrew"}], self.execute(qd))
+
+        user = self.session.query(User).filter(User.id == 4).one()
+        user.last_name = "Michaels"
+        self.session.flush()
+        self.assertEqual(
+            [{"first_name": "James"}, {"first_name": "Andrew"}, {"first_name": "Gary"}],
+            self.execute(qd)
+        )
+        self.session.commit()
+        self.assertEqual(0, self.cache.stats()["size"])
+        self.assertEqual(3, len(self.execute(qd)))
+
+    def test_uncommitted_results_not_cached(self):
+        qd = {"from": "User", "where": {"lastName": "Michaels"}, "select": ["firstName"]}
+        self.session.add(User(first_name="John", last_name="Michaels", children=0))
+        self.session.flush()
+        del self.executed[:]
+        # results reading the session's uncommitted changes mustn't be served to other sessions
+        self.assertEqual(3, len(self.execute(qd)))
+        self.assertEqual(3, len(self.execute(qd)))
+        self.assertEqual(0, self.cache.stats()["size"])
+        self.assertEqual(2, len(self.executed))
+
+        self.session.commit()
+        self.assertEqual(3, len(self.execute(qd)))
+        self.assertEqual(3, len(self.execute(qd)))
+        self.assertEqual(1, self.cache.stats()["size"])
+
+    def test_rollback_invalidates_table(self):
+        qd = {"from": "User", "where": {"lastName": "Michaels"}}
+        self.session.add(User(first_name="John", last_name="Michaels", children=0))
+        self.assertEqual(3, len(self.execute(qd)))
+        self.session.rollback()
+        self.assertEqual(2, len(self.execute(qd)))
+
+    def test_bulk_update_invalidates_table(self):
+        qd = {"from": "User", "where": {"$gt": {"children": 2}}}
+        self.assertEqual(1, len(self.execute(qd)))
+        self.session.query(User).filter(User.id == 1).update({"children": 5}, synchronize_session=False)
+        self.assertEqual(2, len(self.execute(qd)))
+
+    def test_explicit_invalidation(self):
+        qd = {"from": "User", "where": {"id": 1}}
+        self.execute(qd)
+        self.cache.invalidate([User])
+        self.execute(qd)
+        self.cache.invalidate(["users"])
+        self.execute(qd)
+        self.assertEqual(3, len(self.executed))
+        self.assertEqual(2, self.cache.stats()["invalidations"])
+
+    def test_invalidation_while_executing(self):
+        qd = {"from": "User", "where": {"id": 1}}
+
+        def invalidate(conn, cursor, statement, parameters, context, executemany):
+            # as if another session committed changes to the table while the query was being executed
+            self.cache.invalidate(["users"])
+
+        event.listen(self.session.bind, "before_cursor_execute", invalidate)
+        try:
+            self.execute(qd)
+        finally:
+            event.remove(self.session.bind, "before_cursor_execute", invalidate)
+        self.assertEqual(0, self.cache.stats()["size"])
+        self.execute(qd)
+        self.execute(qd)
+        self.assertEqual(2, len(self.executed))
+
+    def test_entities_cannot_be_cached(self):
+        with self.assertRaises(ValueError):
+            self.execute({"from": "User"}, row_format=ROW_FORMAT_ENTITY)
+
+
+if __name__ == "__main__":
+    unittest.main()
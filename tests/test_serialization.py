@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from datetime import date, datetime
+
+from mlalchemy import *
+from mlalchemy.testing import MLAlchemyTestCase
+
+QUERIES = [
+    {"from": "User"},
+    {
+        "from": "User",
+        "where": [
+            {"$or": [{"firstName": "Michaël"}, {"$in": {"children": [0, 1, 200, -5, 2 ** 40]}}]},
+            {"$not": {"$like": {"lastName": "Mich%"}}},
+            {"$gt": {"dateOfBirth": date(1988, 1, 1)}},
+            {"$lt": {"updatedAt": datetime(2017, 5, 4, 3, 2, 1, 123456)}},
+            {"$is": {"deletedAt": None}},
+            {"$neq": {"score": 2.5}},
+            {"active": True},
+            {"metadata": {"nested": [False, None]}}
+        ],
+        "orderBy": ["-dateOfBirth", "lastName"],
+        "select": ["id", "firstName", "lastName"],
+        "offset": 100,
+        "limit": 25
+    },
+    {"from": "User", "orderBy": "id", "after": encode_cursor([10]), "limit": 5}
+]
+
+
+class TestSerialization(MLAlchemyTestCase):
+
+    def test_round_trip(self):
+        for qd in QUERIES:
+            query = parse_query(qd)
+            data = dumps_query(query)
+            self.assertIsInstance(data, bytes)
+            decoded = loads_query(data)
+            self.assertQueryEquals(query, decoded)
+            self.assertEqual(query.select, decoded.select)
+            self.assertEqual(query.after, decoded.after)
+            self.assertEqual(query.unique_field_names, decoded.unique_field_names)
+            self.assertEqual(repr(query), repr(decoded))
+            # decoding from other buffer types
+            self.assertQueryEquals(query, loads_query(bytearray(data)))
+
+    def test_big_integers(self):
+        query = MLQuery("User", query_fragment=MLQueryFragment(OP_AND, clauses=[
+            MLClause("field", COMP_IN, [2 ** 70, -(2 ** 63), 2 ** 63 - 1])
+        ]))
+        self.assertQueryEquals(query, loads_query(dumps_query(query)))
+
+    def test_smaller_than_json(self):
+        query = parse_query(QUERIES[1])
+        self.assertLess(len(dumps_query(query)), len(repr(query).encode("utf-8")))
+
+    def test_malformed_data(self):
+        data = dumps_query(parse_query(QUERIES[1]))
+        with self.assertRaises(SerializationError):
+            loads_query(b"not a query")
+        with self.assertRaises(SerializationError):
+            loads_query(data[:len(data) // 2])
+
+    def test_unserializable_value(self):
+        with self.assertRaises(TypeError):
+            dumps_query(MLQuery("User", query_fragment=MLQueryFragment(OP_AND, clauses=[
+                MLClause("field", COMP_EQ, object())
+            ])))
+
+
+if __name__ == "__main__":
+    unittest.main()
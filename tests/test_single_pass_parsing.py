@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+from mlalchemy import *
+from mlalchemy.testing import MLAlchemyTestCase
+
+FIELDS = ["field1", "fieldTwo", "field-three", "field_four"]
+COMPARATOR_LIST = sorted(COMPARATORS)
+OPERATOR_LIST = sorted(OPERATORS)
+
+
+def random_where(rng, depth):
+    """Generates a random "where" clause for a query, nested up to the given depth."""
+    entries = []
+    for _ in range(rng.randint(1, 3)):
+        kind = rng.random()
+        if depth > 0 and kind < 0.3:
+            entry = {rng.choice(OPERATOR_LIST): random_where(rng, depth - 1)}
+        elif depth > 0 and kind < 0.5:
+            entry = {rng.choice(COMPARATOR_LIST): random_where(rng, depth - 1)}
+        else:
+            entry = {rng.choice(FIELDS): rng.randint(0, 10)}
+        entries.append(entry)
+    return entries[0] if len(entries) == 1 and rng.random() < 0.5 else entries
+
+
+def parse_or_error(qd, single_pass):
+    try:
+        return parse_query(qd, single_pass=single_pass)
+    except MLAlchemyError as e:
+        return type(e)
+
+
+class TestSinglePassParsing(MLAlchemyTestCase):
+
+    def test_equivalence_with_two_pass_parsing(self):
+        rng = random.Random(1234)
+        for i in range(2000):
+            qd = {"from": "SomeTable", "where": random_where(rng, rng.randint(0, 5))}
+            expected = parse_or_error(qd, single_pass=False)
+            actual = parse_or_error(qd, single_pass=True)
+            if isinstance(expected, MLQuery):
+                self.assertQueryEquals(expected, actual)
+            else:
+                self.assertEqual(expected, actual, "Mismatch for query: %s" % qd)
+
+    def test_deeply_nested_query(self):
+        where = {"field1": 1}
+        for i in range(500):
+            where = {"$or": [where, {"field%d" % i: i}]}
+        query = parse_query({"from": "SomeTable", "where": where})
+        self.assertEqual(500, len(query.unique_field_names))
+        self.assertQueryEquals(parse_query({"from": "SomeTable", "where": where}, single_pass=False), query)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from sqlalchemy import event
+
+from mlalchemy import *
+from tests.fixtures import *
+
+FIRST_NAMES = ["Michael", "James", "Andrew", "Gary", "Nobody"]
+
+
+def same_shape_workload():
+    """Builds a list of query dictionaries sharing the same structure, but with different values, $in lists of
+    different lengths, and their clauses and sub-fragments in different orders."""
+    workload = []
+    for i in range(1, len(FIRST_NAMES) + 1):
+        alternatives = [{"lastName": "Michaels"}, {"$like": {"lastName": "%s%%" % FIRST_NAMES[i - 1][0]}}]
+        clauses = [
+            ("$in", {"firstName": FIRST_NAMES[:i]}),
+            ("$gte", {"children": i % 4}),
+            ("$or", alternatives if i % 2 == 0 else alternatives[::-1])
+        ]
+        workload.append({
+            "from": "User",
+            "where": dict(clauses if i % 2 == 0 else clauses[::-1]),
+            "orderBy": "id"
+        })
+    return workload
+
+
+class TestStatementCaching(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.engine = self.session.get_bind()
+        self.compiled_strings = set()
+        self.executed_strings = set()
+        event.listen(self.engine, "before_cursor_execute", self.record_statement)
+
+    def tearDown(self):
+        event.remove(self.engine, "before_cursor_execute", self.record_statement)
+        self.session.close()
+
+    def record_statement(self, conn, cursor, statement, parameters, context, executemany):
+        # the compiled string is what SQLAlchemy caches, before $in lists are expanded into the executed statement
+        self.compiled_strings.add(context.compiled.string)
+        self.executed_strings.add(statement)
+
+    def execute_workload(self, workload, plan_cache=None):
+        self.compiled_strings.clear()
+        self.executed_strings.clear()
+        return [
+            [user.id for user in parse_query(qd).to_sqlalchemy(self.session, TABLES, plan_cache=plan_cache).all()]
+            for qd in workload
+        ]
+
+    def test_same_shape_queries_share_compiled_sql(self):
+        workload = same_shape_workload()
+        expected = self.execute_workload(workload)
+        self.assertEqual([[], [2], [3], [2, 3], [2, 3]], expected)
+        self.assertEqual(1, len(self.compiled_strings))
+
+        plan_cache = QueryPlanCache()
+        self.assertEqual(expected, self.execute_workload(workload, plan_cache=plan_cache))
+        self.assertEqual(1, len(self.compiled_strings))
+        self.assertEqual(1, plan_cache.misses)
+
+    def test_same_shape_queries_share_executed_sql(self):
+        # without $in lists, the executed statements are identical as well
+        workload = [
+            {"from": "User", "where": {"$gt": {"children": i}, "lastName": name}, "limit": i + 1}
+            for i, name in enumerate(["Michaels", "Anderson", "Michaels"])
+        ]
+        workload.append({"from": "User", "where": {"lastName": "Nobody", "$gt": {"children": 0}}, "limit": 5})
+        self.assertEqual([[2], [], [3], []], self.execute_workload(workload))
+        self.assertEqual(1, len(self.executed_strings))
+
+    def test_values_are_bound(self):
+        query = parse_query({"from": "User", "where": {"firstName": "Michael", "$in": {"children": [2, 3]}}})
+        sql = str(query.to_select(TABLES))
+        self.assertNotIn("Michael", sql)
+        self.assertIn("IN (__[POSTCOMPILE_mlq_0])", sql)
+        self.assertIn("= :mlq_1", sql)
+        self.assertEqual({"mlq_0": [2, 3], "mlq_1": "Michael"}, query.bind_values())
+
+    def test_null_comparisons(self):
+        cache = QueryPlanCache()
+        for plan_cache in [None, cache, cache]:
+            self.assertEqual([[4], [1, 2, 3]], self.execute_workload([
+                {"from": "User", "where": {"lastName": None}, "orderBy": "id"},
+                {"from": "User", "where": {"$neq": {"lastName": None}}, "orderBy": "id"}
+            ], plan_cache=plan_cache))
+        self.assertNotEqual(
+            parse_query({"from": "User", "where": {"lastName": None}}).structure_key(),
+            parse_query({"from": "User", "where": {"lastName": "Michaels"}}).structure_key()
+        )
+
+    def test_empty_in_lists(self):
+        for plan_cache in [None, QueryPlanCache()]:
+            self.assertEqual([[], [1, 2, 3, 4]], self.execute_workload([
+                {"from": "User", "where": {"$in": {"children": []}}, "orderBy": "id"},
+                {"from": "User", "where": {"$nin": {"children": []}}, "orderBy": "id"}
+            ], plan_cache=plan_cache))
+
+
+if __name__ == "__main__":
+    unittest.main()
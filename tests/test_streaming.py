@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from datetime import date
+
+from mlalchemy import *
+from tests.fixtures import *
+
+YAML_ORDERED_QUERY = """from: User
+where:
+  $gte:
+    children: 2
+order-by: -date-of-birth
+"""
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.session = create_test_session()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_stream_entities(self):
+        results = list(stream_query(parse_yaml_query(YAML_ORDERED_QUERY), self.session, TABLES, chunk_size=1))
+        self.assertEqual([3, 4, 2], [user.id for user in results])
+
+    def test_stream_tuples(self):
+        results = list(stream_query(
+            parse_yaml_query(YAML_ORDERED_QUERY),
+            self.session,
+            TABLES,
+            row_format=ROW_FORMAT_TUPLE,
+            fields=["id", "firstName"]
+        ))
+        self.assertEqual([(3, "Andrew"), (4, "Gary"), (2, "James")], results)
+
+    def test_stream_dicts(self):
+        results = list(stream_query(
+            parse_yaml_query("from: User\nwhere:\n  id: 1"),
+            self.session,
+            TABLES,
+            row_format=ROW_FORMAT_DICT
+        ))
+        self.assertEqual([{
+            "id": 1,
+            "first_name": "Michael",
+            "last_name": "Anderson",
+            "date_of_birth": date(1980, 1, 1),
+            "children": 0
+        }], results)
+
+    def test_stream_chunks(self):
+        chunks = list(stream_query(
+            parse_yaml_query(YAML_ORDERED_QUERY),
+            self.session,
+            TABLES,
+            chunk_size=2,
+            row_format=ROW_FORMAT_TUPLE,
+            fields=["id"],
+            chunks=True
+        ))
+        self.assertEqual([[(3,), (4,)], [(2,)]], chunks)
+
+    def test_invalid_arguments(self):
+        query = parse_yaml_query(YAML_ORDERED_QUERY)
+        with self.assertRaises(ValueError):
+            stream_query(query, self.session, TABLES, chunk_size=0)
+        with self.assertRaises(ValueError):
+            stream_query(query, self.session, TABLES, row_format="xml")
+        with self.assertRaises(InvalidFieldError):
+            stream_query(query, self.session, TABLES, row_format=ROW_FORMAT_TUPLE, fields=["password"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from mlalchemy import *
+
+
+class TestStructuralHashing(unittest.TestCase):
+
+    def test_clause_order_is_ignored(self):
+        a = parse_query({
+            "from": "User",
+            "where": {"$or": [{"firstName": "Michael"}, {"lastName": "Anderson"}, {"$gt": {"children": 1}}]}
+        })
+        b = parse_query({
+            "from": "User",
+            "where": {"$or": [{"$gt": {"children": 1}}, {"lastName": "Anderson"}, {"firstName": "Michael"}]}
+        })
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual(a.query_fragment, b.query_fragment)
+
+    def test_in_value_order_is_ignored(self):
+        a = parse_query({"from": "User", "where": {"$in": {"children": [1, 2, 3]}}})
+        b = parse_query({"from": "User", "where": {"$in": {"children": [3, 1, 2]}}})
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+
+    def test_differing_queries(self):
+        base = {"from": "User", "where": {"$not": {"firstName": "Michael"}}, "orderBy": "id", "limit": 5}
+        a = parse_query(base)
+        self.assertNotEqual(a, parse_query(dict(base, **{"from": "Customer"})))
+        self.assertNotEqual(a, parse_query(dict(base, where={"$not": {"firstName": "James"}})))
+        self.assertNotEqual(a, parse_query(dict(base, orderBy="-id")))
+        self.assertNotEqual(a, parse_query(dict(base, limit=10)))
+        # list order is significant outside of IN/NOT IN clauses
+        self.assertNotEqual(
+            parse_query({"from": "User", "where": {"tags": [1, 2]}}),
+            parse_query({"from": "User", "where": {"tags": [2, 1]}})
+        )
+
+    def test_booleans_are_not_integers(self):
+        self.assertNotEqual(MLClause("active", COMP_EQ, True), MLClause("active", COMP_EQ, 1))
+        self.assertNotEqual(MLClause("active", COMP_EQ, False), MLClause("active", COMP_EQ, 0))
+
+    def test_queries_as_dictionary_keys(self):
+        results = {parse_query({"from": "User", "where": [{"firstName": "Michael"}, {"children": 0}]}): "first"}
+        key = parse_query({"from": "User", "where": [{"children": 0}, {"firstName": "Michael"}]})
+        self.assertEqual("first", results[key])
+        self.assertEqual(1, len(set([key, parse_query({"from": "User", "where": [{"children": 0},
+                                                                                   {"firstName": "Michael"}]})])))
+
+    def test_deserialized_queries_compare_equal(self):
+        query = parse_query({"from": "User", "where": {"$in": {"children": [2, 3]}}, "orderBy": "id"})
+        self.assertEqual(query, loads_query(dumps_query(query)))
+        self.assertEqual(hash(query), hash(loads_query(dumps_query(query))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+
+from mlalchemy import *
+from mlalchemy.testing import MLAlchemyTestCase
+
+
+class TestMLAlchemyStructures(MLAlchemyTestCase):
+
+    def test_compact_nodes(self):
+        query = parse_query({
+            "from": "SomeTable",
+            "where": {"$or": [{"field1": 1}, {"field2": 2}]}
+        })
+        for node in [query, query.query_fragment, query.query_fragment.clauses[0]]:
+            self.assertFalse(hasattr(node, "__dict__"))
+
+    def test_unique_field_names(self):
+        query = parse_query({
+            "from": "SomeTable",
+            "where": [
+                {"$or": [{"fieldOne": 1}, {"field-two": 2}]},
+                {"$not": {"field3": 3}}
+            ],
+            "orderBy": ["-field4", "fieldOne"]
+        })
+        self.assertEqual(frozenset(["field_one", "field_two", "field3"]), query.query_fragment.unique_field_names)
+        self.assertEqual(frozenset(["field_one", "field_two", "field3", "field4"]), query.unique_field_names)
+        self.assertIsInstance(query.unique_field_names, frozenset)
+
+    def test_unique_field_names_shared_with_wrapped_fragment(self):
+        inner = MLQueryFragment(OP_OR, clauses=[MLClause("a", COMP_EQ, 1), MLClause("b", COMP_EQ, 2)])
+        outer = MLQueryFragment(OP_AND, sub_fragments=[inner])
+        self.assertIs(inner.unique_field_names, outer.unique_field_names)
+
+    def test_simplify_reuses_simplified_nodes(self):
+        fragment = MLQueryFragment(
+            OP_AND,
+            clauses=[MLClause("a", COMP_EQ, 1)],
+            sub_fragments=[MLQueryFragment(OP_OR, clauses=[MLClause("b", COMP_EQ, 2), MLClause("c", COMP_EQ, 3)])]
+        )
+        self.assertIs(fragment, fragment.simplify())
+
+        nested = MLQueryFragment(
+            OP_AND,
+            clauses=[MLClause("a", COMP_EQ, 1)],
+            sub_fragments=[MLQueryFragment(OP_AND, clauses=[MLClause("b", COMP_EQ, 2)])]
+        )
+        self.assertQueryFragmentEquals(
+            MLQueryFragment(OP_AND, clauses=[MLClause("a", COMP_EQ, 1), MLClause("b", COMP_EQ, 2)]),
+            nested.simplify()
+        )
+        # the original fragment must be left untouched
+        self.assertEqual(1, len(nested.clauses))
+
+    def test_simplify_leaves_fragment_unchanged(self):
+        # the first sub-fragment is rewritten before the second one is collapsed into a clause
+        rewritten = MLQueryFragment(OP_OR, sub_fragments=[
+            MLQueryFragment(OP_OR, clauses=[MLClause("c", COMP_EQ, 3), MLClause("d", COMP_EQ, 4)])
+        ])
+        fragment = MLQueryFragment(
+            OP_AND,
+            clauses=[MLClause("a", COMP_EQ, 1)],
+            sub_fragments=[rewritten, MLQueryFragment(OP_AND, clauses=[MLClause("b", COMP_EQ, 2)])]
+        )
+        key = fragment.canonical_key()
+        simplified = fragment.simplify()
+        self.assertEqual(["a", "b"], [clause.field for clause in simplified.clauses])
+        self.assertEqual(["a"], [clause.field for clause in fragment.clauses])
+        self.assertEqual(key, fragment.canonical_key())
+        self.assertEqual(["a", "b"], [clause.field for clause in fragment.simplify().clauses])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,9 +5,13 @@ from __future__ import unicode_literals
 import unittest
 import yaml
 
+from datetime import date
+
 from mlalchemy import *
 from mlalchemy.testing import MLAlchemyTestCase
 
+RESTRICTED_LOADERS = [loader for loader in [RestrictedSafeLoader, RestrictedCSafeLoader] if loader is not None]
+
 
 class TestYamlSecurity(MLAlchemyTestCase):
 
@@ -15,7 +19,40 @@ class TestYamlSecurity(MLAlchemyTestCase):
         with self.assertRaises(yaml.constructor.ConstructorError):
             parse_yaml_query('!!python/object/apply:os.system ["echo Hello"]')
 
+    def test_yaml_security_all_loaders(self):
+        for loader in available_yaml_loaders():
+            for content in [
+                '!!python/object/apply:os.system ["echo Hello"]',
+                'from: !!python/name:os.system User',
+                'from: User\nwhere:\n  field: !!python/object:object {}'
+            ]:
+                with self.assertRaises(yaml.constructor.ConstructorError, msg=loader.__name__):
+                    parse_yaml_query(content, loader=loader)
+
+    def test_restricted_loaders_reject_unused_types(self):
+        for loader in RESTRICTED_LOADERS:
+            for content in [
+                'from: User\nwhere:\n  field: !!binary aGVsbG8=',
+                'from: User\nwhere:\n  $in:\n    field: !!set {a, b}',
+                'from: User\nwhere: !!omap [field: 1]'
+            ]:
+                with self.assertRaises(yaml.constructor.ConstructorError, msg=loader.__name__):
+                    parse_yaml_query(content, loader=loader)
+
+    def test_loaders_agree(self):
+        content = ("from: User\n"
+                   "where:\n"
+                   "  - $gt:\n"
+                   "      date-of-birth: 1988-01-01\n"
+                   "  - $in:\n"
+                   "      children: [1, 2.5, null, true]\n"
+                   "order-by: -last-name\n"
+                   "limit: 10\n")
+        expected = parse_yaml_query(content, loader=yaml.SafeLoader)
+        self.assertEqual(date(1988, 1, 1), expected.query_fragment.clauses[0].value)
+        for loader in available_yaml_loaders():
+            self.assertQueryEquals(expected, parse_yaml_query(content, loader=loader))
+
 
 if __name__ == "__main__":
     unittest.main()
-